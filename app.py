@@ -1,6 +1,12 @@
+import os
+
 from app import create_app
+from app.warmup import start_warmup
 
 if __name__ == "__main__":
     app = create_app()
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        # The reloader's serving process, not its file watcher
+        start_warmup(app)
     app.run(debug=True)  # Turn on debugging mode for development
     print("Flask app is running on http://127.0.0.1:5000")
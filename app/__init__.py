@@ -1,12 +1,134 @@
+import logging
+import os
+
 from flask import Flask
 __version__ = '1.0.0-beta'
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__, template_folder='templates')
 
+    # Defaults, then PDFQUERYAI_* environment variables, then explicit overrides
+    from .config import Config
+    app.config.from_object(Config)
+    app.config.from_prefixed_env("PDFQUERYAI")
+    if config:
+        app.config.update(config)
+
     # Register blueprints
-    from .routes import bp
+    from .routes import bp, catalog_path, embedding_cache_dir, folder_path, ingest_dir_command, jobs_dir, lexical_index_path, pdf_dir, usage_path, vector_dir
     app.register_blueprint(bp)
+    app.cli.add_command(ingest_dir_command)
+    # After the routes module has configured the log file
+    logging.getLogger().setLevel(app.config["LOG_LEVEL"])
+
+    # Shared services, created once per process
+    from .embeddings import CachedEmbeddings, create_embedding
+    embedding = create_embedding(app.config)
+    if app.config["EMBEDDING_CACHE_SIZE"] or app.config["EMBEDDING_CACHE_DISK_SIZE"]:
+        embedding = CachedEmbeddings(
+            embedding,
+            max_entries=app.config["EMBEDDING_CACHE_SIZE"],
+            disk_directory=embedding_cache_dir if app.config["EMBEDDING_CACHE_DISK_SIZE"] else None,
+            disk_entries=app.config["EMBEDDING_CACHE_DISK_SIZE"],
+        )
+    app.extensions["embedding"] = embedding
+
+    from .llm import create_llm
+    from .llm_gateway import GatewayLLM, LLMGateway
+    gateway = app.extensions["llm_gateway"] = LLMGateway(
+        concurrency=app.config["LLM_CONCURRENCY"],
+        max_queue=app.config["LLM_MAX_QUEUE"],
+        timeout=app.config["LLM_QUEUE_TIMEOUT"],
+        coalesce=app.config["LLM_COALESCE"],
+    )
+    app.extensions["llm"] = GatewayLLM(llm=create_llm(app.config), gateway=gateway)
+
+    from .lexical_index import LexicalIndex, rebuild_lexical_index_command
+    app.extensions["lexical_index"] = LexicalIndex(lexical_index_path)
+    app.cli.add_command(rebuild_lexical_index_command)
+
+    from .vector_store import VectorStoreService, migrate_vector_store_command
+    if app.config["VECTOR_STORE"] == "numpy":
+        app.extensions["vector_store"] = VectorStoreService(
+            vector_dir, embedding, app.extensions["lexical_index"], backend="numpy",
+            dtype=app.config["VECTOR_STORE_DTYPE"], rescore=app.config["VECTOR_STORE_RESCORE"],
+        )
+    else:
+        app.extensions["vector_store"] = VectorStoreService(folder_path, embedding, app.extensions["lexical_index"])
+    app.cli.add_command(migrate_vector_store_command)
+
+    from .reranking import create_reranker
+    reranker = create_reranker(app.config, embedding)
+
+    from .chains import ChainRegistry, QueryRewriter
+    rewrite_llm = app.extensions["llm"]
+    if app.config["REWRITE_LLM_MODEL"]:
+        # Same Ollama server, so the same gateway
+        rewrite_llm = GatewayLLM(llm=create_llm(app.config, app.config["REWRITE_LLM_MODEL"]), gateway=gateway)
+    app.extensions["chains"] = ChainRegistry(
+        app.extensions["llm"],
+        app.extensions["vector_store"],
+        QueryRewriter(rewrite_llm, max_entries=app.config["REWRITE_CACHE_SIZE"]),
+        k=app.config["RETRIEVAL_K"],
+        score_threshold=app.config["RETRIEVAL_SCORE_THRESHOLD"],
+        context_max_tokens=app.config["CONTEXT_MAX_TOKENS"],
+        retrieval_mode=app.config["RETRIEVAL_MODE"],
+        reranker=reranker,
+    )
+
+    from .catalog import Catalog, embedding_model_name, rebuild_hash_index_command, rebuild_stats_command
+    catalog = app.extensions["catalog"] = Catalog(catalog_path)
+    if catalog.is_empty() and any(name.endswith('.pdf') for name in os.listdir(pdf_dir)):
+        # Library from before the hash index existed
+        catalog.rebuild(pdf_dir)
+    if catalog.is_empty("sources") and not catalog.is_empty("files"):
+        # Library from before per-source statistics existed
+        catalog.rebuild_sources(app.extensions["vector_store"], embedding_model_name(embedding))
+    if app.extensions["lexical_index"].is_empty() and not catalog.is_empty("sources"):
+        # Library from before the lexical index existed
+        app.extensions["lexical_index"].rebuild(app.extensions["vector_store"])
+    app.cli.add_command(rebuild_hash_index_command)
+    app.cli.add_command(rebuild_stats_command)
+
+    from .pdf_parsing import PageParser
+    app.extensions["pdf_parser"] = PageParser(workers=app.config["PDF_PARSE_WORKERS"])
+
+    from functools import partial
+    from .ingestion import IngestionQueue, ingest_pdf
+    app.extensions["ingestion"] = IngestionQueue(
+        jobs_dir,
+        partial(ingest_pdf, vector_store=app.extensions["vector_store"], catalog=app.extensions["catalog"],
+                pdf_parser=app.extensions["pdf_parser"], batch_size=app.config["INGEST_BATCH_SIZE"],
+                max_rss_mb=app.config["INGEST_MAX_RSS_MB"]),
+        workers=app.config["INGEST_WORKERS"],
+        max_pending=app.config["INGEST_MAX_PENDING"],
+        retention=app.config["INGEST_JOB_RETENTION"],
+    )
+
+    from .answer_cache import AnswerCache
+    app.extensions["answer_cache"] = AnswerCache(
+        app.extensions["vector_store"],
+        max_entries=app.config["ANSWER_CACHE_SIZE"],
+        ttl=app.config["ANSWER_CACHE_TTL"],
+        semantic=app.config["ANSWER_CACHE_SEMANTIC"],
+        max_distance=app.config["ANSWER_CACHE_MAX_DISTANCE"],
+        embed_query=embedding.embed_query,
+    )
+
+    from .usage import UsageAnalytics
+    app.extensions["usage"] = UsageAnalytics(usage_path, flush_interval=app.config["USAGE_FLUSH_INTERVAL"])
+
+    from .chat_history import ChatHistoryStore, create_summarizer
+    app.extensions["chat_history"] = ChatHistoryStore(
+        max_sessions=app.config["CHAT_HISTORY_MAX_SESSIONS"],
+        max_tokens=app.config["CHAT_HISTORY_MAX_TOKENS"],
+        ttl=app.config["CHAT_HISTORY_TTL"],
+        summarize=create_summarizer(app.extensions["llm"]) if app.config["CHAT_HISTORY_SUMMARIZE"] else None,
+    )
+
+    from .warmup import Warmup, warmup_command
+    app.extensions["warmup"] = Warmup(embedding, app.extensions["vector_store"], app.extensions["llm"], reranker)
+    app.cli.add_command(warmup_command)
 
     # Additional configuration if needed
 
@@ -0,0 +1,169 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from flask import current_app
+
+
+def normalize_query(query):
+    """Lower-case, collapse whitespace and drop trailing punctuation."""
+    return " ".join(query.lower().split()).rstrip("?!. ")
+
+
+class CacheLookup:
+    """Outcome of an AnswerCache lookup."""
+
+    def __init__(self, key):
+        self.key = key
+        self.result = None
+        self.embedding = None
+
+
+class AnswerCache:
+    """
+    LRU/TTL cache of /ask_pdf results keyed by (normalized query, prompt type,
+    retrieval mode, corpus version).
+
+    With `semantic` enabled a miss on the exact key falls back to comparing the
+    query embedding against cached entries of the same prompt type and
+    retrieval mode, and reuses the closest one if it is within `max_distance`
+    (cosine distance).
+
+    Entries are tied to the corpus version of the vector store service: as soon
+    as the corpus changes, the whole cache is dropped.
+    """
+
+    def __init__(self, vector_store, max_entries=256, ttl=3600, semantic=False, max_distance=0.05, embed_query=None):
+        self.vector_store = vector_store
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic = semantic and embed_query is not None
+        self.max_distance = max_distance
+        self.embed_query = embed_query
+        self._entries = OrderedDict()  # key -> (result, embedding, created_at)
+        self._corpus_version = vector_store.corpus_version
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _check_corpus_version(self):
+        # Caller holds the lock
+        if self._corpus_version != self.vector_store.corpus_version:
+            if self._entries:
+                logging.info(f"Corpus changed, dropping {len(self._entries)} cached answers")
+                self.invalidations += 1
+            self._entries.clear()
+            self._corpus_version = self.vector_store.corpus_version
+
+    def _expired(self, entry, now):
+        return self.ttl and now - entry[2] > self.ttl
+
+    def lookup(self, query, prompt_type, mode=None, embedding=None):
+        """
+        Look the query up. The returned CacheLookup carries the cached result
+        (None on a miss) and is handed back to `store` once the answer has
+        been generated. For a semantic lookup, `embedding` is the embedding
+        of normalize_query(query) when the caller already has it.
+        """
+        lookup = CacheLookup((normalize_query(query), prompt_type, mode, self.vector_store.corpus_version))
+        if not self.enabled:
+            return lookup
+
+        now = time.monotonic()
+        with self._lock:
+            self._check_corpus_version()
+            entry = self._entries.get(lookup.key)
+            if entry is not None and self._expired(entry, now):
+                del self._entries[lookup.key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(lookup.key)
+                self.hits += 1
+                lookup.result = entry[0]
+                return lookup
+
+        if self.semantic:
+            lookup.embedding = self._normalized(self.embed_query(lookup.key[0]) if embedding is None else embedding)
+            lookup.result = self._semantic_get(lookup, now)
+            if lookup.result is not None:
+                return lookup
+
+        with self._lock:
+            self.misses += 1
+        return lookup
+
+    def _semantic_get(self, lookup, now):
+        with self._lock:
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if key[1:] == lookup.key[1:] and entry[1] is not None and not self._expired(entry, now)
+            ]
+            if not candidates:
+                return None
+
+            matrix = np.stack([entry[1] for _, entry in candidates])
+            distances = 1.0 - matrix @ lookup.embedding
+            best = int(np.argmin(distances))
+            if distances[best] > self.max_distance:
+                return None
+
+            best_key, best_entry = candidates[best]
+            self._entries.move_to_end(best_key)
+            self.semantic_hits += 1
+            return best_entry[0]
+
+    @staticmethod
+    def _normalized(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def store(self, lookup, result):
+        """Cache the result generated after a missed `lookup`."""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._check_corpus_version()
+            if lookup.key[-1] != self._corpus_version:
+                return  # Corpus changed while the answer was being generated
+            self._entries[lookup.key] = (result, lookup.embedding, time.monotonic())
+            self._entries.move_to_end(lookup.key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "semantic": self.semantic,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "corpus_version": self._corpus_version,
+            }
+
+
+def get_answer_cache():
+    """Return the answer cache of the current application."""
+    return current_app.extensions["answer_cache"]
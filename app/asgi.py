@@ -0,0 +1,165 @@
+"""
+ASGI entry point, for serving the application with uvicorn:
+
+    uvicorn --factory app.asgi:create_asgi_app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import logging
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import create_app
+from .warmup import start_warmup
+
+
+class WsgiToAsgi:
+    """
+    Serve a WSGI application to an ASGI server.
+
+    The event loop only moves bytes: each request body is read into a spooled
+    temporary file, then the Flask view runs in one of `threads` worker
+    threads, where retrieval, embedding and LLM calls block that thread alone.
+    Response chunks are handed back to the loop one at a time, so a streamed
+    answer reaches the client as it is generated, and generation stops at the
+    next chunk once the client disconnects. (asgiref's adapter of the same
+    name runs every request in a single shared thread.)
+    """
+
+    def __init__(self, wsgi_app, threads=32, max_memory_body=1024 * 1024):
+        self.wsgi_app = wsgi_app
+        self.max_memory_body = max_memory_body
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="asgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+        body = await self.read_body(receive)
+        if body is None:
+            return  # Client went away before sending the whole request
+
+        disconnected = threading.Event()
+
+        async def watch_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        watcher = asyncio.create_task(watch_disconnect())
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.executor, self.run_wsgi, scope, body, send, loop, disconnected)
+        finally:
+            watcher.cancel()
+            body.close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def read_body(self, receive):
+        body = tempfile.SpooledTemporaryFile(max_size=self.max_memory_body)
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                body.close()
+                return None
+            body.write(message.get("body", b""))
+            if not message.get("more_body"):
+                body.seek(0)
+                return body
+
+    def build_environ(self, scope, body):
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": root_path.encode("utf8").decode("latin1"),
+            "PATH_INFO": path.encode("utf8").decode("latin1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "REMOTE_ADDR": client[0],
+            "REMOTE_PORT": str(client[1]),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": body,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+        }
+        for name, value in scope.get("headers", []):
+            name = name.decode("latin1").upper().replace("-", "_")
+            if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                name = "HTTP_" + name
+            value = value.decode("latin1")
+            if name in environ:
+                # Repeated headers are joined, with the separator of cookie lists for Cookie
+                value = f"{environ[name]}{'; ' if name == 'HTTP_COOKIE' else ','}{value}"
+            environ[name] = value
+        if "CONTENT_LENGTH" not in environ:
+            # Chunked request: the body has been read whole, so its length is known
+            environ["CONTENT_LENGTH"] = str(body.seek(0, 2))
+            body.seek(0)
+        return environ
+
+    def run_wsgi(self, scope, body, send, loop, disconnected):
+        """Run the WSGI application in a worker thread, sending its response through the loop."""
+        def call(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response_start = {}
+        started = threading.Event()
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started.is_set():
+                raise exc_info[1].with_traceback(exc_info[2])
+            response_start.update(
+                type="http.response.start",
+                status=int(status.split(" ", 1)[0]),
+                headers=[(name.lower().encode("latin1"), value.encode("latin1")) for name, value in headers],
+            )
+
+        def send_start():
+            # Headers go out with the first non-empty chunk, as WSGI requires
+            if not started.is_set():
+                started.set()
+                call(response_start)
+
+        result = self.wsgi_app(self.build_environ(scope, body), start_response)
+        try:
+            for chunk in result:
+                if disconnected.is_set():
+                    logging.info(f"Client disconnected, stopped {scope['method']} {scope['path']}")
+                    return
+                if chunk:
+                    send_start()
+                    call({"type": "http.response.body", "body": chunk, "more_body": True})
+            send_start()
+            call({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+
+def create_asgi_app(config=None):
+    """Create the Flask application and wrap it for an ASGI server."""
+    app = create_app(config)
+    start_warmup(app)
+    return WsgiToAsgi(app, threads=app.config["ASGI_THREADS"])
@@ -0,0 +1,267 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+def compute_file_hash(file):
+    """Compute the MD5 hash of a file."""
+    hash_md5 = hashlib.md5()
+    for chunk in iter(lambda: file.read(4096), b""):
+        hash_md5.update(chunk)
+    file.seek(0)  # Reset file pointer
+    return hash_md5.hexdigest()
+
+
+class Catalog:
+    """
+    Small SQLite database kept next to the vector store with bookkeeping about
+    the ingested PDFs, so that routes never have to rescan `data/pdf`.
+
+    files: content hash -> filename, for O(1) duplicate detection on upload.
+    sources: per-PDF statistics (chunks, pages, bytes, ingest time, embedding
+    model), maintained at ingest and delete time so that the management pages
+    never have to load the vector store collection. `version` counts the
+    uploads of a file under the same name.
+    pages: fingerprint (raw PDF objects), text hash and chunk count of every
+    page of a source, so that a new version of a PDF only re-parses and
+    re-embeds the pages that changed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " hash TEXT PRIMARY KEY,"
+            " filename TEXT NOT NULL UNIQUE,"
+            " size INTEGER,"
+            " added_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sources ("
+            " source TEXT PRIMARY KEY,"
+            " chunk_count INTEGER NOT NULL DEFAULT 0,"
+            " pages INTEGER,"
+            " bytes INTEGER,"
+            " ingested_at REAL,"
+            " embedding_model TEXT,"
+            " version INTEGER NOT NULL DEFAULT 1)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(sources)")]
+        if "version" not in columns:
+            self._conn.execute("ALTER TABLE sources ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " source TEXT NOT NULL,"
+            " page INTEGER NOT NULL,"
+            " fingerprint TEXT,"
+            " hash TEXT NOT NULL,"
+            " chunk_count INTEGER NOT NULL,"
+            " PRIMARY KEY (source, page))"
+        )
+
+    def find_hash(self, file_hash):
+        """Return the filename stored with this content hash, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT filename FROM files WHERE hash = ?", (file_hash,)).fetchone()
+        return row[0] if row else None
+
+    def claim(self, file_hash, filename, size=None):
+        """
+        Record a new file. Returns False if a file with the same content (or
+        the same name) is already recorded, which makes the check-and-insert
+        atomic across concurrent uploads.
+        """
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT INTO files (hash, filename, size, added_at) VALUES (?, ?, ?, ?)",
+                    (file_hash, filename, size, time.time()),
+                )
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def file_info(self, filename):
+        """Return (content hash, size) of a recorded file, or None."""
+        with self._lock:
+            return self._conn.execute("SELECT hash, size FROM files WHERE filename = ?", (filename,)).fetchone()
+
+    def replace(self, filename, file_hash, size=None):
+        """
+        Record new content for an existing file. Returns False if another file
+        already has this content.
+        """
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE files SET hash = ?, size = ?, added_at = ? WHERE filename = ?",
+                    (file_hash, size, time.time(), filename),
+                )
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def release(self, filename):
+        """Forget a file: its content hash and its statistics."""
+        with self._lock:
+            self._conn.execute("DELETE FROM files WHERE filename = ?", (filename,))
+            self._conn.execute("DELETE FROM sources WHERE source = ?", (filename,))
+            self._conn.execute("DELETE FROM pages WHERE source = ?", (filename,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM files")
+            self._conn.execute("DELETE FROM sources")
+            self._conn.execute("DELETE FROM pages")
+
+    def record_source(self, source, chunk_count, pages=None, embedding_model=None):
+        """Store the statistics of a freshly ingested source, counting one more version of it."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sources (source, chunk_count, pages, bytes, ingested_at, embedding_model, version)"
+                " VALUES (?, ?, ?, (SELECT size FROM files WHERE filename = ?), ?, ?,"
+                " COALESCE((SELECT version FROM sources WHERE source = ?), 0) + 1)",
+                (source, chunk_count, pages, source, time.time(), embedding_model, source),
+            )
+
+    def page_hashes(self, source):
+        """Return {page: (fingerprint, text hash, chunk count)} of an ingested source."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT page, fingerprint, hash, chunk_count FROM pages WHERE source = ?", (source,)
+            ).fetchall()
+        return {page: tuple(row) for page, *row in rows}
+
+    def record_pages(self, source, pages):
+        """Replace the page hashes of a source with `pages`, (page, fingerprint, text hash, chunk count) tuples."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM pages WHERE source = ?", (source,))
+                self._conn.executemany(
+                    "INSERT INTO pages (source, page, fingerprint, hash, chunk_count) VALUES (?, ?, ?, ?, ?)",
+                    [(source, *page) for page in pages],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def remove_chunks(self, source, count=1, page=None):
+        """
+        Account for chunks deleted individually from a source. The hashes of
+        their `page` are cleared, so that the next update of the source
+        embeds the page again instead of reusing it.
+        """
+        with self._lock:
+            self._conn.execute("UPDATE sources SET chunk_count = MAX(chunk_count - ?, 0) WHERE source = ?", (count, source))
+            if page is not None:
+                self._conn.execute("UPDATE pages SET fingerprint = NULL, hash = '' WHERE source = ? AND page = ?",
+                                   (source, page))
+
+    def list_sources(self, limit, offset=0):
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT source, chunk_count, pages, bytes, ingested_at, embedding_model, version"
+                " FROM sources ORDER BY source LIMIT ? OFFSET ?",
+                (limit, offset),
+            )
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def totals(self):
+        """Return (number of sources, total chunks) in one small aggregate query."""
+        with self._lock:
+            sources, chunks = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(chunk_count), 0) FROM sources").fetchone()
+        return sources, chunks
+
+    def rebuild_sources(self, vector_store, embedding_model=None, page_size=5000):
+        """
+        Recompute the per-source statistics from the vector store, reading
+        metadata a page at a time. Only needed for stores that predate the
+        statistics table.
+        """
+        stats = {}
+        offset = 0
+        while True:
+            metadatas = vector_store.get(include=["metadatas"], limit=page_size, offset=offset)["metadatas"]
+            if not metadatas:
+                break
+            for metadata in metadatas:
+                entry = stats.setdefault(metadata.get("source", "Unknown"), {"chunks": 0, "pages": set()})
+                entry["chunks"] += 1
+                if "page" in metadata:
+                    entry["pages"].add(metadata["page"])
+            offset += len(metadatas)
+
+        with self._lock:
+            self._conn.execute("DELETE FROM sources")
+        for source, entry in stats.items():
+            self.record_source(source, entry["chunks"], len(entry["pages"]) or None, embedding_model)
+        logging.info(f"Rebuilt statistics for {len(stats)} sources from {offset} chunks")
+        return len(stats)
+
+    def is_empty(self, table="files"):
+        with self._lock:
+            return self._conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is None
+
+    def rebuild(self, pdf_dir):
+        """Re-hash every PDF in `pdf_dir` and replace the index with the result."""
+        entries = []
+        for name in sorted(os.listdir(pdf_dir)):
+            path = os.path.join(pdf_dir, name)
+            if not name.endswith('.pdf') or not os.path.isfile(path):
+                continue
+            with open(path, 'rb') as f:
+                entries.append((compute_file_hash(f), name, os.path.getsize(path), os.path.getmtime(path)))
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM files")
+                self._conn.executemany("INSERT OR IGNORE INTO files (hash, filename, size, added_at) VALUES (?, ?, ?, ?)", entries)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        logging.info(f"Rebuilt hash index with {len(entries)} files from {pdf_dir}")
+        return len(entries)
+
+
+def get_catalog():
+    """Return the catalog of the current application."""
+    return current_app.extensions["catalog"]
+
+
+@click.command("rebuild-hash-index")
+@with_appcontext
+def rebuild_hash_index_command():
+    """Re-hash the PDFs in data/pdf and rebuild the duplicate-detection index."""
+    from .routes import pdf_dir
+    count = get_catalog().rebuild(pdf_dir)
+    click.echo(f"Indexed {count} PDF files.")
+
+
+@click.command("rebuild-stats")
+@with_appcontext
+def rebuild_stats_command():
+    """Recompute the per-PDF statistics from the vector store."""
+    from .vector_store import get_vector_store
+    vector_store = get_vector_store()
+    count = get_catalog().rebuild_sources(vector_store, embedding_model_name(vector_store.embedding_function))
+    click.echo(f"Rebuilt statistics for {count} sources.")
+
+
+def embedding_model_name(embedding):
+    return getattr(embedding, "model_name", None) or type(embedding).__name__
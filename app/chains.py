@@ -0,0 +1,260 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from langchain.chains import create_retrieval_chain
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableLambda
+
+from .context_packing import pack_documents
+from .lexical_index import reciprocal_rank_fusion
+from .metrics import record
+from .prompts import PROMPTS
+
+# "vector": Chroma similarity only; "lexical": BM25 over the chunk texts only;
+# "hybrid": both, merged with reciprocal rank fusion
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+
+retriever_prompt = ChatPromptTemplate.from_messages(
+    [
+        MessagesPlaceholder(variable_name="chat_history"),
+        ("human", "{input}"),
+        (
+            "human",
+            "Given the above conversation, generate a search query to lookup in order to get information relevant to the conversation",
+        ),
+    ]
+)
+
+
+class QueryRewriter:
+    """
+    Turns a follow-up question into a standalone search query using the chat
+    history, like langchain's history-aware retriever, but:
+
+    - a question without history is used as is, with no LLM round trip;
+    - rewrites are cached (LRU) by a hash of the history and the question;
+    - the rewrite can run on a different, smaller model than generation.
+    """
+
+    def __init__(self, llm, max_entries=1024):
+        self.chain = retriever_prompt | llm | StrOutputParser()
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.skipped = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(history, query):
+        digest = hashlib.sha1()
+        for message in history:
+            digest.update(f"{message.type}\0{message.content}\0".encode("utf-8"))
+        digest.update(query.encode("utf-8"))
+        return digest.hexdigest()
+
+    def rewrite(self, query, history):
+        if not history:
+            with self._lock:
+                self.skipped += 1
+            return query
+
+        key = self._key(history, query)
+        with self._lock:
+            rewritten = self._entries.get(key)
+            if rewritten is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return rewritten
+            self.misses += 1
+
+        rewritten = self.chain.invoke({"input": query, "chat_history": history}).strip() or query
+        if self.max_entries > 0:
+            with self._lock:
+                self._entries[key] = rewritten
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return rewritten
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "skipped": self.skipped,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class ChainRegistry:
+    """
+    Retrieval chains, and their generation halves, keyed by prompt type.
+
+    Each chain is built on first use and reused afterwards. Both caches are
+    dropped whenever the vector store service replaces its store (reload,
+    reset by /clear_db). Chains hold no chunks: retrieval reads the store on
+    every call, so uploads and deletes need no invalidation.
+    """
+
+    def __init__(self, llm, vector_store, rewriter=None, k=20, score_threshold=0.1, context_max_tokens=0,
+                 retrieval_mode="vector", reranker=None):
+        self.llm = llm
+        self.vector_store = vector_store
+        self.rewriter = rewriter or QueryRewriter(llm)
+        self.k = k
+        self.score_threshold = score_threshold
+        self.context_max_tokens = context_max_tokens
+        self.retrieval_mode = retrieval_mode
+        self.reranker = reranker
+        self._chains = {}
+        self._document_chains = {}
+        self._generation = vector_store.generation
+        self._lock = threading.Lock()
+
+    def get(self, prompt_type):
+        """Return the retrieval chain for `prompt_type`, or None if it is unknown."""
+        prompt = PROMPTS.get(prompt_type)
+        if not prompt:
+            return None
+
+        with self._lock:
+            self._check_generation()
+            chain = self._chains.get(prompt_type)
+            if chain is None:
+                logging.info(f"Building retrieval chain for prompt type: {prompt_type}")
+                chain = self._chains[prompt_type] = self._build(prompt)
+            return chain
+
+    def _check_generation(self):
+        # Caller holds the lock. Both caches follow the lifetime of the store
+        if self._generation != self.vector_store.generation:
+            self._chains.clear()
+            self._document_chains.clear()
+            self._generation = self.vector_store.generation
+
+    def rewrite(self, query, chat_history=None, timings=None):
+        """
+        Return the standalone search query of `query`: rewritten with the chat
+        history if there is one. The duration is recorded as the "rewrite"
+        stage, in the optional `timings` dict and in the stage metrics.
+        """
+        start = time.perf_counter()
+        query = self.rewriter.rewrite(query, chat_history or [])
+        seconds = time.perf_counter() - start
+        if timings is not None:
+            timings["rewrite"] = seconds
+        record("rewrite", seconds)
+        return query
+
+    def retrieve(self, query, chat_history=None, timings=None, mode=None, standalone=None):
+        """
+        Rewrite the query with the chat history if there is one, and return the
+        documents that go into the prompt. `standalone` is the rewritten query
+        when the caller already has it (see `rewrite`). `mode` is one of
+        RETRIEVAL_MODES (default: the registry's). Stage durations are recorded
+        in the optional `timings` dict, and in the stage metrics.
+        """
+        mode = mode or self.retrieval_mode
+        timings = {} if timings is None else timings
+
+        def done(stage, start):
+            timings[stage] = time.perf_counter() - start
+            record(stage, timings[stage])
+
+        query = self.rewrite(query, chat_history, timings) if standalone is None else standalone
+
+        vector_results = None
+        if mode in ("vector", "hybrid"):
+            start = time.perf_counter()
+            vector_results = self.vector_store.search(query, self._candidates(), self.score_threshold)
+            done("retrieval", start)
+        return self._select(query, vector_results, mode, done)
+
+    def retrieve_many(self, queries, timings=None, mode=None):
+        """
+        `retrieve` for a batch of standalone questions (no chat history): the
+        vector search embeds them in one call and looks them up in one pass
+        over the store, then each question goes through lexical search,
+        reranking and packing on its own. Returns one list of documents per
+        question; `timings` gets the durations of the whole batch.
+        """
+        mode = mode or self.retrieval_mode
+        timings = {} if timings is None else timings
+
+        def done(stage, start):
+            seconds = time.perf_counter() - start
+            timings[stage] = timings.get(stage, 0.0) + seconds
+            record(stage, seconds)
+
+        vector_results = [None] * len(queries)
+        if mode in ("vector", "hybrid") and queries:
+            start = time.perf_counter()
+            vector_results = self.vector_store.search_many(queries, self._candidates(), self.score_threshold)
+            done("retrieval", start)
+        return [self._select(query, found, mode, done) for query, found in zip(queries, vector_results)]
+
+    def _candidates(self):
+        # With a reranker, retrieve wide and let it pick the best few
+        return self.reranker.candidates if self.reranker else self.k
+
+    def _select(self, query, vector_results, mode, done):
+        """Fuse the vector results with the lexical ones, rerank and pack them into the prompt's documents."""
+        rankings = [] if vector_results is None else [vector_results]
+        if mode in ("lexical", "hybrid"):
+            start = time.perf_counter()
+            rankings.append(self.vector_store.keyword_search(query, self._candidates()))
+            done("lexical", start)
+        scored_documents = reciprocal_rank_fusion(rankings, self._candidates()) if len(rankings) > 1 else rankings[0]
+
+        if self.reranker:
+            start = time.perf_counter()
+            scored_documents = self.reranker.rerank(query, scored_documents)
+            done("rerank", start)
+
+        start = time.perf_counter()
+        if self.context_max_tokens:
+            documents = pack_documents(scored_documents, self.context_max_tokens)
+        else:
+            documents = [document for document, _ in scored_documents]
+        done("packing", start)
+        return documents
+
+    def get_document_chain(self, prompt_type):
+        """
+        Return the generation half of the chain for `prompt_type`: it answers
+        {"input", "context"} with the retrieved documents already in "context".
+        """
+        prompt = PROMPTS.get(prompt_type)
+        if not prompt:
+            return None
+        with self._lock:
+            self._check_generation()
+            chain = self._document_chains.get(prompt_type)
+            if chain is None:
+                chain = self._document_chains[prompt_type] = create_stuff_documents_chain(self.llm, prompt)
+            return chain
+
+    def _build(self, prompt):
+        # The optional `timings` dict of the chain input is passed through to
+        # its output, so callers can read the stage durations afterwards
+        retrieve = RunnableLambda(
+            lambda inputs: self.retrieve(inputs["input"], inputs.get("chat_history"), inputs.get("timings"),
+                                         inputs.get("retrieval"), inputs.get("standalone"))
+        ).with_config(run_name="retrieve_documents")
+        document_chain = create_stuff_documents_chain(self.llm, prompt)
+
+        return create_retrieval_chain(
+            retrieve,
+            document_chain,
+        )
+
+
+def get_chain_registry():
+    """Return the chain registry of the current application."""
+    return current_app.extensions["chains"]
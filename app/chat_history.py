@@ -0,0 +1,169 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+from flask import current_app
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+
+summary_prompt = PromptTemplate.from_template(
+    """Progressively summarize the conversation below, adding onto the previous summary. Keep the names, numbers and documents that were mentioned. Reply with the new summary only.
+
+Previous summary:
+{summary}
+
+New lines of conversation:
+{lines}
+
+New summary:"""
+)
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token), cheap enough to run on every turn."""
+    return len(text) // 4 + 1
+
+
+class Session:
+    __slots__ = ("turns", "tokens", "summary", "last_used")
+
+    def __init__(self):
+        self.turns = deque()  # (question, answer, tokens)
+        self.tokens = 0
+        self.summary = ""
+        self.last_used = time.monotonic()
+
+    def trim(self, max_tokens):
+        """Drop the oldest turns until the window fits in `max_tokens`; return them."""
+        evicted = []
+        while self.tokens > max_tokens and len(self.turns) > 1:
+            turn = self.turns.popleft()
+            self.tokens -= turn[2]
+            evicted.append(turn)
+
+        if self.tokens > max_tokens:
+            # A single turn larger than the whole budget: keep its beginning
+            question, answer, tokens = self.turns.pop()
+            answer = answer[:max(0, (max_tokens - estimate_tokens(question)) * 4)]
+            tokens = estimate_tokens(question) + estimate_tokens(answer)
+            self.turns.append((question, answer, tokens))
+            self.tokens = tokens
+        return evicted
+
+
+class ChatHistoryStore:
+    """
+    Conversation history per session, for the history-aware retriever.
+
+    Sessions are kept in LRU order and capped at `max_sessions`; sessions idle
+    for longer than `ttl` seconds are dropped. Each session keeps only the most
+    recent turns that fit in `max_tokens`. When a `summarize(summary, turns)`
+    callable is given, turns falling out of the window are folded into a
+    rolling summary (itself capped at a quarter of the budget) instead of
+    being forgotten, and the summary is passed along with the history.
+    """
+
+    def __init__(self, max_sessions=4096, max_tokens=1024, ttl=3600, summarize=None):
+        self.max_sessions = max_sessions
+        self.max_tokens = max_tokens
+        self.ttl = ttl
+        self.summarize = summarize
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+        self.summaries = 0
+
+    def _expire(self, now):
+        # Caller holds the lock; idle sessions are at the front of the LRU order
+        while self._sessions and self.ttl:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used <= self.ttl:
+                break
+            del self._sessions[session_id]
+            self.expirations += 1
+
+    def messages(self, session_id):
+        """Return the history of a session as chat messages (empty for a new session)."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                return []
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+
+            messages = [SystemMessage(content=f"Summary of the earlier conversation: {session.summary}")] if session.summary else []
+            for question, answer, _ in session.turns:
+                messages.append(HumanMessage(content=question))
+                messages.append(AIMessage(content=answer))
+            return messages
+
+    def append(self, session_id, question, answer):
+        """Record one exchange, trimming the session back to its token budget."""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = Session()
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+
+            tokens = estimate_tokens(question) + estimate_tokens(answer)
+            session.turns.append((question, answer, tokens))
+            session.tokens += tokens
+            evicted = session.trim(self.max_tokens)
+            summary = session.summary
+
+        if evicted and self.summarize is not None:
+            # The LLM call runs outside the lock; only this session waits for it
+            try:
+                summary = self.summarize(summary, evicted)
+            except Exception as e:
+                logging.error(f"Error summarizing chat history: {str(e)}")
+                return
+            with self._lock:
+                session.summary = summary[:self.max_tokens]  # About a quarter of the budget
+                self.summaries += 1
+
+    def clear(self, session_id=None):
+        """Forget one session, or every session when no id is given."""
+        with self._lock:
+            if session_id is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "tokens": sum(session.tokens for session in self._sessions.values()),
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "summaries": self.summaries,
+            }
+
+
+def create_summarizer(llm):
+    """Return a `summarize(summary, turns)` callable backed by `llm`."""
+    chain = summary_prompt | llm | StrOutputParser()
+
+    def summarize(summary, turns):
+        lines = "\n".join(f"Human: {question}\nAI: {answer}" for question, answer, _ in turns)
+        return chain.invoke({"summary": summary or "(none)", "lines": lines}).strip()
+
+    return summarize
+
+
+def get_chat_history():
+    """Return the chat history store of the current application."""
+    return current_app.extensions["chat_history"]
@@ -0,0 +1,131 @@
+class Config:
+    """
+    Default settings. Each one can be overridden from the environment with a
+    PDFQUERYAI_ prefix (e.g. PDFQUERYAI_LLM_MODEL=mistral) or by passing a
+    mapping to create_app().
+    """
+
+    # Ollama model used for generation. "fake" selects a local stand-in that
+    # streams a canned answer, for offline development and benchmarking.
+    LLM_MODEL = "llama3.1"
+    # Delay between tokens streamed by the fake model, in seconds
+    FAKE_LLM_TOKEN_DELAY = 0.0
+    # Generations sent to Ollama at once (match OLLAMA_NUM_PARALLEL); 0 lifts
+    # the limit. Further calls queue in arrival order: at most LLM_MAX_QUEUE
+    # of them, for at most LLM_QUEUE_TIMEOUT seconds, before the request is
+    # answered 429 with a Retry-After hint
+    LLM_CONCURRENCY = 2
+    LLM_MAX_QUEUE = 32
+    LLM_QUEUE_TIMEOUT = 30
+    # Identical prompts in flight at the same time share one generation
+    LLM_COALESCE = True
+    # FastEmbed model embedding chunks and questions. "fake" selects random
+    # but deterministic vectors, for offline development and load testing
+    EMBEDDING_MODEL = "BAAI/bge-small-en-v1.5"
+    # Embeddings of recent questions and chunks kept in memory, so repeated
+    # questions and re-ingested chunks are not embedded again; 0 disables it
+    EMBEDDING_CACHE_SIZE = 10000
+    # Embeddings also kept on disk (data/embedding_cache), across restarts;
+    # 0 disables the disk tier. Each entry takes 4 bytes per dimension
+    EMBEDDING_CACHE_DISK_SIZE = 0
+
+    # Level of the application log (app.log): DEBUG also logs every request,
+    # question and answer
+    LOG_LEVEL = "INFO"
+
+    # Models are loaded on first use. When serving (python app.py or the ASGI
+    # entry point), start loading them in the background right away, the
+    # Ollama model too with WARMUP_LLM, so the first question does not wait
+    WARMUP_ON_START = True
+    WARMUP_LLM = True
+
+    # Requests served concurrently by the ASGI entry point (app.asgi), each
+    # in its own thread; further requests wait for a free thread
+    ASGI_THREADS = 32
+
+    # Answers cached for repeated /ask_pdf questions; 0 disables the cache
+    ANSWER_CACHE_SIZE = 256
+    # Seconds before a cached answer expires; 0 keeps answers until evicted
+    ANSWER_CACHE_TTL = 3600
+    # Also reuse answers for differently worded questions whose embedding is
+    # within ANSWER_CACHE_MAX_DISTANCE (cosine distance) of a cached one
+    ANSWER_CACHE_SEMANTIC = False
+    ANSWER_CACHE_MAX_DISTANCE = 0.05
+
+    # Vector store: "chroma" (data/db) or "numpy", embeddings in a
+    # memory-mapped matrix (data/vectors) searched exhaustively, with
+    # VECTOR_STORE_DTYPE "int8" (a quarter of the memory; the best
+    # VECTOR_STORE_RESCORE * k chunks are rescored from a float16 copy kept
+    # on disk), "float16" (half, but slower to scan: NumPy converts float16
+    # without SIMD) or "float32". `flask --app app migrate-vector-store`
+    # copies the chunks of one into the other
+    VECTOR_STORE = "chroma"
+    VECTOR_STORE_DTYPE = "int8"
+    VECTOR_STORE_RESCORE = 4
+
+    # Chunks retrieved for /ask_pdf and their minimum relevance score
+    RETRIEVAL_K = 20
+    RETRIEVAL_SCORE_THRESHOLD = 0.1
+    # Default retrieval for /ask_pdf, overridable per request with "retrieval":
+    # "vector" (embedding similarity), "lexical" (BM25 keyword search, finds
+    # exact part numbers and codes) or "hybrid" (both, rank-fused)
+    RETRIEVAL_MODE = "hybrid"
+    # Optional second stage rescoring the retrieved chunks: None (off),
+    # "embedding" (cosine similarity with RERANK_MODEL, by default the app's
+    # embedding model) or "cross-encoder" (RERANK_MODEL, by default
+    # Xenova/ms-marco-MiniLM-L-6-v2; needs fastembed >= 0.4). RERANK_CANDIDATES
+    # chunks are retrieved, RERANK_TOP_K are kept for the prompt
+    RERANKER = None
+    RERANK_MODEL = None
+    RERANK_CANDIDATES = 40
+    RERANK_TOP_K = 8
+    RERANK_BATCH_SIZE = 32
+    # Approximate tokens of retrieved context put into the prompt: the best
+    # chunks are packed into this budget, with overlapping neighbours merged.
+    # Ollama's default context window is 2048 tokens, prompt included.
+    # 0 stuffs all RETRIEVAL_K chunks as they are
+    CONTEXT_MAX_TOKENS = 1200
+
+    # /ask_pdf_batch: questions accepted per request, and generations of a
+    # batch requested at once (None: LLM_CONCURRENCY, or 4 when that is 0).
+    # They queue in front of Ollama like any other call, so a batch holds at
+    # most that many slots and /ask_pdf users keep being served
+    BATCH_MAX_QUESTIONS = 200
+    BATCH_WORKERS = None
+
+    # PDF usage counts (/pdf_usage) are written to data/usage.sqlite3 every
+    # USAGE_FLUSH_INTERVAL seconds, or on every answer with 0. Worker
+    # processes sharing the file see each other's counts after a flush
+    USAGE_FLUSH_INTERVAL = 10
+
+    # Ollama model used only to rewrite follow-up questions into search
+    # queries; None uses LLM_MODEL. A small model (e.g. qwen2.5:0.5b) cuts
+    # the latency of follow-ups
+    REWRITE_LLM_MODEL = None
+    # Rewritten queries cached by (history, question); 0 disables the cache
+    REWRITE_CACHE_SIZE = 1024
+
+    # Per-session chat history used to rewrite follow-up questions: sessions
+    # kept (least recently used are dropped first), seconds before an idle
+    # session is forgotten, and approximate tokens of history per session
+    CHAT_HISTORY_MAX_SESSIONS = 4096
+    CHAT_HISTORY_TTL = 3600
+    CHAT_HISTORY_MAX_TOKENS = 1024
+    # Fold turns that fall out of the window into a rolling summary (one
+    # extra LLM call whenever that happens) instead of dropping them
+    CHAT_HISTORY_SUMMARIZE = False
+
+    # Background ingestion of uploaded PDFs: worker threads, uploads allowed
+    # to wait in the queue before /pdf answers 503, and chunks per embedding call
+    INGEST_WORKERS = 2
+    INGEST_MAX_PENDING = 32
+    INGEST_BATCH_SIZE = 64
+    # Seconds the status of a finished ingestion job (/jobs/<job_id>) is kept
+    # in data/jobs; older ones are deleted on start. 0 keeps them all
+    INGEST_JOB_RETENTION = 7 * 24 * 3600
+    # Soft cap on the process RSS during ingestion, in MB; when exceeded the
+    # batch size is halved for the rest of the document. 0 disables the check
+    INGEST_MAX_RSS_MB = 0
+    # Worker processes extracting PDF pages in parallel; None uses one per
+    # CPU, 0 or 1 parses in the ingestion thread itself
+    PDF_PARSE_WORKERS = None
@@ -0,0 +1,85 @@
+from langchain_core.documents import Document
+
+from .chat_history import estimate_tokens
+
+
+def strip_overlap(previous, text, max_overlap=256):
+    """
+    Drop the beginning of `text` that repeats the end of `previous`, as left
+    by the splitter's chunk overlap between consecutive chunks.
+    """
+    for size in range(min(max_overlap, len(previous), len(text)), 0, -1):
+        if previous.endswith(text[:size]):
+            return text[size:].lstrip()
+    return text
+
+
+def _position(document):
+    """(source, page, chunk) of a chunk, or None for chunks stored without a position."""
+    metadata = document.metadata
+    if "page" not in metadata or "chunk" not in metadata:
+        return None
+    return metadata.get("source"), metadata["page"], metadata["chunk"]
+
+
+def pack_documents(scored_documents, max_tokens):
+    """
+    Select the retrieved chunks that go into the prompt.
+
+    `scored_documents` are (document, relevance score) pairs. Chunks are taken
+    best score first until `max_tokens` (estimated) is filled, skipping exact
+    duplicates; the best chunk is always kept, truncated if it alone exceeds
+    the budget. Selected chunks that are consecutive on the same page are then
+    merged into one document with their overlap removed. The packed documents
+    are returned in order of their best score, with the score in their metadata.
+    """
+    ranked = sorted(scored_documents, key=lambda pair: pair[1], reverse=True)
+
+    selected = []
+    seen_texts = set()
+    budget = max_tokens
+    for document, score in ranked:
+        text = document.page_content
+        if text in seen_texts:
+            continue
+        tokens = estimate_tokens(text)
+        if tokens > budget:
+            if selected:
+                continue
+            text = text[:budget * 4]  # Always answer from at least the best chunk
+            tokens = budget
+        seen_texts.add(text)
+        selected.append((document, text, score))
+        budget -= tokens
+        if budget <= 0:
+            break
+
+    # Group consecutive chunks of the same page
+    runs = {}
+    for document, text, score in selected:
+        position = _position(document)
+        key = position[:2] if position else id(document)
+        runs.setdefault(key, []).append((position[2] if position else 0, document, text, score))
+
+    packed = []
+    for chunks in runs.values():
+        chunks.sort(key=lambda chunk: chunk[0])
+        current = None
+        for index, document, text, score in chunks:
+            if current is not None and index == current["last"] + 1:
+                current["text"] += " " + strip_overlap(current["text"], text)
+                current["last"] = index
+                current["score"] = max(current["score"], score)
+                current["chunks"].append(index)
+                continue
+            current = {"metadata": dict(document.metadata), "text": text, "last": index, "score": score, "chunks": [index]}
+            packed.append(current)
+
+    packed.sort(key=lambda entry: entry["score"], reverse=True)
+    documents = []
+    for entry in packed:
+        metadata = dict(entry["metadata"], score=entry["score"])
+        if len(entry["chunks"]) > 1:
+            metadata["chunks"] = entry["chunks"]
+        documents.append(Document(page_content=entry["text"], metadata=metadata))
+    return documents
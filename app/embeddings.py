@@ -0,0 +1,265 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from flask import current_app
+from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+from .metrics import record
+
+
+def create_embedding(config):
+    """
+    Return the embedding model selected by `EMBEDDING_MODEL`, to be loaded
+    on first use.
+    """
+    model = config["EMBEDDING_MODEL"]
+    if model == "fake":
+        return LazyEmbeddings(lambda: DeterministicFakeEmbedding(size=384), model)
+    return LazyEmbeddings(lambda: FastEmbedEmbeddings(model_name=model), model)
+
+
+def embed_queries(embedding, texts):
+    """
+    Embed a batch of questions. FastEmbed embeds them in one call; LangChain
+    only offers `embed_query`, one question at a time.
+    """
+    if hasattr(embedding, "embed_queries"):
+        return embedding.embed_queries(texts)
+    if isinstance(embedding, FastEmbedEmbeddings):
+        return [vector.tolist() for vector in embedding._model.query_embed(list(texts))]
+    return [embedding.embed_query(text) for text in texts]
+
+
+class LazyEmbeddings(Embeddings):
+    """
+    Embedding model created by `factory` the first time it is needed, so that
+    the application starts without waiting for the model to load. Concurrent
+    first calls wait for a single load.
+    """
+
+    def __init__(self, factory, model_name):
+        self.factory = factory
+        self.model_name = model_name
+        self.load_seconds = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def load(self):
+        model = self._model
+        if model is None:
+            with self._lock:
+                if self._model is None:
+                    start = time.perf_counter()
+                    self._model = self.factory()
+                    self.load_seconds = time.perf_counter() - start
+                    logging.info(f"Loaded embedding model {self.model_name} in {self.load_seconds:.2f} s")
+                model = self._model
+        return model
+
+    def embed_documents(self, texts):
+        return self.load().embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.load().embed_query(text)
+
+    def embed_queries(self, texts):
+        return embed_queries(self.load(), texts)
+
+
+class DiskEmbeddingStore:
+    """
+    Fixed-size ring of embeddings on disk: the vectors live in a memory-mapped
+    float32 array of `capacity` rows, and an SQLite table maps each key to its
+    row. When the ring is full the oldest row is overwritten. The store is
+    reset if it was written with another capacity or vector size.
+    """
+
+    def __init__(self, directory, capacity):
+        self.directory = directory
+        self.capacity = capacity
+        os.makedirs(directory, exist_ok=True)
+        self._vectors = None
+        self._conn = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS slots (key TEXT PRIMARY KEY, slot INTEGER NOT NULL UNIQUE)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+        meta = dict(self._conn.execute("SELECT name, value FROM meta"))
+        self._next = meta.get("next", 0)
+        if meta.get("capacity") == capacity and meta.get("dim"):
+            self._open(meta["dim"], reuse=True)
+        else:
+            self._conn.execute("DELETE FROM slots")
+
+    def _open(self, dim, reuse=False):
+        path = os.path.join(self.directory, "vectors.f32")
+        reuse = reuse and os.path.exists(path) and os.path.getsize(path) == self.capacity * dim * 4
+        self._vectors = np.memmap(path, dtype=np.float32, mode="r+" if reuse else "w+", shape=(self.capacity, dim))
+        if not reuse:
+            self._conn.execute("DELETE FROM slots")
+            self._next = 0
+            self._conn.executemany("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                                   [("capacity", self.capacity), ("dim", dim), ("next", 0)])
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM slots").fetchone()[0]
+
+    def get(self, key):
+        row = self._conn.execute("SELECT slot FROM slots WHERE key = ?", (key,)).fetchone()
+        if row is None or self._vectors is None:
+            return None
+        return np.array(self._vectors[row[0]])
+
+    def put(self, items):
+        """Store (key, vector) pairs."""
+        if not items:
+            return
+        if self._vectors is None or self._vectors.shape[1] != len(items[0][1]):
+            self._open(len(items[0][1]))
+        self._conn.execute("BEGIN")
+        try:
+            for key, vector in items:
+                slot = self._next
+                self._next = (self._next + 1) % self.capacity
+                self._vectors[slot] = vector
+                self._conn.execute("DELETE FROM slots WHERE slot = ? OR key = ?", (slot, key))
+                self._conn.execute("INSERT INTO slots (key, slot) VALUES (?, ?)", (key, slot))
+            self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('next', ?)", (self._next,))
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embedding model wrapper remembering the vectors it computed, keyed by a
+    hash of the model name, the kind of text (query or document) and the
+    text, so repeated questions and re-ingested chunks are not embedded again.
+
+    The `max_entries` most recently used vectors are kept in memory. With a
+    `disk_directory`, every computed vector is also written to a
+    DiskEmbeddingStore of `disk_entries` rows, which outlives restarts.
+    """
+
+    def __init__(self, embedding, max_entries=10000, disk_directory=None, disk_entries=100000):
+        self.embedding = embedding
+        self.model_name = getattr(embedding, "model_name", None) or type(embedding).__name__
+        self.max_entries = max_entries
+        self.disk = DiskEmbeddingStore(disk_directory, disk_entries) if disk_directory and disk_entries else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = self.disk_hits = self.misses = 0
+        self.embed_seconds = 0.0
+
+    @property
+    def loaded(self):
+        return getattr(self.embedding, "loaded", True)
+
+    def load(self):
+        if hasattr(self.embedding, "load"):
+            self.embedding.load()
+
+    def _key(self, kind, text):
+        return hashlib.sha1(f"{self.model_name}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys):
+        """Cached vectors of `keys` (None where missing), counting hits."""
+        vectors = []
+        with self._lock:
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                elif self.disk is not None:
+                    vector = self.disk.get(key)
+                    if vector is not None:
+                        self.disk_hits += 1
+                        self._remember(key, vector)
+                vectors.append(vector)
+        return vectors
+
+    def _remember(self, key, vector):
+        # Caller holds the lock
+        if not self.max_entries:
+            return
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _embed(self, kind, texts):
+        keys = [self._key(kind, text) for text in texts]
+        vectors = self._lookup(keys)
+
+        # Each distinct missing text is embedded once, in one batch
+        missing = OrderedDict()
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None:
+                missing.setdefault(key, text)
+        if missing:
+            start = time.perf_counter()
+            if kind == "query":
+                computed = embed_queries(self.embedding, list(missing.values()))
+            else:
+                computed = self.embedding.embed_documents(list(missing.values()))
+            elapsed = time.perf_counter() - start
+            record(f"embedding_{kind}", elapsed)
+            computed = dict(zip(missing, (np.asarray(vector, dtype=np.float32) for vector in computed)))
+            with self._lock:
+                self.misses += len(missing)
+                self.embed_seconds += elapsed
+                for key, vector in computed.items():
+                    self._remember(key, vector)
+                if self.disk is not None:
+                    try:
+                        self.disk.put(list(computed.items()))
+                    except Exception as e:
+                        logging.error(f"Error writing the embedding cache: {str(e)}")
+            vectors = [computed[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+
+        return [vector.tolist() for vector in vectors]
+
+    def embed_documents(self, texts):
+        return self._embed("document", texts)
+
+    def embed_query(self, text):
+        return self._embed("query", [text])[0]
+
+    def embed_queries(self, texts):
+        return self._embed("query", texts)
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            seconds_per_text = self.embed_seconds / self.misses if self.misses else 0.0
+            return {
+                "model": self.model_name,
+                "entries": len(self._entries),
+                "disk_entries": len(self.disk) if self.disk is not None else None,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else None,
+                "embed_seconds": round(self.embed_seconds, 3),
+                # Estimated from the average time of the texts that were embedded
+                "saved_seconds": round(hits * seconds_per_text, 3),
+            }
+
+
+def get_embedding():
+    """Return the embedding model of the current application."""
+    return current_app.extensions["embedding"]
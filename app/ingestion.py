@@ -0,0 +1,507 @@
+import gc
+import hashlib
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+
+from flask import current_app
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from .catalog import embedding_model_name
+from .metrics import record
+from .pdf_parsing import page_fingerprints
+
+# Initialize text splitter
+text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=2048,  # Increased chunk size for better context
+    chunk_overlap=100,  # Increased overlap to maintain context between chunks
+    length_function=len,
+    is_separator_regex=False
+)
+
+
+def preprocess_text(text):
+    # Implement text cleaning steps
+    text = text.strip().replace('\n', ' ').replace('\r', '')
+    return text
+
+
+def perform_ocr(pdf_path):
+    # Placeholder function for OCR processing
+    # You can implement this using libraries like pytesseract or other OCR tools
+    return "OCR processed text from PDF"
+
+
+def chunk_id(source, page, index):
+    """Deterministic id of a chunk, so re-ingesting a file overwrites it in place."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"pdfqueryai:{source}#{page}-{index}"))
+
+
+def page_hash(text, embedding_model):
+    """
+    Hash of a page's text (or of its fingerprint). The embedding model is
+    part of it, so that switching models re-embeds every page of an updated
+    PDF.
+    """
+    return hashlib.sha1(f"{embedding_model}\0{text}".encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def iter_chunks(pages, source):
+    """Split (page_number, text) pairs into (id, text, metadata) chunks, lazily."""
+    for page, text in pages:
+        for index, chunk in enumerate(text_splitter.split_text(preprocess_text(text))):
+            yield chunk_id(source, page, index), chunk, {"source": source, "page": page, "chunk": index}
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class Job:
+    """
+    State of one ingestion job, persisted as JSON under the jobs directory
+    every time it changes so that it survives restarts.
+    """
+
+    def __init__(self, job_file, **state):
+        self.job_file = job_file
+        self.state = state
+        self._lock = threading.Lock()
+
+    @property
+    def id(self):
+        return self.state["id"]
+
+    def update(self, **fields):
+        with self._lock:
+            self.state.update(fields)
+            self._save()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.state, timings=dict(self.state["timings"]))
+
+    def _save(self):
+        tmp_file = self.job_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_file, self.job_file)
+
+    @classmethod
+    def load(cls, job_file):
+        with open(job_file) as f:
+            return cls(job_file, **json.load(f))
+
+
+class IngestionBusy(Exception):
+    """Raised by IngestionQueue.submit when the file already has a job in progress."""
+
+
+class IngestionQueue:
+    """
+    Bounded background queue for PDF ingestion.
+
+    Uploads are saved by the request handler and turned into jobs; a fixed pool
+    of worker threads runs `handler(job)` for each of them. Jobs that were still
+    queued or running when the process stopped are picked up again on start,
+    and the files of jobs that finished more than `retention` seconds ago are
+    deleted (0 keeps them).
+    """
+
+    def __init__(self, jobs_dir, handler, workers=2, max_pending=32, retention=7 * 24 * 3600):
+        self.jobs_dir = jobs_dir
+        self.handler = handler
+        self.workers = workers
+        self.retention = retention
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def start(self):
+        """Start the worker threads and resume unfinished jobs (idempotent)."""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"ingestion-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+        for job in self._load_unfinished():
+            logging.info(f"Resuming ingestion job {job.id} for {job.state['filename']}")
+            job.update(status="queued", stage="queued", resumed=True)
+            with self._lock:
+                self._jobs[job.id] = job
+            self._pending.put(job)
+
+    def _load_unfinished(self):
+        """Return the jobs to resume, deleting the files of finished jobs past their retention."""
+        jobs = []
+        expired = time.time() - self.retention if self.retention else None
+        for name in sorted(os.listdir(self.jobs_dir)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                job = Job.load(os.path.join(self.jobs_dir, name))
+            except (OSError, ValueError) as e:
+                logging.error(f"Skipping unreadable job file {name}: {str(e)}")
+                continue
+            if job.state.get("status") in ("queued", "running"):
+                jobs.append(job)
+            elif expired is not None and (job.state.get("finished_at") or 0) < expired:
+                try:
+                    os.remove(job.job_file)
+                except OSError as e:
+                    logging.error(f"Error deleting job file {name}: {str(e)}")
+        return sorted(jobs, key=lambda job: job.state.get("created_at", 0))
+
+    def submit(self, filename, path, block=False, exclusive=False, **extra):
+        """
+        Queue a saved PDF for ingestion and return its job. Raises queue.Full
+        when too many jobs are already pending, unless `block` is set, and
+        with `exclusive` set, IngestionBusy when the same file is already
+        queued or being ingested.
+        """
+        self.start()
+        job_id = uuid.uuid4().hex
+        job = Job(
+            os.path.join(self.jobs_dir, f"{job_id}.json"),
+            id=job_id,
+            filename=filename,
+            path=path,
+            status="queued",
+            stage="queued",
+            pages=0,
+            chunks=0,
+            chunks_embedded=0,
+            timings={},
+            error=None,
+            created_at=time.time(),
+            started_at=None,
+            finished_at=None,
+            **extra,
+        )
+        with self._lock:
+            if exclusive and self._has_job(filename):
+                raise IngestionBusy(filename)
+            self._jobs[job_id] = job
+        try:
+            self._pending.put(job, block=block)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job_id]
+            raise
+        job.update()  # Persist once it is actually queued
+        return job
+
+    def is_busy(self, filename):
+        """Whether the file has a job queued or being ingested."""
+        with self._lock:
+            return self._has_job(filename)
+
+    def _has_job(self, filename):
+        # Caller holds the lock
+        return any(job.state["filename"] == filename for job in self._jobs.values())
+
+    def get(self, job_id):
+        """Return the job with this id (from memory or disk), or None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+
+        job_file = os.path.join(self.jobs_dir, f"{os.path.basename(job_id)}.json")
+        if os.path.exists(job_file):
+            return Job.load(job_file)
+        return None
+
+    def join(self):
+        """Block until every queued job has been processed."""
+        self._pending.join()
+
+    def _work(self):
+        while True:
+            job = self._pending.get()
+            job.update(status="running", started_at=time.time())
+            try:
+                self.handler(job)
+                job.update(status="completed", stage="done", finished_at=time.time())
+                logging.info(f"Ingestion job {job.id} completed: {job.state['filename']}")
+            except Exception as e:
+                logging.error(f"Ingestion job {job.id} failed: {str(e)}")
+                job.update(status="failed", error=str(e), finished_at=time.time())
+            finally:
+                with self._lock:
+                    self._jobs.pop(job.id, None)
+                self._pending.task_done()
+
+
+def ingest_pdf(job, vector_store, catalog, pdf_parser, batch_size=64, max_rss_mb=0):
+    """
+    Parse, split, embed and store the PDF of an ingestion job. On failure the
+    partially stored chunks and the saved file are removed so that the upload
+    can simply be retried. A failed update leaves the previous version in
+    place instead: the chunks it overwrote or deleted are restored, the
+    chunks it added are deleted, and the catalog points at the previous file.
+    """
+    # Chunk id -> stored (text, metadata, embedding), or None, and page hashes, before the update
+    backup = {"chunks": {}, "pages": []} if job.state.get("update") else None
+    try:
+        _ingest_pdf(job, vector_store, catalog, pdf_parser, batch_size, max_rss_mb, backup)
+    except Exception:
+        if backup is None:
+            vector_store.delete_source(job.state["filename"])
+            for path in {job.state["path"], job.state.get("target", job.state["path"])}:
+                if os.path.exists(path):
+                    os.remove(path)
+            catalog.release(job.state["filename"])
+        else:
+            _roll_back_update(job, vector_store, catalog, backup)
+        raise
+
+
+def _backup_chunks(vector_store, backup, ids):
+    """Save the stored version of the chunks `ids` (None for those not stored) before an update touches them."""
+    backup = backup["chunks"]
+    missing = [chunk for chunk in ids if chunk not in backup]
+    if not missing:
+        return
+    found = vector_store.get(ids=missing, include=["documents", "metadatas", "embeddings"])
+    saved = dict(zip(found["ids"], zip(found["documents"], found["metadatas"], found["embeddings"])))
+    backup.update((chunk, saved.get(chunk)) for chunk in missing)
+
+
+def _roll_back_update(job, vector_store, catalog, backup):
+    file_name = job.state["filename"]
+    chunks = backup["chunks"]
+    try:
+        added = [chunk for chunk, saved in chunks.items() if saved is None]
+        if added:
+            vector_store.delete(added)
+        restored = [(chunk, saved) for chunk, saved in chunks.items() if saved is not None]
+        if restored:
+            vector_store.upsert([chunk for chunk, _ in restored], [saved[0] for _, saved in restored],
+                                [saved[1] for _, saved in restored],
+                                [[float(value) for value in saved[2]] for _, saved in restored])
+        if backup["pages"]:
+            catalog.record_pages(file_name, backup["pages"])
+        if job.state.get("previous_hash"):
+            catalog.replace(file_name, job.state["previous_hash"], job.state.get("previous_size"))
+    except Exception as e:
+        logging.error(f"Error restoring the previous version of {file_name}: {str(e)}")
+    # The new version never replaced the previous file
+    if job.state["path"] != job.state.get("target", job.state["path"]) and os.path.exists(job.state["path"]):
+        os.remove(job.state["path"])
+    logging.info(f"Update of {file_name} failed, kept the previous version")
+
+
+class StageTimer:
+    """Accumulates the time spent in each stage of an interleaved pipeline."""
+
+    def __init__(self):
+        self.totals = {}
+
+    def timed(self, stage, iterable):
+        """Wrap an iterator, charging the time spent producing items to `stage`."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(stage, time.perf_counter() - start)
+                return
+            self.add(stage, time.perf_counter() - start)
+            yield item
+
+    def add(self, stage, seconds):
+        self.totals[stage] = self.totals.get(stage, 0.0) + seconds
+
+
+def _ingest_pdf(job, vector_store, catalog, pdf_parser, batch_size, max_rss_mb, backup=None):
+    """
+    Streaming ingestion: pages are parsed, split, embedded and upserted in
+    batches of `batch_size` chunks, so only one batch of texts and embeddings
+    is held in memory at a time. When the process grows past `max_rss_mb`
+    the batch size is halved for the remaining batches.
+
+    For a new version of an ingested PDF (an `update` job) only the pages
+    that changed are parsed, split and embedded: pages whose fingerprint (a
+    hash of their raw PDF objects) is unchanged are skipped before text
+    extraction, and pages whose text hash is unchanged before splitting.
+    Chunk ids depend on the page and position only, so the chunks of changed
+    pages overwrite the previous ones in place; chunks left over from
+    shorter or removed pages are deleted. Every chunk an update overwrites or
+    deletes is saved in `backup` first, and the new file replaces the
+    previous one only once everything is stored.
+    """
+    file_name = job.state["filename"]
+    update = job.state.get("update", False)
+    model = embedding_model_name(vector_store.embedding_function)
+
+    save_file = job.state["path"]
+
+    previous = catalog.page_hashes(file_name) if update else {}
+    if backup is not None:
+        backup["pages"] = [(page, *row) for page, row in previous.items()]
+    if (job.state.get("resumed") and not update) or (update and not previous):
+        # A previous attempt may have stored part of the chunks already, and
+        # a source ingested without page hashes can't be updated in place
+        vector_store.delete_source(file_name)
+
+    job.update(stage="fingerprinting")
+    timer = StageTimer()
+    counts = {"pages": 0, "chunks": 0, "text_pages": 0, "reused_chunks": 0}
+    page_rows = []  # (page, fingerprint, text hash, chunk count) of every page, for the catalog
+    changed = {}  # page -> (fingerprint, text hash, previous chunk count) of the pages to embed
+    chunks_per_page = {}
+
+    start = time.perf_counter()
+    try:
+        fingerprints = [page_hash(fingerprint, model) for fingerprint in page_fingerprints(save_file)]
+    except Exception as e:
+        logging.error(f"Error fingerprinting pages: {e}")
+        fingerprints = []
+    timer.add("fingerprinting", time.perf_counter() - start)
+    for page, fingerprint in enumerate(fingerprints):
+        if page in previous and previous[page][0] == fingerprint:
+            _, text_hash, chunk_count = previous.pop(page)
+            counts["pages"] += 1
+            counts["reused_chunks"] += chunk_count
+            counts["text_pages"] += 1 if chunk_count else 0
+            page_rows.append((page, fingerprint, text_hash, chunk_count))
+    reused = {page for page, *_ in page_rows}
+    job.update(stage="parsing")
+
+    def pages():
+        try:
+            to_parse = [page for page in range(len(fingerprints)) if page not in reused] if reused else None
+            for page, text in timer.timed("parsing", pdf_parser.parse(save_file, pages=to_parse)):
+                counts["pages"] += 1
+                if text.strip():
+                    counts["text_pages"] += 1
+                fingerprint = fingerprints[page] if page < len(fingerprints) else None
+                text_hash = page_hash(text, model)
+                _, previous_hash, previous_chunks = previous.pop(page, (None, None, 0))
+                if text_hash == previous_hash:
+                    counts["reused_chunks"] += previous_chunks
+                    page_rows.append((page, fingerprint, text_hash, previous_chunks))
+                    continue
+                changed[page] = (fingerprint, text_hash, previous_chunks)
+                yield page, text
+        except Exception as e:
+            # Not the end of the document: a partial ingestion would be
+            # reported as complete, and an update would delete the pages after it
+            logging.error(f"Error loading structured text: {e}")
+            raise
+
+    def store(batch):
+        ids, texts, metadatas = zip(*batch)
+        if backup is not None:
+            _backup_chunks(vector_store, backup, ids)
+        start = time.perf_counter()
+        embeddings = vector_store.embedding_function.embed_documents(list(texts))
+        timer.add("embedding", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        vector_store.upsert(list(ids), list(texts), list(metadatas), embeddings)
+        timer.add("upsert", time.perf_counter() - start)
+
+        for _, _, metadata in batch:
+            chunks_per_page[metadata["page"]] = chunks_per_page.get(metadata["page"], 0) + 1
+        counts["chunks"] += len(batch)
+        # From the first batch on, pages are parsed and split between batches
+        job.update(
+            stage="embedding",
+            pages=counts["pages"],
+            chunks=counts["chunks"] + counts["reused_chunks"],
+            chunks_embedded=counts["chunks"],
+        )
+
+    batch = []
+    for chunk in timer.timed("splitting", iter_chunks(pages(), file_name)):
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            store(batch)
+            batch = []
+            if max_rss_mb and batch_size > 1 and current_rss_mb() > max_rss_mb:
+                gc.collect()
+                batch_size = max(1, batch_size // 2)
+                logging.warning(f"RSS above {max_rss_mb} MB, reducing ingestion batch size to {batch_size}")
+    if batch:
+        store(batch)
+
+    # Parsing and splitting time are measured together, since pages are
+    # pulled through the splitter
+    timer.totals["splitting"] = timer.totals.get("splitting", 0.0) - timer.totals.get("parsing", 0.0)
+
+    is_structured = counts["text_pages"] > 0
+    if not is_structured:
+        # Perform OCR if the document is unstructured
+        try:
+            logging.info("Performing OCR")
+            job.update(stage="ocr")
+            text = perform_ocr(save_file)
+            store(list(iter_chunks([(0, text)], file_name)))
+        except Exception as e:
+            raise RuntimeError(f"Error during OCR processing: {str(e)}")
+
+    # Chunks past the new end of changed pages, and every chunk of the pages
+    # that are gone from this version
+    stale = []
+    for page, (fingerprint, text_hash, previous_chunks) in changed.items():
+        page_rows.append((page, fingerprint, text_hash, chunks_per_page.get(page, 0)))
+        stale.extend(chunk_id(file_name, page, index) for index in range(chunks_per_page.get(page, 0), previous_chunks))
+    for page, (_, _, previous_chunks) in previous.items():
+        stale.extend(chunk_id(file_name, page, index) for index in range(previous_chunks))
+    if stale:
+        job.update(stage="deleting")
+        start = time.perf_counter()
+        if backup is not None:
+            _backup_chunks(vector_store, backup, stale)
+        vector_store.delete(stale)
+        timer.add("delete", time.perf_counter() - start)
+
+    for stage, seconds in timer.totals.items():
+        record(f"ingest_{stage}", seconds)
+    total_chunks = counts["chunks"] + counts["reused_chunks"]
+    logging.info(f"Loaded len={total_chunks} chunks ({counts['chunks']} embedded, {counts['reused_chunks']} unchanged)")
+    job.update(stage="saving")
+    catalog.record_pages(file_name, page_rows)
+    target = job.state.get("target")
+    if target and save_file != target:
+        # The new version replaces the previous file now that it is stored
+        os.replace(save_file, target)
+        job.update(path=target)
+    catalog.record_source(file_name, total_chunks, counts["pages"], model)
+    parse_time = timer.totals.get("parsing", 0.0)
+    job.update(
+        chunks=total_chunks,
+        pages_changed=len(changed),
+        pages_unchanged=counts["pages"] - len(changed),
+        chunks_deleted=len(stale),
+        is_structured=is_structured,
+        doc_len=counts["pages"],
+        pages_per_second=round(counts["pages"] / parse_time, 1) if parse_time else None,
+        rss_mb=round(current_rss_mb(), 1),
+        timings={stage: round(seconds, 3) for stage, seconds in timer.totals.items()},
+    )
+
+
+def get_ingestion_queue():
+    """Return the ingestion queue of the current application."""
+    return current_app.extensions["ingestion"]
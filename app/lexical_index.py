@@ -0,0 +1,229 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from langchain_core.documents import Document
+
+TOKEN_PATTERN = re.compile(r"[\w-]+")
+
+
+def query_terms(text):
+    """The distinct lower-cased tokens of a free-text query, in order."""
+    return list(dict.fromkeys(token.lower() for token in TOKEN_PATTERN.findall(text)))
+
+
+def fts_query(terms):
+    """
+    OR the terms into an FTS5 query, each one quoted so that FTS5 operators
+    and punctuation in the question are taken literally.
+    """
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+class LexicalIndex:
+    """
+    BM25 index over the chunk texts, in an SQLite FTS5 database next to the
+    vector store. Hyphens are part of tokens, so a part number such as
+    "PN-0003-00012-034" is matched as a whole.
+
+    It is kept in sync by VectorStoreService, which mirrors every write to
+    the Chroma collection into it.
+
+    BM25 has to score every chunk matching any query term, so a question full
+    of words found in most chunks would take hundreds of milliseconds on a
+    large corpus while those words barely affect the ranking. Terms found in
+    more than `max_df_ratio` of the chunks (and in more than
+    `min_pruned_df` chunks, so small corpora are unaffected) are dropped from
+    queries; their document frequencies are cached until the next write.
+    """
+
+    def __init__(self, path, max_df_ratio=0.2, min_pruned_df=1000):
+        self.path = path
+        self.max_df_ratio = max_df_ratio
+        self.min_pruned_df = min_pruned_df
+        self._df_cache = {}
+        self._total = None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " rowid INTEGER PRIMARY KEY,"
+            " id TEXT NOT NULL UNIQUE,"
+            " source TEXT,"
+            " page INTEGER,"
+            " chunk INTEGER)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source)")
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chunk_text USING fts5(text, tokenize=\"unicode61 tokenchars '-'\")"
+        )
+        self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS chunk_terms USING fts5vocab(chunk_text, 'row')")
+
+    def _delete_rows(self, rowids):
+        # Caller holds the lock, inside a transaction
+        self._conn.executemany("DELETE FROM chunk_text WHERE rowid = ?", rowids)
+        self._conn.executemany("DELETE FROM chunks WHERE rowid = ?", rowids)
+
+    def _transaction(self, fn, *args):
+        with self._lock:
+            self._df_cache.clear()
+            self._total = None
+            self._conn.execute("BEGIN")
+            try:
+                result = fn(*args)
+                self._conn.execute("COMMIT")
+                return result
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def upsert(self, ids, texts, metadatas):
+        """Index chunks, replacing any previous version of the same ids."""
+        def write():
+            rowids = list(self._conn.execute(f"SELECT rowid FROM chunks WHERE id IN ({','.join('?' * len(ids))})", list(ids)))
+            self._delete_rows(rowids)
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                metadata = metadata or {}
+                rowid = self._conn.execute(
+                    "INSERT INTO chunks (id, source, page, chunk) VALUES (?, ?, ?, ?)",
+                    (chunk_id, metadata.get("source"), metadata.get("page"), metadata.get("chunk")),
+                ).lastrowid
+                self._conn.execute("INSERT INTO chunk_text (rowid, text) VALUES (?, ?)", (rowid, text))
+
+        if ids:
+            self._transaction(write)
+
+    def delete(self, ids):
+        def write():
+            rowids = list(self._conn.execute(f"SELECT rowid FROM chunks WHERE id IN ({','.join('?' * len(ids))})", list(ids)))
+            self._delete_rows(rowids)
+
+        if ids:
+            self._transaction(write)
+
+    def delete_source(self, source):
+        def write():
+            rowids = list(self._conn.execute("SELECT rowid FROM chunks WHERE source = ?", (source,)))
+            self._delete_rows(rowids)
+            return len(rowids)
+
+        return self._transaction(write)
+
+    def clear(self):
+        def write():
+            self._conn.execute("DELETE FROM chunk_text")
+            self._conn.execute("DELETE FROM chunks")
+
+        self._transaction(write)
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def is_empty(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM chunks LIMIT 1").fetchone() is None
+
+    def _selective_terms(self, terms):
+        # Caller holds the lock
+        if self._total is None:
+            self._total = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        if len(self._df_cache) > 10000:
+            self._df_cache.clear()
+
+        selective = []
+        for term in terms:
+            df = self._df_cache.get(term)
+            if df is None:
+                row = self._conn.execute("SELECT doc FROM chunk_terms WHERE term = ?", (term,)).fetchone()
+                df = self._df_cache[term] = row[0] if row else 0
+            if df and not (df > self.min_pruned_df and df > self.max_df_ratio * self._total):
+                selective.append(term)
+        return selective
+
+    def search(self, query, k):
+        """Return up to `k` (document, BM25 score) pairs for a free-text query, best first."""
+        terms = query_terms(query)
+        if not terms:
+            return []
+        with self._lock:
+            terms = self._selective_terms(terms)
+            if not terms:
+                return []  # Only terms that appear nearly everywhere
+            rows = self._conn.execute(
+                "SELECT chunks.source, chunks.page, chunks.chunk, content.text, hits.score"
+                " FROM (SELECT rowid, bm25(chunk_text) AS score FROM chunk_text WHERE chunk_text MATCH ?"
+                "       ORDER BY score LIMIT ?) AS hits"
+                " JOIN chunks ON chunks.rowid = hits.rowid"
+                " JOIN chunk_text AS content ON content.rowid = hits.rowid"
+                " ORDER BY hits.score",
+                (fts_query(terms), k),
+            ).fetchall()
+
+        results = []
+        for source, page, chunk, text, score in rows:
+            metadata = {"source": source}
+            if page is not None:
+                metadata["page"] = page
+            if chunk is not None:
+                metadata["chunk"] = chunk
+            results.append((Document(page_content=text, metadata=metadata), -score))  # bm25() is lower-is-better
+        return results
+
+    def rebuild(self, vector_store, page_size=5000):
+        """Re-index every chunk of the vector store, reading it a page at a time."""
+        self.clear()
+        offset = 0
+        while True:
+            data = vector_store.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            if not data["ids"]:
+                break
+            self.upsert(data["ids"], data["documents"], data["metadatas"])
+            offset += len(data["ids"])
+        logging.info(f"Rebuilt lexical index with {offset} chunks")
+        return offset
+
+
+def document_key(document):
+    """Identity of a retrieved chunk across retrievers."""
+    metadata = document.metadata
+    if "page" in metadata and "chunk" in metadata:
+        return metadata.get("source"), metadata["page"], metadata["chunk"]
+    return metadata.get("source"), document.page_content
+
+
+def reciprocal_rank_fusion(rankings, k, rrf_k=60):
+    """
+    Merge ranked lists of (document, score) pairs with reciprocal rank fusion:
+    each document scores the sum of 1 / (rrf_k + rank) over the lists it
+    appears in. Returns the top `k` (document, fused score) pairs.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, (document, _) in enumerate(ranking, 1):
+            key = document_key(document)
+            entry = fused.setdefault(key, [document, 0.0])
+            entry[1] += 1.0 / (rrf_k + rank)
+    return sorted((tuple(entry) for entry in fused.values()), key=lambda pair: pair[1], reverse=True)[:k]
+
+
+def get_lexical_index():
+    """Return the lexical index of the current application."""
+    return current_app.extensions["lexical_index"]
+
+
+@click.command("rebuild-lexical-index")
+@with_appcontext
+def rebuild_lexical_index_command():
+    """Re-index the text of every chunk in the vector store for keyword search."""
+    from .vector_store import get_vector_store
+    count = get_lexical_index().rebuild(get_vector_store())
+    click.echo(f"Indexed {count} chunks.")
@@ -0,0 +1,21 @@
+from flask import current_app
+from langchain_community.llms import Ollama
+from langchain_core.language_models import FakeStreamingListLLM
+
+FAKE_LLM_RESPONSE = "This is a canned answer from the fake LLM, streamed one character at a time."
+
+
+def create_llm(config, model=None):
+    """Create the generation model selected by `LLM_MODEL` (or the given model)."""
+    model = model or config["LLM_MODEL"]
+    if model == "fake":
+        return FakeStreamingListLLM(
+            responses=[FAKE_LLM_RESPONSE],
+            sleep=config["FAKE_LLM_TOKEN_DELAY"] or None,
+        )
+    return Ollama(model=model)
+
+
+def get_llm():
+    """Return the generation model of the current application."""
+    return current_app.extensions["llm"]
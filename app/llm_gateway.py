@@ -0,0 +1,240 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Any, Iterator, List, Optional
+
+from flask import current_app
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models import LLM
+from langchain_core.outputs import GenerationChunk
+
+from .metrics import record
+
+
+class LLMOverloaded(Exception):
+    """The LLM queue is full, or a request waited longer than the queue timeout."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Flight:
+    """One generation in progress, whose chunks are replayed to every caller with the same prompt."""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.condition = threading.Condition()
+
+    def publish(self, chunk):
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def finish(self, error=None):
+        with self.condition:
+            self.done = True
+            self.error = error
+            self.condition.notify_all()
+
+    def follow(self):
+        position = 0
+        while True:
+            with self.condition:
+                while position == len(self.chunks) and not self.done:
+                    self.condition.wait()
+                chunks, done, error = self.chunks[position:], self.done, self.error
+            position += len(chunks)
+            yield from chunks
+            if done and position == len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+
+class LLMGateway:
+    """
+    Admission control in front of the Ollama server.
+
+    At most `concurrency` generations run at once (0 for no limit); further
+    calls wait in a first-come, first-served queue of at most `max_queue`
+    entries. A call arriving at a full queue, or waiting more than `timeout`
+    seconds, raises LLMOverloaded with a `retry_after` estimate in seconds.
+
+    With `coalesce`, a call whose model, prompt and stop words match a
+    generation already queued or running does not queue at all: it follows
+    that generation and receives the same chunks as they are produced.
+    """
+
+    def __init__(self, concurrency=2, max_queue=32, timeout=30, coalesce=True, window=1024):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.coalesce = coalesce
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters = deque()
+        self._flights = {}
+        self._waits = deque(maxlen=window)
+        self._generation_seconds = None  # Moving average, for the retry hint
+        self.requests = self.coalesced = self.rejected = self.timed_out = self.failed = 0
+
+    def _retry_after(self):
+        # Caller holds the lock
+        per_generation = self._generation_seconds or 1.0
+        rounds = (len(self._waiters) + 1) / (self.concurrency or 1)
+        return max(1, math.ceil(rounds * per_generation))
+
+    def check(self):
+        """Raise LLMOverloaded if a new call would be turned away right now."""
+        with self._lock:
+            if self.concurrency and len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise LLMOverloaded("The language model is overloaded, please retry later", self._retry_after())
+
+    def acquire(self):
+        """Wait for a generation slot, in arrival order."""
+        start = time.monotonic()
+        with self._lock:
+            if not self.concurrency or (self._active < self.concurrency and not self._waiters):
+                self._active += 1
+                self._waits.append(0.0)
+                record("llm_queue_wait", 0.0)
+                return
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                logging.warning(f"LLM queue full ({len(self._waiters)} waiting), rejecting a call")
+                raise LLMOverloaded("The language model is overloaded, please retry later", self._retry_after())
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+
+        granted = waiter.wait(self.timeout or None)
+        with self._lock:
+            if not granted and not waiter.is_set():
+                self._waiters.remove(waiter)
+                self.timed_out += 1
+                logging.warning(f"LLM call timed out after waiting {self.timeout} s in the queue")
+                raise LLMOverloaded(f"No language model slot freed up within {self.timeout} s, please retry later",
+                                    self._retry_after())
+            wait = time.monotonic() - start
+            self._waits.append(wait)
+        record("llm_queue_wait", wait)
+
+    def release(self, seconds=None):
+        with self._lock:
+            if seconds is not None:
+                average = self._generation_seconds
+                self._generation_seconds = seconds if average is None else 0.8 * average + 0.2 * seconds
+            if self._waiters:
+                self._waiters.popleft().set()  # The slot passes straight to the next in line
+            else:
+                self._active -= 1
+
+    def generate(self, llm, prompt, stop=None):
+        """Stream the text of `llm` for `prompt` under the concurrency limit."""
+        key = (type(llm).__name__, getattr(llm, "model", None), prompt, tuple(stop) if stop else None)
+        with self._lock:
+            self.requests += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                if self.coalesce:
+                    self._flights[key] = flight
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            yield from flight.follow()
+            return
+
+        try:
+            self.acquire()
+            start = time.monotonic()
+            try:
+                for chunk in llm.stream(prompt, stop=stop):
+                    flight.publish(chunk)
+                    yield chunk
+            finally:
+                seconds = time.monotonic() - start
+                self.release(seconds)
+                record("llm_generation", seconds)
+        except GeneratorExit:
+            # The caller went away; whoever followed this generation cannot be served by it
+            flight.finish(LLMOverloaded("The generation was cancelled, please retry", 1))
+            raise
+        except Exception as e:
+            if not isinstance(e, LLMOverloaded):
+                with self._lock:
+                    self.failed += 1
+            flight.finish(e)
+            raise
+        else:
+            flight.finish()
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                "concurrency": self.concurrency,
+                "active": self._active,
+                "queued": len(self._waiters),
+                "max_queue": self.max_queue,
+                "requests": self.requests,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "failed": self.failed,
+                "wait_ms": {
+                    "p50": round(waits[len(waits) // 2] * 1000, 1) if waits else None,
+                    "p95": round(waits[max(int(len(waits) * 0.95) - 1, 0)] * 1000, 1) if waits else None,
+                    "max": round(waits[-1] * 1000, 1) if waits else None,
+                },
+                "generation_s_avg": round(self._generation_seconds, 3) if self._generation_seconds is not None else None,
+            }
+
+
+class GatewayLLM(LLM):
+    """An LLM whose calls to the wrapped `llm` go through an LLMGateway."""
+
+    llm: Any
+    gateway: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return f"gateway-{self.llm._llm_type}"
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        for text in self.gateway.generate(self.llm, prompt, stop):
+            chunk = GenerationChunk(text=text)
+            if run_manager:
+                run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
+
+def get_llm_gateway():
+    """Return the LLM gateway of the current application."""
+    return current_app.extensions["llm_gateway"]
@@ -0,0 +1,124 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Stage durations of the request being handled by this thread, see begin_request()
+_request_timings = contextvars.ContextVar("pdfqueryai_request_timings", default=None)
+
+
+class Histogram:
+    """
+    Process-wide latency histogram with one label, rendered in the Prometheus
+    text format. Observing is a bisect and three additions under a lock.
+    """
+
+    def __init__(self, name, documentation, label, buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = buckets
+        self._series = {}  # label value -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(value)
+            if series is None:
+                series = self._series[value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {value: (list(counts), total, count) for value, (counts, total, count) in self._series.items()}
+        for value, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{self.label}="{value}",le="{le}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{self.label}="{value}"}} {total}')
+            lines.append(f'{self.name}_count{{{self.label}="{value}"}} {count}')
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "pdfqueryai_stage_seconds",
+    "Time spent in each stage of answering questions and ingesting PDFs.",
+    "stage",
+)
+REQUEST_SECONDS = Histogram(
+    "pdfqueryai_request_seconds",
+    "Time from receiving a request to sending the response headers, by endpoint.",
+    "endpoint",
+)
+
+
+def record(stage, seconds):
+    """Observe the duration of a stage, and add it to the current request's breakdown."""
+    STAGE_SECONDS.observe(stage, seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def begin_request():
+    """Start collecting the stage durations of the request handled by this thread."""
+    _request_timings.set({})
+
+
+def request_timings():
+    """Stage durations recorded so far for the current request, rounded."""
+    return {stage: round(seconds, 4) for stage, seconds in (_request_timings.get() or {}).items()}
+
+
+def _gauge(name, documentation, value, kind="gauge"):
+    return [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}", f"{name} {value}"]
+
+
+def render_metrics(extensions):
+    """The /metrics page: the histograms, then gauges and counters of the shared services."""
+    lines = STAGE_SECONDS.render() + REQUEST_SECONDS.render()
+
+    gateway = extensions.get("llm_gateway")
+    if gateway is not None:
+        stats = gateway.stats()
+        lines += _gauge("pdfqueryai_llm_active", "Generations running.", stats["active"])
+        lines += _gauge("pdfqueryai_llm_queued", "LLM calls waiting for a generation slot.", stats["queued"])
+        for counter, documentation in (
+            ("requests", "LLM calls made."),
+            ("coalesced", "LLM calls served by an identical generation already in flight."),
+            ("rejected", "LLM calls turned away by a full queue."),
+            ("timed_out", "LLM calls that waited longer than the queue timeout."),
+            ("failed", "LLM calls that failed."),
+        ):
+            lines += _gauge(f"pdfqueryai_llm_{counter}_total", documentation, stats[counter], "counter")
+
+    embedding = extensions.get("embedding")
+    if hasattr(embedding, "stats"):
+        stats = embedding.stats()
+        for counter, documentation in (
+            ("memory_hits", "Embeddings found in the in-memory cache."),
+            ("disk_hits", "Embeddings found in the on-disk cache."),
+            ("misses", "Texts embedded by the model."),
+        ):
+            lines += _gauge(f"pdfqueryai_embedding_cache_{counter}_total", documentation, stats[counter], "counter")
+
+    return "\n".join(lines) + "\n"
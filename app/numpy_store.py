@@ -0,0 +1,328 @@
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .vector_store import VectorBackend
+
+# Metadata fields stored in their own columns; any other field goes to `extra`
+COLUMNS = ("source", "page", "chunk")
+
+
+class NumpyBackend(VectorBackend):
+    """
+    Embeddings in a memory-mapped NumPy matrix (vectors.<dtype>), chunk texts
+    and metadata in a SQLite side table (chunks.sqlite3) with one column per
+    metadata field. Search is exhaustive: the matrix is scanned `block_rows`
+    rows at a time with one matrix product per block for a whole batch of
+    queries, so it is exact up to the storage precision and needs no index.
+    Blocks are kept small enough for the float32 copy of a float16 or int8
+    block to stay in the CPU cache.
+
+    dtype is "float32", "float16" (half the memory) or "int8" (a quarter:
+    each row is scaled to [-127, 127]). With int8 the best `rescore * k`
+    rows are rescored with a float16 copy of the matrix that stays on disk
+    and is only read for those rows.
+
+    Relevance scores follow the Chroma store's, 1 - d / sqrt(2) with d the
+    squared L2 distance, so RETRIEVAL_SCORE_THRESHOLD means the same with
+    either backend. Deleted rows get an infinite norm, which keeps them out
+    of every result, and are reused by later inserts.
+    """
+
+    DTYPES = ("float32", "float16", "int8")
+
+    def __init__(self, directory, embedding_function, dtype="int8", rescore=4, block_rows=2048):
+        if dtype not in self.DTYPES:
+            raise ValueError(f"Unknown dtype {dtype!r}, expected one of: {', '.join(self.DTYPES)}")
+        self.directory = directory
+        self.embedding_function = embedding_function
+        self.rescore = rescore
+        self.block_rows = block_rows
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, "chunks.sqlite3"), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " row INTEGER PRIMARY KEY,"
+            " id TEXT NOT NULL UNIQUE,"
+            " source TEXT,"
+            " page INTEGER,"
+            " chunk INTEGER,"
+            " document TEXT,"
+            " extra TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source)")
+
+        meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+        if meta.get("dtype", dtype) != dtype:
+            logging.warning(f"Vector store at {directory} holds {meta['dtype']} vectors, ignoring dtype={dtype}")
+        self.dtype = meta.get("dtype", dtype)
+        self.dim = int(meta["dim"]) if "dim" in meta else None
+        self.capacity = int(meta.get("capacity", 0))
+
+        rows = np.fromiter((row for row, in self._conn.execute("SELECT row FROM chunks")), dtype=np.int64)
+        self._size = int(rows.max()) + 1 if len(rows) else 0  # Rows in use or freed, the scanned part
+        self._count = len(rows)
+        used = np.zeros(self._size, dtype=bool)
+        used[rows] = True
+        self._free = [int(row) for row in np.flatnonzero(~used)[::-1]]  # Popped lowest first
+        self._vectors = self._norms = self._scales = self._rescore_vectors = None
+        if self.dim is not None:
+            self._map()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _map(self):
+        """Map the matrix files at the current capacity, creating or extending them."""
+        def open_memmap(name, dtype, shape):
+            path = self._path(name)
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            with open(path, "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+            return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+        shape = (self.capacity, self.dim)
+        self._vectors = open_memmap(f"vectors.{self.dtype}", self.dtype, shape)
+        self._norms = open_memmap("norms.float32", np.float32, (self.capacity,))
+        if self.dtype == "int8":
+            self._scales = open_memmap("scales.float32", np.float32, (self.capacity,))
+            self._rescore_vectors = open_memmap("rescore.float16", np.float16, shape)
+
+    def _reserve(self, dim, rows):
+        """Make room for `rows` rows in use, growing the files by doubling."""
+        if self.dim is None:
+            self.dim = dim
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?), ('dtype', ?)", (str(dim), self.dtype))
+        elif dim != self.dim:
+            raise ValueError(f"Embeddings have {dim} dimensions, the vector store holds {self.dim}")
+        if rows <= self.capacity and self._vectors is not None:
+            return
+        previous = self.capacity
+        self.capacity = max(rows, 2 * self.capacity, 1024)
+        self._map()
+        self._norms[previous:] = np.inf
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('capacity', ?)", (str(self.capacity),))
+
+    def count(self):
+        return self._count
+
+    def _rows(self, ids):
+        rows = {}
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            rows.update(self._conn.execute(
+                f"SELECT id, row FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch
+            ).fetchall())
+        return rows
+
+    def upsert(self, ids, texts, metadatas, embeddings):
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        with self._lock:
+            existing = self._rows(list(ids))
+            # Rows of the new ids are planned on copies: the bookkeeping only
+            # changes once the chunks are stored (_reserve raises on a
+            # dimension mismatch)
+            free, size, added = list(self._free), self._size, {}
+            rows = []
+            for chunk_id in ids:
+                row = existing.get(chunk_id, added.get(chunk_id))
+                if row is None:
+                    row = added[chunk_id] = free.pop() if free else size
+                    size = max(size, row + 1)
+                rows.append(row)
+            self._reserve(vectors.shape[1], size)
+
+            rows = np.asarray(rows)
+            stored = vectors.astype(np.float16) if self.dtype != "float32" else vectors
+            if self.dtype == "int8":
+                scales = np.abs(vectors).max(axis=1) / 127
+                scales[scales == 0] = 1
+                self._vectors[rows] = np.round(vectors / scales[:, None]).astype(np.int8)
+                self._scales[rows] = scales
+                self._rescore_vectors[rows] = stored
+            else:
+                self._vectors[rows] = stored
+            # Written last: a finite norm makes the row searchable
+            self._norms[rows] = np.einsum("ij,ij->i", stored, stored, dtype=np.float32)
+
+            records = []
+            for row, chunk_id, text, metadata in zip(rows.tolist(), ids, texts, metadatas):
+                metadata = metadata or {}
+                extra = {key: value for key, value in metadata.items() if key not in COLUMNS}
+                records.append((row, chunk_id, *(metadata.get(column) for column in COLUMNS), text,
+                                json.dumps(extra) if extra else None))
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (row, id, source, page, chunk, document, extra)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    records,
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                if added:
+                    self._norms[np.asarray(list(added.values()))] = np.inf
+                raise
+            self._flush()
+            self._free, self._size = free, size
+            self._count += len(added)
+
+    def _flush(self):
+        for array in (self._vectors, self._norms, self._scales, self._rescore_vectors):
+            if array is not None:
+                array.flush()
+
+    def _delete_rows(self, rows):
+        if not rows:
+            return 0
+        self._norms[np.asarray(rows)] = np.inf
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.executemany("DELETE FROM chunks WHERE row = ?", [(row,) for row in rows])
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._flush()
+        self._free.extend(rows)
+        self._free.sort(reverse=True)
+        self._count -= len(rows)
+        return len(rows)
+
+    def delete(self, ids):
+        with self._lock:
+            self._delete_rows(list(self._rows(list(ids)).values()))
+
+    def delete_source(self, source):
+        with self._lock:
+            return self._delete_rows([row for row, in self._conn.execute("SELECT row FROM chunks WHERE source = ?", (source,))])
+
+    def get(self, ids=None, include=("documents", "metadatas"), limit=None, offset=None):
+        query = "SELECT row, id, source, page, chunk, document, extra FROM chunks"
+        params = []
+        if ids is not None:
+            ids = [ids] if isinstance(ids, str) else list(ids)
+            query += f" WHERE id IN ({','.join('?' * len(ids))})"
+            params += ids
+        query += " ORDER BY row"
+        if limit is not None or offset:
+            query += " LIMIT ? OFFSET ?"
+            params += [-1 if limit is None else limit, offset or 0]
+        with self._lock:
+            records = self._conn.execute(query, params).fetchall()
+
+        result = {"ids": [record[1] for record in records]}
+        if "documents" in include:
+            result["documents"] = [record[5] for record in records]
+        if "metadatas" in include:
+            result["metadatas"] = [self._metadata(record) for record in records]
+        if "embeddings" in include:
+            rows = np.asarray([record[0] for record in records], dtype=np.int64)
+            source = self._rescore_vectors if self.dtype == "int8" else self._vectors
+            result["embeddings"] = np.asarray(source[rows], dtype=np.float32) if len(rows) else np.zeros((0, self.dim or 0))
+        return result
+
+    @staticmethod
+    def _metadata(record):
+        metadata = {column: value for column, value in zip(COLUMNS, record[2:5]) if value is not None}
+        if record[6]:
+            metadata.update(json.loads(record[6]))
+        return metadata
+
+    def search(self, query, k, score_threshold=None):
+        results = self.search_by_vectors([self.embedding_function.embed_query(query)], k)[0]
+        if score_threshold is not None:
+            results = [(document, score) for document, score in results if score >= score_threshold]
+        return results
+
+    def search_by_vectors(self, queries, k):
+        """
+        Search for a batch of query embeddings at once. Returns, for each
+        query, up to `k` (document, relevance score) pairs, best first.
+        """
+        rows, distances = self.top_k(queries, k)
+        rows = [query_rows.tolist() for query_rows in rows]  # Python ints, for SQLite
+        found = sorted({row for query_rows in rows for row in query_rows})
+        records = {}
+        for start in range(0, len(found), 500):
+            batch = found[start:start + 500]
+            with self._lock:
+                records.update((record[0], record) for record in self._conn.execute(
+                    "SELECT row, id, source, page, chunk, document, extra FROM chunks"
+                    f" WHERE row IN ({','.join('?' * len(batch))})", batch
+                ))
+
+        results = []
+        for query_rows, query_distances in zip(rows, distances):
+            results.append([
+                (Document(page_content=records[row][5], metadata=self._metadata(records[row])),
+                 1.0 - float(distance) / math.sqrt(2))
+                for row, distance in zip(query_rows, query_distances)
+                if row in records  # A row deleted since the scan
+            ])
+        return results
+
+    def top_k(self, queries, k):
+        """
+        Rows and squared L2 distances of the `k` nearest chunks of each query,
+        nearest first, as two lists of arrays.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(len(queries), -1)
+        # Taken once: inserts may remap the files while the scan runs
+        vectors, norms, scales, size = self._vectors, self._norms, self._scales, self._size
+        if vectors is None or not size or not len(queries):
+            return [np.zeros(0, dtype=np.int64)] * len(queries), [np.zeros(0, dtype=np.float32)] * len(queries)
+
+        candidates = min(size, k * self.rescore if scales is not None else k)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        best = np.zeros((len(queries), 0), dtype=np.float32)
+        for start in range(0, size, self.block_rows):
+            stop = min(size, start + self.block_rows)
+            products = queries @ np.asarray(vectors[start:stop], dtype=np.float32).T
+            if scales is not None:
+                products *= scales[start:stop]
+            # The query norm is the same for every row, it is added at the end
+            partial = norms[start:stop] - 2 * products
+            merged = np.concatenate([best, partial], axis=1)
+            merged_rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, stop), partial.shape)], axis=1)
+            if merged.shape[1] > candidates:
+                keep = np.argpartition(merged, candidates - 1, axis=1)[:, :candidates]
+                merged = np.take_along_axis(merged, keep, axis=1)
+                merged_rows = np.take_along_axis(merged_rows, keep, axis=1)
+            best, best_rows = merged, merged_rows
+
+        query_norms = np.einsum("ij,ij->i", queries, queries)
+        all_rows, all_distances = [], []
+        for query, query_norm, rows, distances in zip(queries, query_norms, best_rows, best):
+            rows, distances = rows[np.isfinite(distances)], distances[np.isfinite(distances)]
+            if scales is not None and len(rows):
+                # Exact distances for the int8 candidates, from the float16 copy
+                order = np.argsort(rows)
+                rows = rows[order]
+                exact = np.asarray(self._rescore_vectors[rows], dtype=np.float32)
+                distances = norms[rows] - 2 * (exact @ query)
+            order = np.argsort(distances)[:k]
+            all_rows.append(rows[order])
+            all_distances.append(np.maximum(distances[order] + query_norm, 0))
+        return all_rows, all_distances
+
+    def drop(self):
+        with self._lock:
+            self._vectors = self._norms = self._scales = self._rescore_vectors = None
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM meta")
+            self._conn.close()
+            for name in os.listdir(self.directory):
+                if name.startswith(("vectors.", "norms.", "scales.", "rescore.")):
+                    os.remove(self._path(name))
@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfplumber
+from pdfminer.pdftypes import PDFObjRef, PDFStream
+
+
+def count_pages(path):
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+def parse_pages(path, numbers):
+    """Extract the text of the given pages of a PDF. Runs in a worker process."""
+    texts = []
+    with pdfplumber.open(path) as pdf:
+        for number in numbers:
+            page = pdf.pages[number]
+            texts.append((number, page.extract_text() or ""))
+            page.close()  # Drop the cached layout objects of the page
+    return texts
+
+
+def _digest(obj, memo):
+    """Hash of a PDF object and everything it references, except parent links."""
+    if isinstance(obj, PDFObjRef):
+        if obj.objid not in memo:
+            memo[obj.objid] = b"cycle"  # Until resolved, for self-referencing objects
+            memo[obj.objid] = _digest(obj.resolve(), memo)
+        return memo[obj.objid]
+    digest = hashlib.sha1()
+    if isinstance(obj, PDFStream):
+        digest.update(_digest(obj.attrs, memo))
+        digest.update(obj.get_rawdata() or b"")
+    elif isinstance(obj, dict):
+        for key in sorted(obj):
+            if key not in ("Parent", "P"):
+                digest.update(repr(key).encode())
+                digest.update(_digest(obj[key], memo))
+    elif isinstance(obj, (list, tuple)):
+        digest.update(b"[")
+        for item in obj:
+            digest.update(_digest(item, memo))
+    else:
+        digest.update(repr(obj).encode())
+    return digest.digest()
+
+
+def page_fingerprints(path):
+    """
+    Fingerprint of every page of a PDF: a hash of its content streams,
+    resources (fonts included) and boxes, as stored in the file. Pages with
+    the same fingerprint have the same text, and computing it takes no layout
+    analysis, so it costs a small fraction of extracting the text.
+    """
+    memo = {}
+    with pdfplumber.open(path) as pdf:
+        return [_digest(page.page_obj.attrs, memo).hex() for page in pdf.pages]
+
+
+class PageParser:
+    """
+    Page-parallel PDF text extraction.
+
+    pdfplumber is pure Python and CPU-bound, so pages are split into ranges and
+    extracted by a shared pool of worker processes. `parse` yields pages in
+    order while keeping only a bounded number of ranges in flight, so memory
+    stays flat regardless of the document size. With `workers` set to 0 or 1
+    pages are extracted serially in the calling process.
+    """
+
+    def __init__(self, workers=None, pages_per_task=8):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.pages_per_task = pages_per_task
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Spawned rather than forked: the server process runs threads
+                # (request handlers, ingestion workers, ONNX runtime)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def parse(self, path, pages=None):
+        """
+        Yield (page_number, text) for every page of the PDF, or only for the
+        page numbers in `pages`, in order.
+        """
+        numbers = range(count_pages(path)) if pages is None else sorted(pages)
+        tasks = [numbers[start:start + self.pages_per_task] for start in range(0, len(numbers), self.pages_per_task)]
+
+        if self.workers <= 1 or len(tasks) <= 1:
+            for task in tasks:
+                yield from parse_pages(path, task)
+            return
+
+        in_flight = deque()
+        max_in_flight = self.workers * 2
+        pending = iter(tasks)
+        for task in pending:
+            in_flight.append(self.executor.submit(parse_pages, path, task))
+            if len(in_flight) >= max_in_flight:
+                break
+
+        while in_flight:
+            pages = in_flight.popleft().result()
+            next_task = next(pending, None)
+            if next_task is not None:
+                in_flight.append(self.executor.submit(parse_pages, path, next_task))
+            yield from pages
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                logging.info("Shutting down PDF parsing pool")
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
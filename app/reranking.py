@@ -0,0 +1,123 @@
+import logging
+import threading
+
+import numpy as np
+
+
+class Reranker:
+    """
+    Second-stage scoring of retrieved chunks: the retriever fetches
+    `candidates` chunks cheaply, the reranker rescores them against the query
+    and only the best `top_k` go on to the prompt. Subclasses implement
+    `score(query, texts)`, running the model over `batch_size` texts at a time.
+    """
+
+    def __init__(self, candidates=40, top_k=8, batch_size=32):
+        self.candidates = candidates
+        self.top_k = top_k
+        self.batch_size = batch_size
+
+    @property
+    def loaded(self):
+        return True
+
+    def load(self):
+        """Load the model now rather than on the first query."""
+
+    def score(self, query, texts):
+        raise NotImplementedError
+
+    def rerank(self, query, scored_documents):
+        """Rescore (document, score) pairs and return the best `top_k`, best first."""
+        if not scored_documents:
+            return []
+        documents = [document for document, _ in scored_documents]
+        scores = self.score(query, [document.page_content for document in documents])
+        ranked = sorted(zip(documents, scores), key=lambda pair: pair[1], reverse=True)
+        return [(document, float(score)) for document, score in ranked[:self.top_k]]
+
+
+class EmbeddingReranker(Reranker):
+    """Cosine similarity between the query and the full text of each candidate."""
+
+    def __init__(self, embedding, **kwargs):
+        super().__init__(**kwargs)
+        self.embedding = embedding
+
+    @property
+    def loaded(self):
+        return getattr(self.embedding, "loaded", True)
+
+    def load(self):
+        if hasattr(self.embedding, "load"):
+            self.embedding.load()
+
+    def score(self, query, texts):
+        query_vector = np.asarray(self.embedding.embed_query(query), dtype=np.float32)
+        matrix = np.asarray(
+            [vector for start in range(0, len(texts), self.batch_size)
+             for vector in self.embedding.embed_documents(texts[start:start + self.batch_size])],
+            dtype=np.float32,
+        )
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query_vector) or 1.0)
+        return (matrix @ query_vector) / np.where(norms > 0, norms, 1.0)
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    A small cross-encoder reading the query and each candidate together,
+    through fastembed's ONNX runtime (fastembed >= 0.4).
+    """
+
+    def __init__(self, model_name, **kwargs):
+        super().__init__(**kwargs)
+        try:
+            from fastembed.rerank.cross_encoder import TextCrossEncoder
+        except ImportError:
+            raise RuntimeError("The cross-encoder reranker needs fastembed >= 0.4 (pip install -U fastembed)")
+        self.model_name = model_name
+        self._factory = TextCrossEncoder
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def load(self):
+        model = self._model
+        if model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._factory(model_name=self.model_name)
+                    logging.info(f"Loaded cross-encoder {self.model_name}")
+                model = self._model
+        return model
+
+    def score(self, query, texts):
+        return list(self.load().rerank(query, texts, batch_size=self.batch_size))
+
+
+def create_reranker(config, embedding):
+    """
+    Create the reranker selected by `RERANKER`, or None. Its model is loaded
+    on first use, or by the warmup.
+    """
+    kind = config["RERANKER"]
+    if not kind:
+        return None
+
+    options = dict(candidates=config["RERANK_CANDIDATES"], top_k=config["RERANK_TOP_K"], batch_size=config["RERANK_BATCH_SIZE"])
+    model_name = config["RERANK_MODEL"]
+    if kind == "embedding":
+        if model_name:
+            from .embeddings import create_embedding
+            embedding = create_embedding({"EMBEDDING_MODEL": model_name})
+        reranker = EmbeddingReranker(embedding, **options)
+    elif kind == "cross-encoder":
+        reranker = CrossEncoderReranker(model_name or "Xenova/ms-marco-MiniLM-L-6-v2", **options)
+    else:
+        raise ValueError(f"Unknown RERANKER: {kind}")
+
+    logging.info(f"Using {kind} reranker ({model_name or 'default model'})")
+    return reranker
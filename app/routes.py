@@ -1,82 +1,75 @@
 
 
-from flask import Flask, request, jsonify, render_template, Blueprint, send_from_directory
-from langchain_community.llms import Ollama
-from langchain_community.vectorstores import Chroma
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
-from langchain_community.document_loaders import PDFPlumberLoader
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_retrieval_chain
-from langchain_core.messages import HumanMessage, AIMessage
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.chains.history_aware_retriever import create_history_aware_retriever
+import click
+from flask import Flask, Response, current_app, g, request, jsonify, render_template, Blueprint, send_from_directory, stream_with_context
+from flask.cli import with_appcontext
+from .answer_cache import get_answer_cache, normalize_query
+from .catalog import get_catalog
+from .chains import RETRIEVAL_MODES, get_chain_registry
+from .chat_history import get_chat_history
+from .embeddings import CachedEmbeddings, embed_queries, get_embedding
+from .ingestion import IngestionBusy, get_ingestion_queue
+from .llm import get_llm
+from .llm_gateway import LLMOverloaded, get_llm_gateway
+from .metrics import REQUEST_SECONDS, begin_request, record, render_metrics, request_timings, timed
 from .prompts import PROMPTS
+from .usage import get_usage, usage_shares
+from .vector_store import get_vector_store
+from .warmup import get_warmup
 
 import os
+import json
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import shutil
 import hashlib
+import tempfile
+import time
 import logging
+import uuid
+from collections import Counter
 
 # Define a blueprint
 bp = Blueprint('main', __name__)
 
 # Folder paths
 folder_path = "data/db"
+vector_dir = "data/vectors"
 pdf_dir = "data/pdf"
+jobs_dir = "data/jobs"
+upload_tmp_dir = "data/tmp"
+catalog_path = "data/catalog.sqlite3"
+lexical_index_path = "data/lexical.sqlite3"
+embedding_cache_dir = "data/embedding_cache"
+usage_path = "data/usage.sqlite3"
 
 # Path to the PDF directory for viewing PDFs
 PDF_DIRECTORY = os.path.join(os.path.dirname(__file__), '..', 'data', 'pdf')
 
-# Dictionary to keep track of PDF usage counts
-pdf_usage_count = {}
-query_usage_count = {}
-chat_history = []
-
-# Initialize the Ollama model
-cached_llm = Ollama(model="llama3.1")
-
-# Initialize the embedding model
-embedding = FastEmbedEmbeddings()
-
-# Initialize text splitter
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=2048,  # Increased chunk size for better context
-    chunk_overlap=100,  # Increased overlap to maintain context between chunks
-    length_function=len,
-    is_separator_regex=False
-)
-
-def initialize_vector_store():
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path)
-    # Perform a test operation to ensure proper initialization
-    try:
-        vector_store = Chroma(persist_directory=folder_path, embedding_function=embedding)
-        # Example check to validate database
-        if not vector_store.get():
-            print("Vector store is empty or not properly initialized.")
-            # Additional initialization steps if needed
-        return vector_store
-    except Exception as e:
-        print(f"Error initializing vector store: {str(e)}")
-        return None
-
-initialize_vector_store()
-
-if not os.path.exists(folder_path):
-    print(f"Error: Directory {folder_path} does not exist.")
+# Cookie carrying the chat session id of browser clients
+SESSION_COOKIE = "pdfqueryai_session"
 
 def file_exists(file_path):
     return os.path.isfile(file_path)
 
-def compute_file_hash(file):
-    """Compute the MD5 hash of a file."""
+def save_upload(stream, directory):
+    """
+    Stream a file to a temporary file in `directory`, hashing it on the way.
+    Returns the temporary path, the MD5 hash and the size in bytes.
+    """
     hash_md5 = hashlib.md5()
-    for chunk in iter(lambda: file.read(4096), b""):
-        hash_md5.update(chunk)
-    file.seek(0)  # Reset file pointer
-    return hash_md5.hexdigest()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+                hash_md5.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return tmp_path, hash_md5.hexdigest(), size
 
 
 if not os.path.exists(folder_path):
@@ -85,15 +78,78 @@ if not os.path.exists(folder_path):
 if not os.path.exists(pdf_dir):
     os.makedirs(pdf_dir)
 
-def preprocess_text(text):
-    # Implement text cleaning steps
-    text = text.strip().replace('\n', ' ').replace('\r', '')
-    return text
-
-class Document:
-    def __init__(self, page_content, metadata=None):
-        self.page_content = page_content
-        self.metadata = metadata or {}
+if not os.path.exists(upload_tmp_dir):
+    os.makedirs(upload_tmp_dir)
+
+@bp.before_app_request
+def start_background_workers():
+    # Started on the first request rather than in create_app so that the
+    # reloader's watcher process never resumes ingestion jobs itself
+    get_ingestion_queue().start()
+
+@bp.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    begin_request()
+
+@bp.after_app_request
+def observe_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        REQUEST_SECONDS.observe(request.endpoint or "unmatched", time.perf_counter() - started)
+    logging.debug("%s %s %s", request.method, request.path, response.status_code)
+    return response
+
+def get_session_id(json_content):
+    """
+    Chat session of the request: an explicit `session_id` in the JSON body,
+    else the session cookie, else a new session (sent back as a cookie).
+    """
+    session_id = json_content.get("session_id") or request.cookies.get(SESSION_COOKIE)
+    if not session_id:
+        session_id = g.new_session_id = uuid.uuid4().hex
+    return str(session_id)[:64]
+
+@bp.after_app_request
+def set_session_cookie(response):
+    session_id = g.pop("new_session_id", None)
+    if session_id:
+        response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="Lax")
+    return response
+
+@bp.app_errorhandler(LLMOverloaded)
+def llm_overloaded(e):
+    response = jsonify({"error": str(e), "retry_after": e.retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+@bp.route("/health", methods=["GET"])
+def health():
+    # Liveness: answers as soon as the app is up, whatever is still loading
+    warmup = get_warmup()
+    return jsonify({
+        "status": "ok",
+        "ready": warmup.ready(),
+        "warming_up": warmup.running,
+        "components": warmup.components(),
+        "warmup_seconds": warmup.timings,
+        "warmup_error": warmup.error,
+    })
+
+@bp.route("/health/ready", methods=["GET"])
+def health_ready():
+    # Readiness: 503 until questions can be answered without loading a model
+    ready = get_warmup().ready()
+    return jsonify({"ready": ready}), 200 if ready else 503
+
+@bp.route("/warmup", methods=["POST"])
+def warmup():
+    json_content = request.get_json(silent=True) or {}
+    try:
+        return jsonify({"warmup_seconds": get_warmup().run(llm=json_content.get("llm", True))})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 @bp.route('/')
 def home():
@@ -112,62 +168,78 @@ def get_prompts():
 @bp.route("/pdfManagement")
 def pdfManagement():
     try:
-        # Fetch the PDF and document statistics
-        pdf_files = os.listdir("data/pdf")  # Adjust the path as needed
-        vector_store = Chroma(persist_directory="data/db", embedding_function=embedding)
-        db_data = vector_store.get()
-        document_count = len(db_data.get("metadatas", []))
-        
-        return render_template("pdfManagement.html", pdf_count=len(pdf_files), doc_count=document_count)
+        # Fetch the PDF and document statistics from the catalog
+        pdf_count, document_count = get_catalog().totals()
+
+        return render_template("pdfManagement.html", pdf_count=pdf_count, doc_count=document_count)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
 @bp.route("/ai", methods=["POST"])
 def aiPost():
-    query_usage_count = {}
-    print("POST /ai called")
     json_content = request.json
     query = json_content.get("query")
 
     if not query:
         return jsonify({"error": "No 'query' found in JSON request"}), 400
 
-    print(f"query: {query}")
+    logging.debug("ai query=%r", query)
+
+    # Turn the request away now rather than after the stream has started
+    get_llm_gateway().check()
+    llm = get_llm()
+
+    if json_content.get("stream"):
+        def generate():
+            answer = ""
+            try:
+                for token in llm.stream(query):
+                    answer += token
+                    yield stream_event("token", token=token)
+                yield stream_event("final", answer=answer)
+            except LLMOverloaded as e:
+                yield stream_event("error", error=str(e), retry_after=e.retry_after)
+            except Exception as e:
+                yield stream_event("error", error=str(e))
 
-    response = cached_llm.invoke(query)
+        return stream_response(generate())
 
-    print(response)
+    response = llm.invoke(query)
+    logging.debug("ai answer=%r", response)
 
     response_answer = {"answer": response}
     return jsonify(response_answer)
 
 @bp.route("/ask_pdf", methods=["POST"])
 def askPDFPost():
-    query_usage_count = {}# Added for tracking PDF usage count
-    print("POST /ask_pdf called")
-
     json_content = request.json
     query = json_content.get("query")
     prompt_type = json_content.get("promptType")  # Get the prompt type
+    debug = bool(json_content.get("debug"))  # Add the per-stage timing breakdown
 
     if not query:
         return jsonify({"error": "No 'query' found in JSON request"}), 400
 
-    print(f"**query**: {query}")
-    print(f"**prompt_type**: {prompt_type}")
+    logging.debug("ask_pdf query=%r prompt_type=%r", query, prompt_type)
 
-    # Dynamically select the prompt based on prompt_type
-    prompt = PROMPTS.get(prompt_type)
-    if not prompt:
+    # Select the retrieval chain for the prompt type (built once, then reused)
+    chain_registry = get_chain_registry()
+    retrieval_chain = chain_registry.get(prompt_type)
+    if not retrieval_chain:
         return jsonify({"error": "Unknown prompt type"}), 400
 
+    retrieval_mode = json_content.get("retrieval") or chain_registry.retrieval_mode
+    if retrieval_mode not in RETRIEVAL_MODES:
+        return jsonify({"error": f"Unknown retrieval mode, expected one of: {', '.join(RETRIEVAL_MODES)}"}), 400
+
+    session_id = get_session_id(json_content)
+    chat_history = get_chat_history()
+
     try:
-        print("Loading vector store")
-        vector_store = Chroma(persist_directory=folder_path, embedding_function=embedding)
-        db_data = vector_store.get()
+        vector_store = get_vector_store()
 
-        if not db_data.get("metadatas"):
-            print("Call ended since there are no documents available to process the query.")
+        if not vector_store.count():
+            logging.info("ask_pdf answered without retrieval: no documents")
             return jsonify({
                 "answer": "No documents available to process your query.",
                 "disclaimer": "No documents available to process your query. Upload some PDFs to enable document search.",
@@ -175,72 +247,259 @@ def askPDFPost():
                 "query_usage": {}
             })
 
-        print("Creating retrieval chain")
-        retriever = vector_store.as_retriever(
-            search_type="similarity_score_threshold",
-            search_kwargs={
-                "k": 20,
-                "score_threshold": 0.1,
-            },
-        )
+        # Follow-up questions are rewritten with the session's history into a
+        # standalone query (the first question of a session is used as is),
+        # which keys the answer cache and drives retrieval
+        history = chat_history.messages(session_id)
+        timings, started = {}, time.perf_counter()
+        standalone = chain_registry.rewrite(query, history, timings)
+
+        # Serve repeated questions from the answer cache
+        answer_cache = get_answer_cache()
+        with timed("cache_lookup"):
+            cache_lookup = answer_cache.lookup(standalone, prompt_type, retrieval_mode)
+        cached = cache_lookup.result
+        if cached is None:
+            # Turn the request away now rather than after the stream has started
+            get_llm_gateway().check()
+
+        if json_content.get("stream"):
+            def generate():
+                if cached is not None:
+                    chat_history.append(session_id, query, cached["answer"])
+                    yield stream_event("token", token=cached["answer"])
+                    yield stream_event("final", cached=True, session_id=session_id, **answer_body(query, cached, debug))
+                    return
+
+                result = {"answer": "", "context": []}
+                try:
+                    for chunk in retrieval_chain.stream({"input": query, "chat_history": history, "standalone": standalone,
+                                                            "retrieval": retrieval_mode, "timings": timings}):
+                        if "context" in chunk:
+                            result["context"] = chunk["context"]
+                        if "answer" in chunk:
+                            result["answer"] += chunk["answer"]
+                            yield stream_event("token", token=chunk["answer"])
+                    answer_cache.store(cache_lookup, result)
+                    chat_history.append(session_id, query, result["answer"])
+                    yield stream_event("final", session_id=session_id, timings=stage_timings(timings, started),
+                                       **answer_body(query, result, debug))
+                except LLMOverloaded as e:
+                    yield stream_event("error", error=str(e), retry_after=e.retry_after)
+                except Exception as e:
+                    yield stream_event("error", error=str(e))
+
+            return stream_response(generate())
+
+        if cached is not None:
+            chat_history.append(session_id, query, cached["answer"])
+            return serialize({"cached": True, "session_id": session_id, **answer_body(query, cached, debug)})
+
+        result = retrieval_chain.invoke({"input": query, "chat_history": history, "standalone": standalone,
+                                         "retrieval": retrieval_mode, "timings": timings})
+        answer_cache.store(cache_lookup, {"answer": result["answer"], "context": result.get("context", [])})
+        chat_history.append(session_id, query, result["answer"])
+        return serialize({"session_id": session_id, "timings": stage_timings(timings, started),
+                          **answer_body(query, result, debug)})
+    except LLMOverloaded as e:
+        return llm_overloaded(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        retriever_prompt = ChatPromptTemplate.from_messages(
-            [
-                MessagesPlaceholder(variable_name="chat_history"),
-                ("human", "{input}"),
-                (
-                    "human",
-                    "Given the above conversation, generate a search query to lookup in order to get information relevant to the conversation",
-                ),
-            ]
-        )
-        history_aware_retriever = create_history_aware_retriever(
-            llm=cached_llm, retriever=retriever, prompt=retriever_prompt
-        )
-        document_chain = create_stuff_documents_chain(cached_llm, prompt)
 
-        retrieval_chain = create_retrieval_chain(
-            history_aware_retriever,
-            document_chain,
+@bp.route("/ask_pdf_batch", methods=["POST"])
+def ask_pdf_batch():
+    """
+    Answer a list of questions with one prompt type. Retrieval runs for the
+    whole batch at once (one embedding call, one pass over the vector store),
+    then the answers are generated BATCH_WORKERS at a time and streamed as
+    NDJSON events in the order they finish, each with the index of its
+    question. Questions are standalone: no chat history is used or kept.
+    """
+    json_content = request.json or {}
+    queries = json_content.get("queries")
+    prompt_type = json_content.get("promptType")
+
+    if not isinstance(queries, list) or not queries or not all(isinstance(query, str) and query.strip() for query in queries):
+        return jsonify({"error": "'queries' must be a non-empty list of questions"}), 400
+    max_questions = current_app.config["BATCH_MAX_QUESTIONS"]
+    if len(queries) > max_questions:
+        return jsonify({"error": f"At most {max_questions} questions per batch"}), 400
+
+    chain_registry = get_chain_registry()
+    document_chain = chain_registry.get_document_chain(prompt_type)
+    if not document_chain:
+        return jsonify({"error": "Unknown prompt type"}), 400
+
+    retrieval_mode = json_content.get("retrieval") or chain_registry.retrieval_mode
+    if retrieval_mode not in RETRIEVAL_MODES:
+        return jsonify({"error": f"Unknown retrieval mode, expected one of: {', '.join(RETRIEVAL_MODES)}"}), 400
+
+    logging.debug("ask_pdf_batch queries=%r prompt_type=%r", queries, prompt_type)
+
+    vector_store = get_vector_store()
+    if not vector_store.count():
+        logging.info("ask_pdf_batch answered without retrieval: no documents")
+
+        def no_documents():
+            for index, query in enumerate(queries):
+                yield stream_event(
+                    "result", index=index, query=query, sources=[], pdf_usage={}, query_usage={},
+                    answer="No documents available to process your query.",
+                    disclaimer="No documents available to process your query. Upload some PDFs to enable document search.",
+                )
+            yield stream_event("final", questions=len(queries), cached=0, failed=0, timings={},
+                               wall_seconds=0.0, serial_seconds=0.0, speedup=None)
+
+        return stream_response(no_documents())
+
+    answer_cache = get_answer_cache()
+    with timed("cache_lookup"):
+        # Semantic lookups compare the embeddings of the normalized questions: one model call for all of them
+        embeddings = (embed_queries(get_embedding(), [normalize_query(query) for query in queries])
+                      if answer_cache.semantic else [None] * len(queries))
+        lookups = [answer_cache.lookup(query, prompt_type, retrieval_mode, embedding)
+                   for query, embedding in zip(queries, embeddings)]
+    pending = [index for index, lookup in enumerate(lookups) if lookup.result is None]
+    if pending:
+        # Turn the request away now rather than after the stream has started
+        get_llm_gateway().check()
+    workers = current_app.config["BATCH_WORKERS"] or current_app.config["LLM_CONCURRENCY"] or 4
+
+    def generate_answer(query, documents):
+        start = time.perf_counter()
+        answer = document_chain.invoke({"input": query, "context": documents})
+        return {"answer": answer, "context": documents}, time.perf_counter() - start
+
+    def generate():
+        started = time.perf_counter()
+        for index, lookup in enumerate(lookups):
+            if lookup.result is not None:
+                yield stream_event("result", index=index, query=queries[index], cached=True,
+                                   **build_answer_response(queries[index], lookup.result))
+
+        timings = {}
+        try:
+            contexts = chain_registry.retrieve_many([queries[index] for index in pending], timings, retrieval_mode)
+        except Exception as e:
+            yield stream_event("error", error=str(e))
+            return
+        # Retrieval time of the batch, shared out between its questions
+        retrieval_share = sum(timings.values()) / len(pending) if pending else 0.0
+
+        serial_seconds, failed = 0.0, 0
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ask-pdf-batch")
+        try:
+            futures = {executor.submit(generate_answer, queries[index], documents): index
+                       for index, documents in zip(pending, contexts)}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    result, seconds = future.result()
+                except LLMOverloaded as e:
+                    failed += 1
+                    yield stream_event("error", index=index, query=queries[index], error=str(e), retry_after=e.retry_after)
+                    continue
+                except Exception as e:
+                    failed += 1
+                    yield stream_event("error", index=index, query=queries[index], error=str(e))
+                    continue
+                answer_cache.store(lookups[index], result)
+                serial_seconds += retrieval_share + seconds
+                yield stream_event("result", index=index, query=queries[index],
+                                   timings={"retrieval": round(retrieval_share, 4), "generation": round(seconds, 4)},
+                                   **build_answer_response(queries[index], result))
+        finally:
+            # Also reached when the client disconnects: drop the questions not started yet
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        total = time.perf_counter() - started
+        record("ask_pdf_batch", total)
+        logging.info(f"ask_pdf_batch answered {len(queries)} questions in {total:.2f} s "
+                     f"({len(queries) - len(pending)} cached, {failed} failed)")
+        yield stream_event(
+            "final",
+            questions=len(queries),
+            cached=len(queries) - len(pending),
+            failed=failed,
+            timings={stage: round(seconds, 4) for stage, seconds in timings.items()},
+            wall_seconds=round(total, 3),
+            # What the same questions took added up: the time of answering them one by one
+            serial_seconds=round(serial_seconds, 3),
+            speedup=round(serial_seconds / total, 2) if total else None,
         )
 
-        result = retrieval_chain.invoke({"input": query})
-        chat_history.append(HumanMessage(content=query))
-        chat_history.append(AIMessage(content=result["answer"]))
-
-        print(chat_history)
-
-        sources = create_context_with_metadata(result.get("context", []))
-
-        # Update PDF usage count and query usage count as before
-        for doc in result["context"]:
-            pdf_source = doc.metadata.get("source")
-            if pdf_source in pdf_usage_count:
-                pdf_usage_count[pdf_source] += 1
-            else:
-                pdf_usage_count[pdf_source] = 1
-
-            if pdf_source in query_usage_count:
-                query_usage_count[pdf_source] += 1
-            else:
-                query_usage_count[pdf_source] = 1
-
-        if not sources:
-            answer = f"No relevant documents found for the query: {query}. This answer is generated without any PDF context."
-        else:
-            answer = result["answer"]
-
-        response_answer = {
-            "answer": answer,
-            "sources": sources,
-            "pdf_usage": {pdf: {"count": count, "percentage": (count / sum(pdf_usage_count.values()) * 100) if sum(pdf_usage_count.values()) > 0 else 0} for pdf, count in pdf_usage_count.items()},
-            "query_usage": {pdf: {"count": count, "percentage": (count / sum(query_usage_count.values()) * 100) if sum(query_usage_count.values()) > 0 else 0} for pdf, count in query_usage_count.items()},
-            "disclaimer": "This answer is not based on any available PDF documents." if not sources else None
-        }
-
-        return jsonify(response_answer)
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return stream_response(generate())
+
+def answer_body(query, result, debug=False):
+    """
+    The /ask_pdf response body; with `debug`, also the durations of every
+    stage recorded while handling the request.
+    """
+    with timed("response"):
+        body = build_answer_response(query, result)
+    if debug:
+        body["debug"] = {"timings": request_timings()}
+    return body
+
+
+def serialize(body):
+    with timed("serialization"):
+        return jsonify(body)
+
+
+def build_answer_response(query, result):
+    """
+    Update the usage counters and build the /ask_pdf response body for a
+    retrieval chain result.
+    """
+    sources = create_context_with_metadata(result.get("context", []))
+
+    # PDFs that contributed context, overall (all workers) and to this answer
+    used = [doc.metadata.get("source", "Unknown") for doc in result.get("context", [])]
+    usage = get_usage()
+    usage.record(used)
+    pdf_usage_count, total = usage.snapshot()
+
+    if not sources:
+        answer = f"No relevant documents found for the query: {query}. This answer is generated without any PDF context."
+    else:
+        answer = result["answer"]
+
+    return {
+        "answer": answer,
+        "sources": sources,
+        "pdf_usage": usage_shares(pdf_usage_count, total),
+        "query_usage": usage_shares(Counter(used), len(used)),
+        "disclaimer": "This answer is not based on any available PDF documents." if not sources else None
+    }
+
+
+def stage_timings(timings, started):
+    """
+    Complete the stage timings recorded by a retrieval chain call: whatever
+    was not spent rewriting the query or retrieving was spent generating.
+    """
+    total = time.perf_counter() - started
+    timings = dict(timings, generation=total - sum(timings.values()), total=total)
+    timings = {stage: round(seconds, 4) for stage, seconds in timings.items()}
+    record("ask_pdf", total)
+    logging.info("ask_pdf timings=%s", timings)
+    return timings
+
+
+def stream_event(event_type, **data):
+    """Serialize one event of a streamed (NDJSON) response."""
+    return json.dumps({"type": event_type, **data}) + "\n"
+
+
+def stream_response(events):
+    """Wrap an event generator in a chunked NDJSON response."""
+    return Response(
+        stream_with_context(events),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 def create_context_with_metadata(documents):
@@ -257,24 +516,21 @@ def create_context_with_metadata(documents):
 
 @bp.route("/clear_chat_history", methods=["POST"])
 def clear_chat_history():
-    global chat_history
-    chat_history = []
-    print("Chat history cleared")
+    # Only the caller's own session is cleared
+    session_id = get_session_id(request.get_json(silent=True) or {})
+    get_chat_history().clear(session_id)
+    logging.debug("Chat history cleared for session %s", session_id)
     return jsonify({"status": "Chat history cleared successfully"})
 
 @bp.route("/clear_db", methods=["POST"])
 def clear_db():
-    logging.info("POST /clear_db called")
     try:
-        # Clear the vector store (i.e., delete all documents)
-        clear_vector_store()
+        # Clear the vector store (i.e., delete all documents) and reopen it
+        get_vector_store().reset()
 
         # Clear the PDF directory if necessary
         clear_directory(pdf_dir)
-
-        # Reinitialize the vector store
-        global vector_store
-        vector_store = initialize_vector_store()
+        get_catalog().clear()
 
         return jsonify({"status": "Database and files cleared successfully"})
     except Exception as e:
@@ -290,47 +546,11 @@ def clear_directory(directory_path):
         os.makedirs(directory_path)
         logging.info(f"Directory cleared: {directory_path}")
 
-def clear_vector_store():
-    """
-    Clears all documents from the vector store.
-    """
-    try:
-        global vector_store
-        # Initialize the vector store
-        vector_store = Chroma(persist_directory=folder_path, embedding_function=embedding)
-
-        # Get all document IDs from the vector store
-        db_data = vector_store.get()  # Get the data from the vector store
-        ids = db_data.get("ids", [])
-
-        # Log the number of documents found
-        logging.info(f"Found {len(ids)} documents in vector store")
-
-        if ids:
-            # Delete all documents by their IDs
-            for doc_id in ids:
-                if doc_id:
-                    vector_store.delete(doc_id)
-                    logging.info(f"Deleted document with ID: {doc_id}")
-
-            # Persist changes to the vector store
-            vector_store.persist()
-            logging.info("Successfully deleted all documents and persisted changes.")
-        else:
-            logging.info("No documents found in vector store to delete.")
-    
-    except Exception as e:
-        logging.error(f"Error during vector store clearing: {str(e)}")
-        raise
-
-    
 @bp.route("/list_pdfs", methods=["GET"])
 def list_pdfs():
-    print("GET /list_pdfs called")
-    print(f"pdf_dir: {pdf_dir}")
-    print(f"pdf_dir: {pdf_files}")
     try:
         pdf_files = os.listdir(pdf_dir)
+        logging.debug("list_pdfs pdf_dir=%s files=%d", pdf_dir, len(pdf_files))
         return jsonify({"pdf_files": pdf_files})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -345,123 +565,194 @@ def pdfPost():
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
 
-    file_name = file.filename
+    # With replace set, a new version of an ingested PDF updates it in place
+    replace = request.form.get("replace", "").lower() in ("1", "true", "yes")
+
+    try:
+        job = enqueue_pdf(file.stream, file.filename, replace=replace)
+    except UploadRejected as e:
+        return jsonify({"error": e.message}), e.status
+
+    response = {
+        "status": "Queued",
+        "filename": file.filename,
+        "job_id": job.id,
+        "update": job.state.get("update", False),
+    }
+    return jsonify(response), 202
+
+
+class UploadRejected(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def enqueue_pdf(stream, file_name, block=False, replace=False):
+    """
+    Save a PDF into the library and queue it for background ingestion.
+    Returns the ingestion job, or raises UploadRejected. With `block` set,
+    waits for room in the ingestion queue instead of rejecting the file.
+    With `replace` set, a file already in the library is updated instead:
+    only the pages that changed are embedded again.
+    """
     save_file = os.path.join(pdf_dir, file_name)
+    catalog = get_catalog()
+    previous = catalog.file_info(file_name) if replace else None
 
     # Check if the file already exists
-    if file_exists(save_file):
-        return jsonify({"error": "File already exists."}), 400
+    if previous is None and file_exists(save_file):
+        raise UploadRejected("File already exists.")
 
-    # Compute file hash to check for duplicates
+    # Save the upload, hashing it in the same pass
     try:
-        file_hash = compute_file_hash(file)
+        with timed("upload_hashing"):
+            tmp_file, file_hash, file_size = save_upload(stream, upload_tmp_dir)
     except Exception as e:
-        return jsonify({"error": f"Error computing file hash: {str(e)}"}), 500
+        raise UploadRejected(f"Error saving file: {str(e)}", 500)
 
-    existing_files = [f for f in os.listdir(pdf_dir) if f.endswith('.pdf')]
-    for existing_file in existing_files:
-        existing_file_path = os.path.join(pdf_dir, existing_file)
-        try:
-            if compute_file_hash(open(existing_file_path, 'rb')) == file_hash:
-                return jsonify({"error": "File with identical content already exists."}), 400
-        except Exception as e:
-            return jsonify({"error": f"Error checking existing files: {str(e)}"}), 500
+    if previous is not None:
+        return enqueue_update(tmp_file, file_name, file_hash, file_size, previous, block)
+
+    # Check for duplicates against the content-hash index
+    if not catalog.claim(file_hash, file_name, file_size):
+        os.remove(tmp_file)
+        if catalog.find_hash(file_hash):
+            raise UploadRejected("File with identical content already exists.")
+        raise UploadRejected("File already exists.")
 
-    # Save the file
     try:
-        file.save(save_file)
+        os.replace(tmp_file, save_file)
     except Exception as e:
-        return jsonify({"error": f"Error saving file: {str(e)}"}), 500
+        catalog.release(file_name)
+        os.remove(tmp_file)
+        raise UploadRejected(f"Error saving file: {str(e)}", 500)
 
-    # Load and preprocess the PDF file
+    # Parse, split and embed in the background
     try:
-        loader = PDFPlumberLoader(save_file)
-        docs = loader.load_and_split()
-        is_structured = True
-    except Exception as e:
-        print(f"Error loading structured text: {e}")
-        docs = []
-        is_structured = False
+        return get_ingestion_queue().submit(file_name, save_file, block=block)
+    except queue.Full:
+        os.remove(save_file)
+        catalog.release(file_name)
+        raise UploadRejected("Too many uploads are being processed. Please try again later.", 503)
 
-    if not docs:
-        # Perform OCR if the document is unstructured
-        try:
-            print("Performing OCR")
-            text = perform_ocr(save_file)
-            docs = [Document(page_content=preprocess_text(text), metadata={"source": file_name})]
-            is_structured = False
-        except Exception as e:
-            return jsonify({"error": f"Error during OCR processing: {str(e)}"}), 500
-    else:
-        # Preprocess text from documents
-        docs = [Document(page_content=preprocess_text(doc.page_content), metadata={"source": file_name}) for doc in docs]
+
+def enqueue_update(tmp_file, file_name, file_hash, file_size, previous, block=False):
+    """
+    Queue a new version of a PDF that is already in the library. The upload
+    stays in the temporary directory until its job has stored it, so the
+    previous version is served until then, and kept if the job fails.
+    """
+    catalog = get_catalog()
+    if file_hash == previous[0]:
+        os.remove(tmp_file)
+        raise UploadRejected("File is identical to the current version.")
+    if not catalog.replace(file_name, file_hash, file_size):
+        os.remove(tmp_file)
+        raise UploadRejected("File with identical content already exists.")
 
     try:
-        chunks = text_splitter.split_documents(docs)
-        print(f"Loaded len={len(chunks)} chunks")
-
-        # Add source metadata to each chunk
-        for chunk in chunks:
-            chunk.metadata = {"source": file_name}
-        global vector_store
-        # Initialize the vector store
-        vector_store = Chroma.from_documents(
-            documents=chunks, embedding=embedding, persist_directory=folder_path
+        return get_ingestion_queue().submit(
+            file_name, tmp_file, block=block, exclusive=True, update=True, target=os.path.join(pdf_dir, file_name),
+            previous_hash=previous[0], previous_size=previous[1],
         )
-    except Exception as e:
-        return jsonify({"error": f"Error initializing vector store: {str(e)}"}), 500
+    except (queue.Full, IngestionBusy) as e:
+        catalog.replace(file_name, *previous)
+        os.remove(tmp_file)
+        if isinstance(e, IngestionBusy):
+            raise UploadRejected("A previous version of this file is still being ingested.", 409)
+        raise UploadRejected("Too many uploads are being processed. Please try again later.", 503)
 
-    response = {
-        "status": "Successfully Uploaded",
-        "filename": file_name,
-        "doc_len": len(docs),
-        "chunk_len": len(chunks),
-        "is_structured": is_structured
-    }
-    return jsonify(response)
+
+def bulk_ingest(directory, replace=False):
+    """
+    Queue every PDF under `directory` for ingestion. Files are fed to the
+    bounded ingestion queue one at a time, so only INGEST_MAX_PENDING of them
+    are ever waiting and at most INGEST_WORKERS are being processed. With
+    `replace` set, files already in the library are updated.
+    """
+    queued, skipped = [], []
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if not name.lower().endswith('.pdf'):
+                continue
+            try:
+                with open(os.path.join(root, name), 'rb') as f:
+                    job = enqueue_pdf(f, name, block=True, replace=replace)
+                queued.append({"filename": name, "job_id": job.id})
+            except UploadRejected as e:
+                skipped.append({"filename": name, "reason": e.message})
+    return queued, skipped
+
+
+@bp.route("/bulk_ingest", methods=["POST"])
+def bulk_ingest_post():
+    json_content = request.json
+    directory = json_content.get("directory")
+
+    if not directory:
+        return jsonify({"error": "No 'directory' found in JSON request"}), 400
+    if not os.path.isdir(directory):
+        return jsonify({"error": "Directory not found"}), 404
+
+    queued, skipped = bulk_ingest(directory, replace=bool(json_content.get("replace")))
+    return jsonify({"queued": queued, "skipped": skipped}), 202
+
+
+@click.command("ingest-dir")
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.option("--wait/--no-wait", default=True, help="Wait for the ingestion jobs and report throughput.")
+@click.option("--replace", is_flag=True, help="Update the PDFs already in the library with these versions.")
+@with_appcontext
+def ingest_dir_command(directory, wait, replace):
+    """Ingest every PDF under DIRECTORY."""
+    start = time.perf_counter()
+    queued, skipped = bulk_ingest(directory, replace=replace)
+    for entry in skipped:
+        click.echo(f"Skipped {entry['filename']}: {entry['reason']}")
+    click.echo(f"Queued {len(queued)} PDF files.")
+    if not wait or not queued:
+        return
+
+    ingestion_queue = get_ingestion_queue()
+    ingestion_queue.join()
+    elapsed = time.perf_counter() - start
+    jobs = [ingestion_queue.get(entry["job_id"]).snapshot() for entry in queued]
+    pages = sum(job["pages"] for job in jobs)
+    failed = [job for job in jobs if job["status"] == "failed"]
+    for job in failed:
+        click.echo(f"Failed {job['filename']}: {job['error']}")
+    click.echo(f"Ingested {len(jobs) - len(failed)} files, {pages} pages in {elapsed:.1f}s ({pages / elapsed:.1f} pages/sec)")
+
+
+@bp.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = get_ingestion_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.snapshot())
 
 
 @bp.route("/list_documents", methods=["GET"])
 def list_documents():
-
     try:
-        print("GET /list_pdfs called")
-        print(f"pdf_dir: {folder_path}")
-        print(f"pdf_dir: {pdf_dir}")
-        print(f"folder_path: {folder_path}")
-        print(f"embedding function: {embedding}")
-
-        if not os.path.exists(folder_path):
-            print(f"The directory {folder_path} does not exist. Initializing vector store...")
-            os.makedirs(folder_path, exist_ok=True)  # Ensure the folder exists before initializing
-
-        print("Initializing vector store...")
-        initialize_vector_store()
-        try:
-            vector_store = Chroma(persist_directory=folder_path, embedding_function=embedding)
-        except Exception as init_error:
-            print(f"Failed to initialize vector store: {init_error}")
-            return jsonify({"error": "Failed to initialize vector store"}), 500
-        print("Vector store initialized.")
-
-        print("Fetching data from vector store...")
-        try:
-            db_data = vector_store.get()
-        except Exception as fetch_error:
-            print(f"Failed to fetch data from vector store: {fetch_error}")
-            return jsonify({"error": "Failed to fetch data from vector store"}), 500
-
-        if not db_data or "metadatas" not in db_data or not db_data["metadatas"]:
-            print("No documents found in vector store.")
-            return jsonify({"message": "No documents found"}), 200
-
-        documents = [{"source": metadata.get("source", "Unknown")} for metadata in db_data["metadatas"]]
-        response = {"documents": documents}
-        print("Documents extracted:", documents)
+        page = max(request.args.get("page", 1, type=int), 1)
+        per_page = min(max(request.args.get("per_page", 100, type=int), 1), 1000)
+
+        # Per-source statistics are maintained at ingest/delete time, so this
+        # never touches the vector store
+        catalog = get_catalog()
+        total, _ = catalog.totals()
+        documents = catalog.list_sources(per_page, (page - 1) * per_page)
+
+        response = {"documents": documents, "page": page, "per_page": per_page, "total": total}
+        if not total:
+            response["message"] = "No documents found"
         return jsonify(response), 200
 
     except Exception as e:
-        print(f"Error listing documents: {e}")
+        logging.error(f"Error listing documents: {e}")
         return jsonify({"error": "An error occurred while listing documents. Please try again later."}), 500
 
 @bp.route("/delete_pdf", methods=["POST"])
@@ -475,56 +766,30 @@ def delete_pdf():
     try:
         # Construct the file path
         file_path = os.path.join(pdf_dir, file_name)
-        print(f"Attempting to delete file at: {file_path}")
-
-        # Create a path pattern to match against
-        path_pattern = file_name  # Use only file_name for pattern matching
-        print(f"Looking for documents with source: {path_pattern}")
-
-        # Remove the PDF references from the vector store
-        vector_store = Chroma(persist_directory=folder_path, embedding_function=embedding)
-
-        # Get all documents from the vector store
-        db_data = vector_store.get()  # Get the data from the vector store
-        print(f"db_data: {db_data}")
-        metadatas = db_data.get("metadatas", [])
-        ids = db_data.get("ids", [])
-        
-        # Log the number of documents and sample metadata
-        print(f"Found {len(metadatas)} documents in vector store")
-        if metadatas:
-            print(f"Sample metadata: {metadatas[0]}")
-
-        # Find and delete documents with the matching source path
-        docs_to_delete = [id for id, metadata in zip(ids, metadatas) if metadata.get("source").strip().lower() == path_pattern.strip().lower()]
-        print(f"Documents to delete: {docs_to_delete}")
-
-        if docs_to_delete:
-            for doc_id in docs_to_delete:
-                if doc_id is None:
-                    print("Encountered None as doc_id, skipping deletion.")
-                    continue
-                print(f"Deleting document with ID: {doc_id}")
-                vector_store.delete(doc_id)
-
-            # Persist changes to the vector store
-            vector_store.persist()
-            print(f"Successfully deleted documents and persisted changes.")
-        else:
-            print(f"No documents found for source: {path_pattern}")
-            return jsonify({"status": "No documents found for the provided file name"}), 404
+        catalog = get_catalog()
 
-        # Check if the file exists
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"Successfully deleted file: {file_path}")
-        else:
-            print(f"File not found: {file_path}")
+        # Check first, so that a request for a missing file changes nothing
+        if catalog.file_info(file_name) is None:
+            logging.info(f"No documents found for source: {file_name}")
+            return jsonify({"status": "No documents found for the provided file name"}), 404
+        if not os.path.exists(file_path):
+            logging.warning(f"File not found: {file_path}")
             return jsonify({"error": "File not found"}), 404
-        
+        # The job would keep storing chunks of the file after it is deleted
+        if get_ingestion_queue().is_busy(file_name):
+            return jsonify({"error": "This file is still being ingested, delete it once its job is done."}), 409
+
+        # Remove the PDF references from the vector store with one filtered delete
+        deleted = get_vector_store().delete_source(file_name)
+        logging.info(f"Deleted {deleted} chunks of {file_name}")
+        catalog.release(file_name)
+
+        os.remove(file_path)
+        logging.info(f"Deleted file: {file_path}")
+
         return jsonify({"status": "success"})
     except Exception as e:
-        print(f"Error during deletion: {str(e)}")
+        logging.error(f"Error during deletion: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 @bp.route('/pdfs/<path:filename>')
@@ -533,7 +798,6 @@ def serve_pdf(filename):
 
 @bp.route("/delete_document", methods=["POST"])
 def delete_document():
-    print("POST /delete_document called")
     json_content = request.json
     doc_id = json_content.get("doc_id")
 
@@ -541,24 +805,38 @@ def delete_document():
         return jsonify({"error": "No 'doc_id' found in JSON request"}), 400
 
     try:
-        vector_store = Chroma(persist_directory=folder_path, embedding_function=embedding)
+        vector_store = get_vector_store()
+        metadatas = vector_store.get(ids=[doc_id], include=["metadatas"])["metadatas"]
         vector_store.delete(doc_id)
+        for metadata in metadatas:
+            get_catalog().remove_chunks(metadata.get("source"), page=metadata.get("page"))
         return jsonify({"status": "Document deleted successfully"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-def perform_ocr(pdf_path):
-    # Placeholder function for OCR processing
-    # You can implement this using libraries like pytesseract or other OCR tools
-    return "OCR processed text from PDF"
+@bp.route("/cache_stats", methods=["GET"])
+def get_cache_stats():
+    embedding = get_embedding()
+    return jsonify({
+        "answer_cache": get_answer_cache().stats(),
+        "query_rewrite": get_chain_registry().rewriter.stats(),
+        "embedding": embedding.stats() if isinstance(embedding, CachedEmbeddings) else None,
+    })
+
+@bp.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(render_metrics(current_app.extensions), mimetype="text/plain; version=0.0.4")
+
+@bp.route("/llm_stats", methods=["GET"])
+def get_llm_stats():
+    return jsonify(get_llm_gateway().stats())
 
 @bp.route("/pdf_usage", methods=["GET"])
 def get_pdf_usage():
     try:
-        # Calculate percentage influence
-        total_queries = sum(pdf_usage_count.values())
-        pdf_influence = {pdf: {"count": count, "percentage": (count / total_queries * 100) if total_queries > 0 else 0} for pdf, count in pdf_usage_count.items()}
-        return jsonify({"pdf_usage": pdf_influence})
+        # Percentage influence, and uses in the last hour and day, of every PDF
+        pdf_influence, totals = get_usage().report()
+        return jsonify({"pdf_usage": pdf_influence, **totals})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -21,6 +21,46 @@ async function apiRequest(url, options = {}) {
     }
 }
 
+// Function to make a streaming API request. The server answers with one JSON
+// event per line (NDJSON); onEvent is called for each event as it arrives.
+async function streamRequest(url, body, onEvent) {
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ...body, stream: true }),
+    });
+
+    if (!response.ok) {
+        const errorText = await response.text();
+        throw new Error(`Failed to fetch from ${url}. Status: ${response.status}. Response: ${errorText}`);
+    }
+
+    // Non-streamed replies (e.g. "no documents available") are plain JSON
+    if (!(response.headers.get('Content-Type') || '').includes('application/x-ndjson')) {
+        await onEvent({ type: 'final', ...(await response.json()) });
+        return;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop(); // Keep the trailing partial line for the next read
+
+        for (const line of lines) {
+            if (line.trim()) await onEvent(JSON.parse(line));
+        }
+    }
+
+    if (buffer.trim()) await onEvent(JSON.parse(buffer));
+}
+
 // Function to copy text from PDF field and submit to AI
 async function copyTextAndSubmit() {
     const pdfText = document.getElementById('queryPDF').value;
@@ -42,13 +82,17 @@ async function askAI() {
     responseDiv.innerHTML = '<div class="spinner"></div><p class="loading-message">Fetching response, please wait...</p>';
 
     try {
-        const result = await apiRequest('/ai', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ query }),
+        let answer = '';
+        await streamRequest('/ai', { query }, async (event) => {
+            if (event.type === 'token') {
+                answer += event.token;
+                responseDiv.innerHTML = `<p>${await markdownToHTML(answer)}</p>`;
+            } else if (event.type === 'final') {
+                responseDiv.innerHTML = `<p>${await markdownToHTML(event.answer) || event.error}</p>`;
+            } else if (event.type === 'error') {
+                throw new Error(event.error);
+            }
         });
-
-        responseDiv.innerHTML = `<p>${await markdownToHTML(result.answer) || result.error}</p>`;
     } catch (error) {
         responseDiv.innerHTML = `<p>An error occurred while processing the query: ${error.message}</p>`;
     }
@@ -75,22 +119,27 @@ async function askPDF() {
 
     try {
         console.log('Sending API request...'); // Debug log
-        const result = await apiRequest('/ask_pdf', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ query, promptType }),
+        let answer = '';
+        await streamRequest('/ask_pdf', { query, promptType }, async (event) => {
+            if (event.type === 'token') {
+                // Render the answer incrementally as tokens arrive
+                answer += event.token;
+                responseDiv.innerHTML = `<p>${await markdownToHTML(answer)}</p>`;
+            } else if (event.type === 'final') {
+                console.log('API response received:', event); // Debug log
+
+                if (event.disclaimer) {
+                    responseDiv.innerHTML = `<p>${event.disclaimer}</p>`;
+                } else {
+                    responseDiv.innerHTML = `<p>${await markdownToHTML(event.answer) || event.error}</p>`;
+                }
+
+                if (event.pdf_usage) displayPDFUsage(event.pdf_usage);
+                if (event.query_usage) displayQueryUsage(event.query_usage);
+            } else if (event.type === 'error') {
+                throw new Error(event.error);
+            }
         });
-
-        console.log('API response received:', result); // Debug log
-
-        if (result.disclaimer) {
-            responseDiv.innerHTML = `<p>${result.disclaimer}</p>`;
-        } else {
-            responseDiv.innerHTML = `<p>${await markdownToHTML(result.answer) || result.error}</p>`;
-        }
-
-        if (result.pdf_usage) displayPDFUsage(result.pdf_usage);
-        if (result.query_usage) displayQueryUsage(result.query_usage);
     } catch (error) {
         responseDiv.innerHTML = `<p>An error occurred while processing the PDF query: ${error.message}</p>`;
         console.error('Error in askPDF:', error); // Debug log
@@ -47,12 +47,20 @@ async function uploadPDF() {
             body: formData,
         });
 
-        const { status, filename, doc_len, chunk_len, error } = result;
-        if (status === 'Successfully Uploaded') {
-            showToast(`Success: ${status}\nFilename: ${filename}\nLoaded ${doc_len} documents\nLoaded len=${chunk_len} chunks`, type = 'success');
-            
-            // Call listPDFs function after successful upload
-            listPDFs();
+        const { status, filename, job_id, error } = result;
+        if (status === 'Queued') {
+            showToast(`Uploaded ${filename}, processing in the background...`, type = 'info');
+
+            // Wait for the background ingestion job to finish
+            const job = await waitForJob(job_id);
+            if (job.status === 'completed') {
+                showToast(`Success: Successfully Uploaded\nFilename: ${filename}\nLoaded ${job.pages} pages\nLoaded len=${job.chunks} chunks`, type = 'success');
+
+                // Call listPDFs function after successful upload
+                listPDFs();
+            } else {
+                showToast(`Processing ${filename} failed: ${job.error || 'Unknown error'}`, type = 'error');
+            }
         } else {
             showToast(error || 'An error occurred during the upload.', type = 'error');
         }
@@ -67,6 +75,15 @@ async function uploadPDF() {
 }
 
 
+// Poll an ingestion job until it has completed or failed
+async function waitForJob(jobId, intervalMs = 1000) {
+    while (true) {
+        const job = await apiRequest(`/jobs/${jobId}`);
+        if (job.status === 'completed' || job.status === 'failed') return job;
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+    }
+}
+
 // Function to clear chat history
 async function clearChatHistory() {
     try {
@@ -90,14 +107,22 @@ async function clearChatHistory() {
 // Function to list PDFs
 async function listPDFs() {
     try {
-        const result = await apiRequest('/list_documents');
+        // /list_documents is paged: fetch every page, up to the reported total
+        const documents = [];
+        const perPage = 1000;
+        for (let page = 1; ; page++) {
+            const result = await apiRequest(`/list_documents?page=${page}&per_page=${perPage}`);
+            const pageDocuments = result.documents || [];
+            documents.push(...pageDocuments);
+            if (pageDocuments.length < perPage || documents.length >= (result.total || 0)) break;
+        }
 
         const pdfList = document.getElementById('pdfList');
         pdfList.innerHTML = '';
 
-        if (result.documents && result.documents.length > 0) {
+        if (documents.length > 0) {
             const seenPDFs = new Set();
-            result.documents.forEach(doc => {
+            documents.forEach(doc => {
                 const source = doc.source;
                 if (!seenPDFs.has(source)) {
                     seenPDFs.add(source);
@@ -0,0 +1,175 @@
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from flask import current_app
+
+# Width of the time buckets behind the windowed counts; buckets are kept for
+# the longest window
+BUCKET_SECONDS = 60
+WINDOWS = {"last_hour": 3600, "last_day": 86400}
+
+
+def usage_shares(counts, total):
+    """The usage block of a response: count and percentage of the total for every source."""
+    return {source: {"count": count, "percentage": count / total * 100 if total > 0 else 0}
+            for source, count in counts.items()}
+
+
+class UsageAnalytics:
+    """
+    How many times each PDF contributed context to an answer.
+
+    Counts live in memory with a running total, updated under a lock, so the
+    usage block of a response costs one pass over the sources. They are
+    written to a SQLite file every `flush_interval` seconds (0: on every
+    record), as additive upserts in one transaction: worker processes
+    sharing the file add up their counts, and each flush reloads the totals,
+    so every process sees the others' counts at most one interval late.
+
+    Per-minute buckets, kept for a day, give the counts of the last hour and
+    of the last day.
+    """
+
+    def __init__(self, path, flush_interval=10):
+        self.path = path
+        self.flush_interval = flush_interval
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()  # Counters
+        self._flush_lock = threading.Lock()  # Connection
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS totals (source TEXT PRIMARY KEY, count INTEGER NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " source TEXT NOT NULL,"
+            " bucket INTEGER NOT NULL,"
+            " count INTEGER NOT NULL,"
+            " PRIMARY KEY (source, bucket))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS buckets_bucket ON buckets (bucket)")
+        self._pending = Counter()  # source -> count not flushed yet
+        self._pending_buckets = Counter()  # (source, bucket) -> count not flushed yet
+        self._totals, self._total = {}, 0
+        self._reload()
+        self._stop = threading.Event()
+        self._flusher = None
+        atexit.register(self.close)
+
+    def record(self, sources):
+        """Count one use of every source in `sources` (repeats count again)."""
+        counts = Counter(sources)
+        if not counts:
+            return
+        bucket = int(time.time() // BUCKET_SECONDS)
+        with self._lock:
+            for source, count in counts.items():
+                self._totals[source] = self._totals.get(source, 0) + count
+                self._pending[source] += count
+                self._pending_buckets[(source, bucket)] += count
+            self._total += sum(counts.values())
+
+        if not self.flush_interval:
+            self.flush()
+        elif self._flusher is None:
+            self._start()
+
+    def snapshot(self):
+        """The count of every source and their total: this process's up to now, the others' as of the last flush."""
+        with self._lock:
+            return dict(self._totals), self._total
+
+    def window_counts(self, seconds):
+        """Uses of every source in the last `seconds`, to the nearest bucket."""
+        since = int((time.time() - seconds) // BUCKET_SECONDS) + 1
+        with self._flush_lock:
+            counts = Counter(dict(self._conn.execute(
+                "SELECT source, SUM(count) FROM buckets WHERE bucket >= ? GROUP BY source", (since,)
+            )))
+        with self._lock:
+            for (source, bucket), count in self._pending_buckets.items():
+                if bucket >= since:
+                    counts[source] += count
+        return counts
+
+    def report(self):
+        """Count, share of the total and windowed counts of every source, then the totals."""
+        counts, total = self.snapshot()
+        windows = {name: self.window_counts(seconds) for name, seconds in WINDOWS.items()}
+        sources = usage_shares(counts, total)
+        for source, usage in sources.items():
+            usage.update((name, window.get(source, 0)) for name, window in windows.items())
+        return sources, {"total": total, **{name: sum(window.values()) for name, window in windows.items()}}
+
+    def flush(self):
+        """Add the pending counts to the SQLite file and reload the totals of every process."""
+        with self._flush_lock:
+            with self._lock:
+                pending, pending_buckets = self._pending, self._pending_buckets
+                self._pending, self._pending_buckets = Counter(), Counter()
+            oldest = int(time.time() // BUCKET_SECONDS) - max(WINDOWS.values()) // BUCKET_SECONDS
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._conn.executemany(
+                        "INSERT INTO totals (source, count) VALUES (?, ?)"
+                        " ON CONFLICT (source) DO UPDATE SET count = count + excluded.count",
+                        pending.items(),
+                    )
+                    self._conn.executemany(
+                        "INSERT INTO buckets (source, bucket, count) VALUES (?, ?, ?)"
+                        " ON CONFLICT (source, bucket) DO UPDATE SET count = count + excluded.count",
+                        [(source, bucket, count) for (source, bucket), count in pending_buckets.items()],
+                    )
+                    self._conn.execute("DELETE FROM buckets WHERE bucket < ?", (oldest,))
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            except Exception:
+                # Keep the counts for the next flush
+                with self._lock:
+                    self._pending.update(pending)
+                    self._pending_buckets.update(pending_buckets)
+                raise
+            self._reload()
+
+    def _reload(self):
+        # Caller holds the flush lock, or is the constructor
+        totals = dict(self._conn.execute("SELECT source, count FROM totals"))
+        with self._lock:
+            # Counts recorded since the flush are not in the file yet
+            for source, count in self._pending.items():
+                totals[source] = totals.get(source, 0) + count
+            self._totals, self._total = totals, sum(totals.values())
+
+    def _start(self):
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._run, name="usage-flush", daemon=True)
+        self._flusher.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Error flushing usage counts: {str(e)}")
+
+    def close(self):
+        """Stop the flush thread and write what is pending."""
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception as e:
+            logging.error(f"Error flushing usage counts: {str(e)}")
+
+
+def get_usage():
+    """Return the usage analytics of the current application."""
+    return current_app.extensions["usage"]
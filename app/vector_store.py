@@ -0,0 +1,285 @@
+import logging
+import os
+import threading
+import uuid
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from langchain_core.documents import Document
+
+from .embeddings import embed_queries
+
+
+class VectorBackend:
+    """
+    Storage and similarity search of embedded chunks. The service below is
+    the only user of a backend: it serializes the writes and mirrors them
+    into the lexical index. `get` answers like Chroma's `get`: a dict with
+    the "ids" and the included "documents", "metadatas" and "embeddings".
+    """
+
+    def count(self):
+        raise NotImplementedError
+
+    def get(self, ids=None, include=("documents", "metadatas"), limit=None, offset=None):
+        raise NotImplementedError
+
+    def upsert(self, ids, texts, metadatas, embeddings):
+        raise NotImplementedError
+
+    def delete(self, ids):
+        raise NotImplementedError
+
+    def delete_source(self, source):
+        """Delete every chunk of a source, returning how many were removed."""
+        raise NotImplementedError
+
+    def search(self, query, k, score_threshold=None):
+        """Return up to `k` (document, relevance score) pairs, best first."""
+        raise NotImplementedError
+
+    def search_by_vectors(self, queries, k):
+        """Search for a batch of query embeddings at once: one `search` result per query."""
+        raise NotImplementedError
+
+    def drop(self):
+        """Delete everything; the backend is not used afterwards."""
+        raise NotImplementedError
+
+
+class ChromaBackend(VectorBackend):
+    """
+    The persisted Chroma store (data/db). `collection_metadata` is used when
+    the collection is created, e.g. {"hnsw:search_ef": 512} for a wider,
+    more exact HNSW search.
+    """
+
+    def __init__(self, persist_directory, embedding_function, collection_metadata=None):
+        from langchain_community.vectorstores import Chroma
+        self.chroma = Chroma(persist_directory=persist_directory, embedding_function=embedding_function,
+                             collection_metadata=collection_metadata)
+
+    def count(self):
+        return self.chroma._collection.count()
+
+    def get(self, ids=None, include=("documents", "metadatas"), limit=None, offset=None):
+        return self.chroma.get(ids=ids, include=list(include), limit=limit, offset=offset)
+
+    def upsert(self, ids, texts, metadatas, embeddings):
+        self.chroma._collection.upsert(ids=ids, documents=texts, metadatas=metadatas, embeddings=embeddings)
+
+    def delete(self, ids):
+        self.chroma.delete(ids)
+
+    def delete_source(self, source):
+        collection = self.chroma._collection
+        before = collection.count()
+        collection.delete(where={"source": source})
+        return before - collection.count()
+
+    def search(self, query, k, score_threshold=None):
+        return self.chroma.similarity_search_with_relevance_scores(query, k=k, score_threshold=score_threshold)
+
+    def search_by_vectors(self, queries, k):
+        if not len(queries) or not self.count():
+            return [[] for _ in queries]
+        results = self.chroma._collection.query(query_embeddings=[list(map(float, query)) for query in queries],
+                                                n_results=k, include=["documents", "metadatas", "distances"])
+        relevance = self.chroma._select_relevance_score_fn()
+        return [
+            [(Document(page_content=text, metadata=metadata or {}), relevance(distance))
+             for text, metadata, distance in zip(texts, metadatas, distances)]
+            for texts, metadatas, distances in zip(results["documents"], results["metadatas"], results["distances"])
+        ]
+
+    def drop(self):
+        self.chroma.delete_collection()
+
+
+def _numpy_backend(persist_directory, embedding_function, **options):
+    from .numpy_store import NumpyBackend
+    return NumpyBackend(persist_directory, embedding_function, **options)
+
+
+BACKENDS = {"chroma": ChromaBackend, "numpy": _numpy_backend}
+
+
+class VectorStoreService:
+    """
+    Process-wide handle on the persisted vector store.
+
+    The backend ("chroma" or "numpy", see BACKENDS) is opened once and shared
+    by every request; `reload` and `reset` are the only places it is
+    replaced. Every write is mirrored into the optional lexical index.
+    """
+
+    def __init__(self, persist_directory, embedding_function, lexical_index=None, backend="chroma", **options):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown vector store backend {backend!r}, expected one of: {', '.join(BACKENDS)}")
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+        self.lexical_index = lexical_index
+        self.backend_name = backend
+        self.options = options
+        self.generation = 0  # Bumped whenever the backend is replaced
+        self.corpus_version = 0  # Bumped whenever chunks are added or removed
+        self._lock = threading.RLock()
+        self._store = None
+
+    @property
+    def store(self):
+        store = self._store
+        if store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = self._open()
+                store = self._store
+        return store
+
+    @property
+    def is_open(self):
+        return self._store is not None
+
+    def _open(self):
+        os.makedirs(self.persist_directory, exist_ok=True)
+        logging.info(f"Opening {self.backend_name} vector store at {self.persist_directory}")
+        return BACKENDS[self.backend_name](self.persist_directory, self.embedding_function, **self.options)
+
+    def count(self):
+        """Return the number of chunks in the store without loading them."""
+        return self.store.count()
+
+    def get(self, **kwargs):
+        return self.store.get(**kwargs)
+
+    def add_documents(self, documents):
+        """Embed and store LangChain documents under new ids, returning the ids."""
+        ids = [str(uuid.uuid4()) for _ in documents]
+        texts = [doc.page_content for doc in documents]
+        self.upsert(ids, texts, [doc.metadata for doc in documents], self.embedding_function.embed_documents(texts))
+        return ids
+
+    def upsert(self, ids, texts, metadatas, embeddings):
+        """Insert or overwrite chunks whose embeddings were computed by the caller."""
+        with self._lock:
+            try:
+                self.store.upsert(ids, texts, metadatas, embeddings)
+                if self.lexical_index is not None:
+                    self.lexical_index.upsert(ids, texts, metadatas)
+            finally:
+                self.corpus_version += 1
+
+    def delete(self, ids):
+        ids = [ids] if isinstance(ids, str) else ids
+        with self._lock:
+            try:
+                self.store.delete(ids)
+                if self.lexical_index is not None:
+                    self.lexical_index.delete(ids)
+            finally:
+                self.corpus_version += 1
+
+    def delete_source(self, source):
+        """
+        Delete every chunk of a source with a single metadata-filtered delete.
+        Returns the number of chunks removed.
+        """
+        with self._lock:
+            try:
+                deleted = self.store.delete_source(source)
+                if self.lexical_index is not None:
+                    self.lexical_index.delete_source(source)
+            finally:
+                self.corpus_version += 1
+            return deleted
+
+    def search(self, query, k, score_threshold=None):
+        """Return up to `k` (document, relevance score) pairs, best first."""
+        return self.store.search(query, k, score_threshold)
+
+    def search_many(self, queries, k, score_threshold=None):
+        """
+        `search` for a batch of questions: they are embedded in one call and
+        looked up in one pass over the store.
+        """
+        results = self.store.search_by_vectors(embed_queries(self.embedding_function, queries), k)
+        if score_threshold is not None:
+            results = [[(document, score) for document, score in found if score >= score_threshold] for found in results]
+        return results
+
+    def keyword_search(self, query, k):
+        """Return up to `k` (document, BM25 score) pairs from the lexical index, best first."""
+        if self.lexical_index is None:
+            return []
+        return self.lexical_index.search(query, k)
+
+    def reload(self):
+        """Drop the current handle and reopen the store from disk."""
+        with self._lock:
+            self._store = self._open()
+            self.generation += 1
+            return self._store
+
+    def reset(self):
+        """Drop the whole collection and recreate it empty."""
+        with self._lock:
+            self.store.drop()
+            logging.info("Dropped vector store collection.")
+            if self.lexical_index is not None:
+                self.lexical_index.clear()
+            self.corpus_version += 1
+            return self.reload()
+
+
+def copy_chunks(source, target, batch_size=1000, progress=None):
+    """
+    Copy every chunk, with its embedding, from one backend to another, a
+    batch at a time. Returns the number of chunks copied.
+    """
+    copied = 0
+    while True:
+        batch = source.get(include=["documents", "metadatas", "embeddings"], limit=batch_size, offset=copied)
+        if not len(batch["ids"]):
+            return copied
+        target.upsert(list(batch["ids"]), list(batch["documents"]), list(batch["metadatas"]), batch["embeddings"])
+        copied += len(batch["ids"])
+        if progress:
+            progress(copied)
+
+
+def get_vector_store():
+    """Return the vector store service of the current application."""
+    return current_app.extensions["vector_store"]
+
+
+@click.command("migrate-vector-store")
+@click.option("--to", "target", type=click.Choice(sorted(BACKENDS)), default="numpy", show_default=True,
+              help="Backend to copy the chunks into, from the other one.")
+@click.option("--dtype", type=click.Choice(["float32", "float16", "int8"]), default=None,
+              help="Storage type of the numpy backend (default: VECTOR_STORE_DTYPE).")
+@click.option("--batch-size", default=1000, show_default=True)
+@with_appcontext
+def migrate_vector_store_command(target, dtype, batch_size):
+    """
+    Copy the chunks and their embeddings between the Chroma store (data/db)
+    and the numpy store (data/vectors), without embedding anything again.
+    Set VECTOR_STORE to the new backend afterwards.
+    """
+    from .routes import folder_path, vector_dir
+    config = current_app.config
+    service = get_vector_store()
+    directories = {"chroma": folder_path, "numpy": vector_dir}
+    options = {"numpy": {"dtype": dtype or config["VECTOR_STORE_DTYPE"], "rescore": config["VECTOR_STORE_RESCORE"]}}
+    source_name = "chroma" if target == "numpy" else "numpy"
+
+    source = BACKENDS[source_name](directories[source_name], service.embedding_function, **options.get(source_name, {}))
+    os.makedirs(directories[target], exist_ok=True)
+    destination = BACKENDS[target](directories[target], service.embedding_function, **options.get(target, {}))
+    if destination.count():
+        raise click.ClickException(f"The {target} store at {directories[target]} is not empty.")
+
+    total = source.count()
+    click.echo(f"Copying {total} chunks from {source_name} to {target}")
+    copied = copy_chunks(source, destination, batch_size, lambda done: click.echo(f"  {done}/{total}"))
+    click.echo(f"Copied {copied} chunks. Set PDFQUERYAI_VECTOR_STORE={target} to use them.")
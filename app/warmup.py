@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+class Warmup:
+    """
+    The embedding model, the reranker and the Chroma store are created on
+    first use, so the application (health checks and the web UI included)
+    is served as soon as it starts. `run` loads them ahead of the first
+    question, along with the Ollama model (by sending it a one-line prompt),
+    and records how long each took.
+    """
+
+    def __init__(self, embedding, vector_store, llm, reranker=None):
+        self.embedding = embedding
+        self.vector_store = vector_store
+        self.llm = llm
+        self.reranker = reranker
+        self.timings = {}
+        self.running = False
+        self.llm_ready = False
+        self.error = None
+        self._lock = threading.Lock()
+
+    def components(self):
+        """Whether each component is loaded; None for a component that is not configured."""
+        return {
+            "embedding": getattr(self.embedding, "loaded", True),
+            "vector_store": self.vector_store.is_open,
+            "reranker": self.reranker.loaded if self.reranker is not None else None,
+            "llm": self.llm_ready,
+        }
+
+    def ready(self):
+        """
+        True once everything needed to answer a question without a load delay
+        is in place. The LLM is not part of it: Ollama loads (and unloads)
+        its models on its own.
+        """
+        components = self.components()
+        return all(components[name] is not False for name in ("embedding", "vector_store", "reranker"))
+
+    def run(self, llm=True):
+        """Load every component, returning the seconds each took."""
+        steps = [
+            ("embedding", getattr(self.embedding, "load", None)),
+            ("vector_store", self.vector_store.count),
+            ("reranker", self.reranker.load if self.reranker is not None else None),
+            ("llm", (lambda: self.llm.invoke("Reply with OK.", stop=["\n"])) if llm else None),
+        ]
+        with self._lock:
+            self.running = True
+            try:
+                timings = {}
+                for name, step in steps:
+                    if step is None:
+                        continue
+                    start = time.perf_counter()
+                    step()
+                    timings[name] = round(time.perf_counter() - start, 3)
+                    if name == "llm":
+                        self.llm_ready = True
+                self.timings.update(timings)
+                self.error = None
+                logging.info(f"Warmup done: {timings}")
+                return timings
+            except Exception as e:
+                self.error = str(e)
+                raise
+            finally:
+                self.running = False
+
+    def start(self, llm=True):
+        """Run the warmup in a background thread."""
+        def run():
+            try:
+                self.run(llm)
+            except Exception as e:
+                logging.error(f"Error during warmup: {str(e)}")
+
+        threading.Thread(target=run, name="warmup", daemon=True).start()
+
+
+def start_warmup(app):
+    """Warm up in the background if WARMUP_ON_START is set; for the serving entry points."""
+    if app.config["WARMUP_ON_START"]:
+        app.extensions["warmup"].start(llm=app.config["WARMUP_LLM"])
+
+
+def get_warmup():
+    """Return the warmup of the current application."""
+    return current_app.extensions["warmup"]
+
+
+@click.command("warmup")
+@click.option("--llm/--no-llm", default=True, help="Also load the Ollama model.")
+@with_appcontext
+def warmup_command(llm):
+    """Load the models and open the stores, reporting how long each took."""
+    for name, seconds in get_warmup().run(llm=llm).items():
+        click.echo(f"{name}: {seconds:.2f} s")
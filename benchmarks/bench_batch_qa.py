@@ -0,0 +1,124 @@
+"""
+Answering a list of questions one /ask_pdf request at a time versus one
+/ask_pdf_batch request, through the Flask test client with the stand-in
+models (fully offline). The fake LLM sleeps `--token-delay` seconds per
+character of its answer, standing in for Ollama; LLM_CONCURRENCY is the
+number of generations it serves at once, as with OLLAMA_NUM_PARALLEL.
+
+The answer cache is off, so every question is retrieved and generated in
+both runs. The test client sends no session cookie: every /ask_pdf question
+is standalone, as in the batch, with no chat history to rewrite it against. The wall time of each run is reported, with the serial time the
+batch endpoint itself estimates (the durations of its questions added up).
+
+    python benchmarks/bench_batch_qa.py --questions 100 --token-delay 0.002 --concurrency 4
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# No telemetry calls from Chroma: the benchmark must run without network
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+from synthetic import WORDS, write_corpus
+
+
+def questions(count, documents, pages, seed):
+    """Distinct part-number lookups and wordy questions about the corpus."""
+    rnd = random.Random(seed)
+    result = []
+    for i in range(count):
+        if i % 2 == 0:
+            result.append(f"Which components are listed next to part PN-{rnd.randrange(documents):04d}-"
+                          f"{rnd.randrange(pages):05d}-{rnd.randrange(40):03d}?")
+        else:
+            result.append(f"What does the manual say about {' '.join(rnd.sample(WORDS, 3))} ({i})?")
+    return result
+
+
+def run(args):
+    from app import create_app
+
+    # The fake embedding is not normalized: its relevance scores are out of range
+    warnings.simplefilter("ignore")
+    app = create_app({
+        "LLM_MODEL": "fake",
+        "FAKE_LLM_TOKEN_DELAY": args.token_delay,
+        "EMBEDDING_MODEL": "fake",
+        "ANSWER_CACHE_SIZE": 0,
+        "LLM_CONCURRENCY": args.concurrency,
+        "LLM_MAX_QUEUE": max(32, args.questions),
+        "BATCH_MAX_QUESTIONS": max(200, args.questions),
+        "PDF_PARSE_WORKERS": 1,
+    })
+    client = app.test_client(use_cookies=False)
+    for path in write_corpus("corpus", args.documents, args.pages, seed=args.seed):
+        with open(path, "rb") as f:
+            client.post("/pdf", data={"file": (f, os.path.basename(path))}, content_type="multipart/form-data")
+    app.extensions["ingestion"].join()
+    corpus_questions = questions(args.questions, args.documents, args.pages, args.seed)
+
+    start = time.perf_counter()
+    errors = 0
+    for question in corpus_questions:
+        response = client.post("/ask_pdf", json={"query": question, "promptType": "General AI Assistant"})
+        errors += response.status_code != 200
+    serial = {"wall_seconds": round(time.perf_counter() - start, 3), "errors": errors}
+
+    start = time.perf_counter()
+    response = client.post("/ask_pdf_batch", json={"queries": corpus_questions, "promptType": "General AI Assistant"})
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    final = events[-1]
+    batch = {
+        "wall_seconds": round(time.perf_counter() - start, 3),
+        "answered": sum(event["type"] == "result" for event in events),
+        "errors": sum(event["type"] == "error" for event in events),
+        "reported": {name: final.get(name) for name in ("wall_seconds", "serial_seconds", "speedup", "timings")},
+    }
+    app.extensions["pdf_parser"].shutdown()
+    return {
+        "benchmark": "batch_qa",
+        "config": {name: getattr(args, name) for name in ("documents", "pages", "questions", "token_delay", "concurrency")},
+        "serial": serial,
+        "batch": batch,
+        "speedup": round(serial["wall_seconds"] / batch["wall_seconds"], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--token-delay", type=float, default=0.002, help="Seconds per character of the fake LLM.")
+    parser.add_argument("--concurrency", type=int, default=4, help="LLM_CONCURRENCY (generations served at once).")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # The application keeps its data under the working directory
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="bench_batch_qa_")
+    os.chdir(directory)
+    try:
+        results = run(args)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"{args.questions} questions, fake LLM at {args.token_delay * 1000:g} ms per character, "
+          f"LLM_CONCURRENCY={args.concurrency}", file=sys.stderr)
+    print(f"before: one /ask_pdf per question  {results['serial']['wall_seconds']:8.2f} s", file=sys.stderr)
+    print(f"after:  one /ask_pdf_batch         {results['batch']['wall_seconds']:8.2f} s  "
+          f"(speedup {results['speedup']}x, {results['batch']['errors']} errors)", file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
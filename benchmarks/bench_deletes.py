@@ -0,0 +1,97 @@
+"""
+Deleting one PDF's chunks and clearing the store: the previous full-scan,
+one-id-per-call approach versus the metadata-filtered delete and the
+collection drop used by VectorStoreService.
+
+    python benchmarks/bench_deletes.py --chunks 100000 --sources 100
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# No telemetry calls from Chroma: the benchmark must run without network
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import numpy as np
+from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.vector_store import VectorStoreService
+
+
+def populate(service, chunks, sources, dim, batch_size=5000):
+    collection = service.store.chroma._collection
+    rnd = np.random.default_rng(0)
+    for start in range(0, chunks, batch_size):
+        ids = [f"chunk-{i}" for i in range(start, min(start + batch_size, chunks))]
+        collection.add(
+            ids=ids,
+            embeddings=rnd.random((len(ids), dim), dtype=np.float32).tolist(),
+            documents=[f"chunk {i} text" for i in range(start, start + len(ids))],
+            metadatas=[{"source": f"doc_{i % sources}.pdf"} for i in range(start, start + len(ids))],
+        )
+
+
+def old_delete_source(store, source):
+    # What /delete_pdf used to do
+    db_data = store.get()
+    ids = [id for id, metadata in zip(db_data["ids"], db_data["metadatas"]) if metadata.get("source").strip().lower() == source]
+    for doc_id in ids:
+        store.delete(doc_id)
+    return len(ids)
+
+
+def old_clear(store):
+    # What clear_vector_store used to do
+    ids = store.get()["ids"]
+    for doc_id in ids:
+        store.delete(doc_id)
+    return len(ids)
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    removed = fn()
+    print(f"{label:<45} removed {removed:7d} chunks in {time.perf_counter() - start:8.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--sources", type=int, default=100)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--skip-old-clear", action="store_true", help="The per-id clear takes minutes on large stores.")
+    args = parser.parse_args()
+
+    embedding = DeterministicFakeEmbedding(size=args.dim)
+    persist_directory = tempfile.mkdtemp(prefix="bench_deletes_")
+    try:
+        service = VectorStoreService(persist_directory, embedding)
+        print(f"Populating {args.chunks} chunks across {args.sources} sources ...")
+        populate(service, args.chunks, args.sources, args.dim)
+        store = Chroma(persist_directory=persist_directory, embedding_function=embedding)
+
+        timed("before: full get() + per-id deletes (1 PDF)", lambda: old_delete_source(store, "doc_0.pdf"))
+        timed("after: delete(where=source) (1 PDF)", lambda: service.delete_source("doc_1.pdf"))
+
+        if not args.skip_old_clear:
+            timed("before: clear with per-id deletes", lambda: old_clear(store))
+            populate(service, args.chunks, args.sources, args.dim)
+
+        def new_clear():
+            before = service.count()
+            service.reset()
+            return before - service.count()
+
+        timed("after: drop and recreate collection", new_clear)
+    finally:
+        shutil.rmtree(persist_directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+End-to-end benchmark of the application, fully offline: a synthetic PDF
+corpus is written, then the real routes of create_app() are driven through
+the Flask test client with the stand-in models (LLM_MODEL and
+EMBEDDING_MODEL set to "fake"), in the order a user would:
+
+- /pdf: upload every document, then wait for the ingestion jobs;
+- /list_documents;
+- /ask_pdf: part-number lookups and wordy questions, answered by the full
+  retrieval chain (rewrite, hybrid retrieval, packing, fake generation);
+- /delete_pdf: half of the documents, one at a time;
+- /clear_db.
+
+For each endpoint the script reports throughput, p50/p95/p99 latency and
+the peak RSS of this process after its phase, as JSON on stdout for regression tracking, with a summary on stderr. With
+--baseline the results are compared with a previous run, and the exit code
+is 1 when a p95 latency grew by more than --tolerance.
+
+    python benchmarks/bench_e2e.py --documents 10 --pages 20 --questions 200 > e2e.json
+    python benchmarks/bench_e2e.py --documents 10 --pages 20 --questions 200 --baseline e2e.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# No telemetry calls from Chroma: the benchmark must run without network
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+from synthetic import WORDS, write_corpus
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))]
+
+
+def peak_rss_mb():
+    """Peak RSS of this process."""
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+class Phase:
+    """Latencies and failures of the requests sent to one endpoint."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.latencies = []
+        self.errors = []
+        self.seconds = 0.0
+
+    def run(self, send, items, concurrency=1):
+        """Call `send(item)` for every item, `concurrency` at a time; it returns None or an error."""
+        def timed(item):
+            start = time.perf_counter()
+            try:
+                error = send(item)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            return time.perf_counter() - start, error
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for seconds, error in executor.map(timed, items):
+                self.latencies.append(seconds)
+                if error:
+                    self.errors.append(error)
+        self.seconds += time.perf_counter() - start
+        return self
+
+    def report(self):
+        latencies = self.latencies or [0.0]
+        return {
+            "requests": len(self.latencies),
+            "errors": len(self.errors),
+            "first_error": self.errors[0] if self.errors else None,
+            "throughput_rps": round(len(self.latencies) / self.seconds, 2) if self.seconds else None,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 0.50) * 1000, 2),
+                "p95": round(percentile(latencies, 0.95) * 1000, 2),
+                "p99": round(percentile(latencies, 0.99) * 1000, 2),
+                "mean": round(sum(latencies) / len(latencies) * 1000, 2),
+                "max": round(max(latencies) * 1000, 2),
+            },
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+
+def questions(count, documents, pages, lines_per_page, seed):
+    """Deterministic mix of part-number lookups and wordy questions about the corpus."""
+    rnd = random.Random(seed)
+    result = []
+    for i in range(count):
+        if i % 2 == 0:
+            part = f"PN-{rnd.randrange(documents):04d}-{rnd.randrange(pages):05d}-{rnd.randrange(lines_per_page):03d}"
+            result.append(f"Which components are listed next to part {part}?")
+        else:
+            result.append(f"What does the manual say about {' '.join(rnd.sample(WORDS, 3))}?")
+    return result
+
+
+def check_response(response, expected=200):
+    if response.status_code != expected:
+        return f"HTTP {response.status_code}: {response.get_data(as_text=True)[:200]}"
+    return None
+
+
+def run(args):
+    from app import create_app
+
+    config = {
+        "LLM_MODEL": "fake",
+        "FAKE_LLM_TOKEN_DELAY": args.token_delay,
+        "EMBEDDING_MODEL": "fake",
+        "ANSWER_CACHE_SIZE": args.answer_cache,
+        "PDF_PARSE_WORKERS": args.parse_workers,
+        "INGEST_MAX_PENDING": max(32, args.documents),
+    }
+    paths = write_corpus("corpus", args.documents, args.pages, args.lines_per_page, seed=args.seed)
+    app = create_app(config)
+    # No session cookie: every question is standalone, not a follow-up of the previous ones
+    client = app.test_client(use_cookies=False)
+    phases = {}
+
+    def upload(path):
+        with open(path, "rb") as f:
+            response = client.post("/pdf", data={"file": (f, os.path.basename(path))}, content_type="multipart/form-data")
+        if response.status_code == 202:
+            jobs.append(response.json["job_id"])
+        return check_response(response, 202)
+
+    jobs = []
+    start = time.perf_counter()
+    phases["/pdf"] = Phase("/pdf").run(upload, paths, args.concurrency)
+    app.extensions["ingestion"].join()
+    ingest_seconds = time.perf_counter() - start
+    states = [client.get(f"/jobs/{job_id}").json for job_id in jobs]
+    ingestion = {
+        "documents": len(states),
+        "failed": sum(state["status"] != "completed" for state in states),
+        "pages": sum(state["pages"] for state in states),
+        "chunks": sum(state["chunks"] for state in states),
+        "seconds": round(ingest_seconds, 3),
+        "pages_per_second": round(sum(state["pages"] for state in states) / ingest_seconds, 1),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+    phases["/list_documents"] = Phase("/list_documents").run(
+        lambda _: check_response(client.get("/list_documents")), range(args.list_requests), args.concurrency
+    )
+
+    def ask(question):
+        body = {"query": question, "promptType": "General AI Assistant", "stream": args.stream}
+        response = client.post("/ask_pdf", json=body)
+        error = check_response(response)
+        if error is None and args.stream:
+            last = json.loads(response.get_data(as_text=True).strip().splitlines()[-1])
+            error = last.get("error")
+        return error
+
+    corpus_questions = questions(args.questions, args.documents, args.pages, args.lines_per_page, args.seed)
+    phases["/ask_pdf"] = Phase("/ask_pdf").run(ask, corpus_questions, args.concurrency)
+
+    phases["/delete_pdf"] = Phase("/delete_pdf").run(
+        lambda path: check_response(client.post("/delete_pdf", json={"file_name": os.path.basename(path)})),
+        paths[: max(1, len(paths) // 2)],
+        args.concurrency,
+    )
+    phases["/clear_db"] = Phase("/clear_db").run(lambda _: check_response(client.post("/clear_db")), range(1))
+    app.extensions["pdf_parser"].shutdown()
+
+    return {
+        "benchmark": "e2e",
+        "config": {name: getattr(args, name) for name in (
+            "documents", "pages", "lines_per_page", "questions", "list_requests", "concurrency",
+            "stream", "token_delay", "answer_cache", "parse_workers", "seed",
+        )},
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "ingestion": ingestion,
+        "endpoints": {endpoint: phase.report() for endpoint, phase in phases.items()},
+    }
+
+
+def summarize(results, out=sys.stderr):
+    ingestion = results["ingestion"]
+    print(f"ingestion: {ingestion['documents']} documents, {ingestion['pages']} pages, {ingestion['chunks']} chunks "
+          f"in {ingestion['seconds']:.1f} s ({ingestion['pages_per_second']} pages/s), {ingestion['failed']} failed", file=out)
+    print(f"{'endpoint':<16} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak RSS MB':>12}", file=out)
+    for endpoint, report in results["endpoints"].items():
+        latency = report["latency_ms"]
+        print(f"{endpoint:<16} {report['requests']:>8} {report['errors']:>6} {report['throughput_rps'] or 0:>8.1f} "
+              f"{latency['p50']:>9.1f} {latency['p95']:>9.1f} {latency['p99']:>9.1f} {report['peak_rss_mb']:>12.1f}",
+              file=out)
+
+
+def compare(results, baseline, tolerance, out=sys.stderr):
+    """Print the p95 change of every endpoint against a baseline; return the regressed endpoints."""
+    regressed = []
+    for endpoint, report in results["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(endpoint)
+        if not before or not before["latency_ms"]["p95"]:
+            continue
+        ratio = report["latency_ms"]["p95"] / before["latency_ms"]["p95"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressed.append(endpoint)
+            flag = "  REGRESSION"
+        print(f"{endpoint:<16} p95 {before['latency_ms']['p95']:9.1f} -> {report['latency_ms']['p95']:9.1f} ms ({ratio:5.2f}x){flag}", file=out)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--lines-per-page", type=int, default=40)
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--list-requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=1, help="Requests in flight per endpoint.")
+    parser.add_argument("--stream", action="store_true", help="Ask for streamed answers, as the web UI does.")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Seconds per character of the fake LLM.")
+    parser.add_argument("--answer-cache", type=int, default=0, help="ANSWER_CACHE_SIZE; off by default.")
+    parser.add_argument("--parse-workers", type=int, default=None, help="PDF_PARSE_WORKERS.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout.")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare with.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 growth over the baseline.")
+    parser.add_argument("--keep", action="store_true", help="Keep the working directory.")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    # The application keeps its data under the working directory
+    cwd = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="bench_e2e_")
+    os.chdir(directory)
+    try:
+        results = run(args)
+    finally:
+        os.chdir(cwd)
+        if args.keep:
+            print(f"working directory: {directory}", file=sys.stderr)
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    summarize(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if baseline is not None and compare(results, baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
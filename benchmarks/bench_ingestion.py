@@ -0,0 +1,110 @@
+"""
+Time and peak memory of ingesting one large PDF: the previous path (load and
+split everything, then Chroma.from_documents) versus the streaming, batched
+pipeline in app.ingestion. Each path runs in its own process so that peak RSS
+is measured independently.
+
+    python benchmarks/bench_ingestion.py --pages 1000 --batch-size 64
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from synthetic import write_pdf
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_old(path, persist_directory, embedding, args):
+    from langchain_community.document_loaders import PDFPlumberLoader
+    from langchain_community.vectorstores import Chroma
+
+    from app.ingestion import text_splitter
+
+    docs = PDFPlumberLoader(path).load_and_split()
+    chunks = text_splitter.split_documents(docs)
+    for chunk in chunks:
+        chunk.metadata = {"source": "synthetic.pdf"}
+    Chroma.from_documents(documents=chunks, embedding=embedding, persist_directory=persist_directory)
+    return len(chunks)
+
+
+def run_new(path, persist_directory, embedding, args):
+    from app.catalog import Catalog
+    from app.ingestion import Job, ingest_pdf
+    from app.pdf_parsing import PageParser
+    from app.vector_store import VectorStoreService
+
+    job = Job(os.path.join(persist_directory, "job.json"), id="bench", filename="synthetic.pdf", path=path, timings={})
+    page_parser = PageParser(workers=args.workers)
+    try:
+        ingest_pdf(
+            job,
+            VectorStoreService(persist_directory, embedding),
+            Catalog(os.path.join(persist_directory, "catalog.sqlite3")),
+            page_parser,
+            batch_size=args.batch_size,
+            max_rss_mb=args.max_rss_mb,
+        )
+    finally:
+        page_parser.shutdown()
+    return job.state["chunks"]
+
+
+def child(args):
+    embedding = DeterministicFakeEmbedding(size=args.dim)
+    persist_directory = tempfile.mkdtemp(prefix="bench_ingestion_db_")
+    try:
+        start = time.perf_counter()
+        chunks = (run_old if args.mode == "old" else run_new)(args.pdf, persist_directory, embedding, args)
+        elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(persist_directory, ignore_errors=True)
+    print(json.dumps({"chunks": chunks, "seconds": elapsed, "peak_rss_mb": peak_rss_mb()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--max-rss-mb", type=int, default=0)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--mode", choices=["old", "new"], help=argparse.SUPPRESS)
+    parser.add_argument("--pdf", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        return child(args)
+
+    directory = tempfile.mkdtemp(prefix="bench_ingestion_")
+    try:
+        path = write_pdf(os.path.join(directory, "synthetic.pdf"), args.pages)
+        print(f"{args.pages}-page synthetic PDF, batch size {args.batch_size}, {args.workers} parse workers")
+        for mode, label in (("old", "before: load_and_split + from_documents"), ("new", "after: streaming batched upsert")):
+            output = subprocess.run(
+                [sys.executable, __file__, "--mode", mode, "--pdf", path, "--batch-size", str(args.batch_size),
+                 "--workers", str(args.workers), "--max-rss-mb", str(args.max_rss_mb), "--dim", str(args.dim)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{label:<42} {result['chunks']:7d} chunks  {result['seconds']:8.1f} s  peak RSS {result['peak_rss_mb']:8.1f} MB")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
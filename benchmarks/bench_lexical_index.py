@@ -0,0 +1,85 @@
+"""
+Query latency of the BM25 lexical index (app.lexical_index) on a large
+synthetic corpus, for exact part-number lookups and for wordy questions whose
+common terms match most chunks. Also reports how often the chunk holding the
+part number is the top hit.
+
+    python benchmarks/bench_lexical_index.py --chunks 100000 --queries 200
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.lexical_index import LexicalIndex
+
+from synthetic import page_lines
+
+
+def populate(index, chunks, lines_per_chunk, batch_size=1000):
+    rnd = random.Random(0)
+    lines = {}
+    for start in range(0, chunks, batch_size):
+        ids, texts, metadatas = [], [], []
+        for i in range(start, min(start + batch_size, chunks)):
+            # One chunk per synthetic page, 1000 pages per source
+            chunk_lines = page_lines(i % 1000, lines_per_chunk, rnd, seed=i // 1000)
+            lines[i] = chunk_lines
+            ids.append(f"chunk-{i}")
+            texts.append(" ".join(chunk_lines))
+            metadatas.append({"source": f"doc_{i // 1000}.pdf", "page": i % 1000, "chunk": 0})
+        index.upsert(ids, texts, metadatas)
+    return lines
+
+
+def measure(label, index, queries, k):
+    timings = []
+    for query, _ in queries:
+        start = time.perf_counter()
+        index.search(query, k)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(f"{label:<28} p50={statistics.median(timings):8.2f} ms  p95={timings[int(len(timings) * 0.95) - 1]:8.2f} ms  max={timings[-1]:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--lines-per-chunk", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench_lexical_")
+    try:
+        index = LexicalIndex(os.path.join(directory, "lexical.sqlite3"))
+        start = time.perf_counter()
+        lines = populate(index, args.chunks, args.lines_per_chunk)
+        size_mb = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)) / (1024 * 1024)
+        print(f"Indexed {index.count()} chunks in {time.perf_counter() - start:.1f} s ({size_mb:.0f} MB on disk)")
+
+        rnd = random.Random(1)
+        targets = [rnd.randrange(args.chunks) for _ in range(args.queries)]
+        part_numbers = [(rnd.choice(lines[i]).split()[-1], i) for i in targets]
+        measure("part number", index, part_numbers, args.k)
+        questions = [(f"What is the torque of the pump bolt with part number {pn}?", i) for pn, i in part_numbers]
+        measure("question with part number", index, questions, args.k)
+        measure("common words only", index, [("pump valve pressure maintenance procedure", None)] * args.queries, args.k)
+
+        top_hits = sum(
+            bool(results) and results[0][0].metadata == {"source": f"doc_{i // 1000}.pdf", "page": i % 1000, "chunk": 0}
+            for results, i in ((index.search(query, args.k), i) for query, i in questions)
+        )
+        print(f"Part-number questions answered by the right chunk at rank 1: {top_hits / len(questions):.1%}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+PDF parsing throughput: the serial PDFPlumberLoader path versus the
+page-parallel PageParser, in pages/sec.
+
+    python benchmarks/bench_pdf_parsing.py --pages 300 --workers 4
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from langchain_community.document_loaders import PDFPlumberLoader
+
+from app.pdf_parsing import PageParser
+from synthetic import write_pdf
+
+
+def measure(label, fn, pages):
+    start = time.perf_counter()
+    parsed = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {parsed:6d} pages  {elapsed:8.2f} s  {pages / elapsed:8.1f} pages/sec")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--pages-per-task", type=int, default=8)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench_pdf_parsing_")
+    try:
+        path = write_pdf(os.path.join(directory, "synthetic.pdf"), args.pages)
+        print(f"{args.pages}-page synthetic PDF, {args.workers} workers, {os.cpu_count()} CPUs")
+
+        measure("serial: PDFPlumberLoader.load()", lambda: len(PDFPlumberLoader(path).load()), args.pages)
+
+        page_parser = PageParser(workers=args.workers, pages_per_task=args.pages_per_task)
+        try:
+            # Pay the worker start-up once, as a long-running server would
+            list(page_parser.parse(write_pdf(os.path.join(directory, "warmup.pdf"), args.workers * args.pages_per_task)))
+            measure(f"parallel: PageParser({args.workers} workers)", lambda: sum(1 for _ in page_parser.parse(path)), args.pages)
+        finally:
+            page_parser.shutdown()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
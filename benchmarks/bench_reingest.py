@@ -0,0 +1,108 @@
+"""
+Re-ingesting a new version of a large PDF in which only a few pages changed:
+deleting the previous version and ingesting the new one from scratch versus
+the in-place update (`replace=true` uploads), which re-embeds only the pages
+whose content hash changed.
+
+Embedding dominates ingestion with a real model; a deterministic fake
+embedding is used instead, with `--embed-ms` of sleep per chunk standing in
+for the model (bge-small takes a few ms per chunk on a CPU). After both runs
+the stored chunks are compared, to check the update left the same corpus.
+
+    python benchmarks/bench_reingest.py --pages 500 --edited-pages 5 --embed-ms 4
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from synthetic import write_pdf
+
+
+class SlowEmbedding(DeterministicFakeEmbedding):
+    """DeterministicFakeEmbedding that takes `delay` seconds per text, like a model would."""
+
+    delay: float = 0.0
+
+    def embed_documents(self, texts):
+        time.sleep(self.delay * len(texts))
+        return super().embed_documents(texts)
+
+
+def ingest(path, services, update=False):
+    """Ingest `path` as synthetic.pdf and return (seconds, job state)."""
+    from app.ingestion import Job, ingest_pdf
+
+    vector_store, catalog, page_parser, directory, batch_size = services
+    job = Job(os.path.join(directory, "job.json"), id="bench", filename="synthetic.pdf", path=path, timings={}, update=update)
+    start = time.perf_counter()
+    ingest_pdf(job, vector_store, catalog, page_parser, batch_size=batch_size)
+    return time.perf_counter() - start, job.state
+
+
+def stored_chunks(vector_store):
+    result = vector_store.get(include=["documents"])
+    return dict(zip(result["ids"], result["documents"]))
+
+
+def main():
+    from app.catalog import Catalog
+    from app.pdf_parsing import PageParser
+    from app.vector_store import VectorStoreService
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--edited-pages", type=int, default=5)
+    parser.add_argument("--embed-ms", type=float, default=4.0, help="Simulated embedding time per chunk.")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--dim", type=int, default=384)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench_reingest_")
+    page_parser = PageParser(workers=args.workers)
+    try:
+        edited = sorted(random.Random(0).sample(range(args.pages), args.edited_pages))
+        first = write_pdf(os.path.join(directory, "v1.pdf"), args.pages)
+        second = write_pdf(os.path.join(directory, "v2.pdf"), args.pages, edited_pages=edited)
+        embedding = SlowEmbedding(size=args.dim, delay=args.embed_ms / 1000)
+        print(f"{args.pages}-page synthetic PDF, {args.edited_pages} pages edited, {args.embed_ms} ms per embedded chunk")
+
+        results = {}
+        for mode in ("full", "update"):
+            persist_directory = os.path.join(directory, mode)
+            vector_store = VectorStoreService(persist_directory, embedding)
+            catalog = Catalog(os.path.join(persist_directory, "catalog.sqlite3"))
+            services = (vector_store, catalog, page_parser, persist_directory, args.batch_size)
+            ingest(shutil.copy(first, os.path.join(directory, f"{mode}.pdf")), services)
+
+            new_version = shutil.copy(second, os.path.join(directory, f"{mode}.pdf"))
+            if mode == "full":
+                start = time.perf_counter()
+                vector_store.delete_source("synthetic.pdf")
+                catalog.release("synthetic.pdf")
+                _, state = ingest(new_version, services)
+                seconds = time.perf_counter() - start
+            else:
+                seconds, state = ingest(new_version, services, update=True)
+            results[mode] = (seconds, state, stored_chunks(vector_store))
+
+        for mode, label in (("full", "before: delete and ingest again"), ("update", "after: update changed pages")):
+            seconds, state, _ = results[mode]
+            print(f"{label:<34} {seconds:8.2f} s  {state['chunks_embedded']:6d} chunks embedded  timings {state['timings']}")
+        print(f"speedup: {results['full'][0] / results['update'][0]:.1f}x, "
+              f"same chunks stored: {results['full'][2] == results['update'][2]}")
+    finally:
+        page_parser.shutdown()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Startup cost of the application, each measurement in a fresh interpreter
+over the same small library:
+
+- import: importing the app package;
+- create_app: building the application, after which /health and the UI are
+  served (models and the Chroma store are loaded on first use);
+- first /health;
+- warmup: loading each component explicitly, as WARMUP_ON_START does in the
+  background;
+- first /ask_pdf: on a cold process (paying for the loads itself) and after
+  the warmup.
+
+The stand-in embedding is used by default, so the script runs offline.
+Measuring the load of the FastEmbed model needs it downloaded once (run
+`flask --app app warmup` with network access).
+
+    python benchmarks/bench_startup.py --runs 3
+    python benchmarks/bench_startup.py --embedding-model BAAI/bge-small-en-v1.5
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from synthetic import document_lines
+
+
+def child(args):
+    """One measurement, in this process; prints a JSON object."""
+    start = time.perf_counter()
+    from app import create_app
+    timings = {"import": time.perf_counter() - start}
+
+    config = {"EMBEDDING_MODEL": args.embedding_model, "LLM_MODEL": args.llm, "ANSWER_CACHE_SIZE": 0}
+    start = time.perf_counter()
+    app = create_app(config)
+    timings["create_app"] = time.perf_counter() - start
+
+    client = app.test_client()
+    if args.step == "populate":
+        from langchain_core.documents import Document
+        with app.app_context():
+            app.extensions["vector_store"].add_documents([
+                Document(page_content=" ".join(lines), metadata={"source": "synthetic.pdf", "page": page, "chunk": 0})
+                for page, lines in enumerate(document_lines(pages=20, lines_per_page=10))
+            ])
+    else:
+        start = time.perf_counter()
+        client.get("/health")
+        timings["first /health"] = time.perf_counter() - start
+        if args.step == "warm":
+            timings.update({f"warmup {name}": seconds for name, seconds in app.extensions["warmup"].run().items()})
+        start = time.perf_counter()
+        response = client.post("/ask_pdf", json={"query": "Which components are listed?", "promptType": "General AI Assistant"})
+        assert response.status_code == 200, response.get_data(as_text=True)
+        timings[f"first /ask_pdf ({args.step})"] = time.perf_counter() - start
+    print(json.dumps(timings))
+
+
+def run_child(args, step, directory):
+    command = [sys.executable, os.path.abspath(__file__), "--child", step,
+               "--embedding-model", args.embedding_model, "--llm", args.llm]
+    env = dict(os.environ, ANONYMIZED_TELEMETRY="False")
+    output = subprocess.run(command, cwd=directory, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--embedding-model", default="fake",
+                        help="EMBEDDING_MODEL; a FastEmbed model also measures loading it.")
+    parser.add_argument("--llm", default="fake", help="LLM_MODEL; an Ollama model also measures loading it.")
+    parser.add_argument("--child", choices=["populate", "cold", "warm"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.step = args.child
+        return child(args)
+
+    directory = tempfile.mkdtemp(prefix="bench_startup_")
+    try:
+        run_child(args, "populate", directory)
+        results = {}
+        for _ in range(args.runs):
+            for step in ("cold", "warm"):
+                for name, seconds in run_child(args, step, directory).items():
+                    results.setdefault(name, []).append(seconds)
+        print(f"embedding model {args.embedding_model}, LLM {args.llm}, median of {args.runs} runs")
+        for name, values in results.items():
+            print(f"  {name:<28} {statistics.median(values):8.3f} s")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
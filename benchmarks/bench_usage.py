@@ -0,0 +1,131 @@
+"""
+PDF usage analytics: the cost of the usage block of an /ask_pdf response as
+the number of PDFs grows, with the previous module-level dicts (the total
+summed again for every PDF, O(n^2)) versus UsageAnalytics (running total,
+O(n)); then the counters under concurrency: threads recording at once must
+not lose counts, and processes sharing the SQLite file must add up.
+
+    python benchmarks/bench_usage.py --sources 100 1000 5000 --threads 8 --processes 4
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.usage import UsageAnalytics, usage_shares
+
+# Chunks of context per answer, as with CONTEXT_MAX_TOKENS packing
+CHUNKS_PER_ANSWER = 8
+
+
+def answer_sources(i, sources):
+    return [f"manual_{(i * 7 + j) % sources:05d}.pdf" for j in range(CHUNKS_PER_ANSWER)]
+
+
+def before_response(pdf_usage_count, used):
+    """The previous build_answer_response usage block."""
+    query_usage_count = {}
+    for pdf_source in used:
+        if pdf_source in pdf_usage_count:
+            pdf_usage_count[pdf_source] += 1
+        else:
+            pdf_usage_count[pdf_source] = 1
+        if pdf_source in query_usage_count:
+            query_usage_count[pdf_source] += 1
+        else:
+            query_usage_count[pdf_source] = 1
+    return {
+        "pdf_usage": {pdf: {"count": count, "percentage": (count / sum(pdf_usage_count.values()) * 100) if sum(pdf_usage_count.values()) > 0 else 0} for pdf, count in pdf_usage_count.items()},
+        "query_usage": {pdf: {"count": count, "percentage": (count / sum(query_usage_count.values()) * 100) if sum(query_usage_count.values()) > 0 else 0} for pdf, count in query_usage_count.items()},
+    }
+
+
+def after_response(usage, used):
+    from collections import Counter
+
+    usage.record(used)
+    counts, total = usage.snapshot()
+    return {"pdf_usage": usage_shares(counts, total), "query_usage": usage_shares(Counter(used), len(used))}
+
+
+def bench_responses(sources, answers, directory):
+    counts = {}
+    for i in range(sources):  # Every PDF already used once
+        counts[f"manual_{i:05d}.pdf"] = 1
+    start = time.perf_counter()
+    for i in range(answers):
+        before = before_response(counts, answer_sources(i, sources))
+    before_ms = (time.perf_counter() - start) / answers * 1000
+
+    usage = UsageAnalytics(os.path.join(directory, f"usage_{sources}.sqlite3"), flush_interval=3600)
+    usage.record(f"manual_{i:05d}.pdf" for i in range(sources))
+    start = time.perf_counter()
+    for i in range(answers):
+        after = after_response(usage, answer_sources(i, sources))
+    after_ms = (time.perf_counter() - start) / answers * 1000
+    usage.close()
+    assert before["pdf_usage"] == after["pdf_usage"], "different usage blocks"
+    return before_ms, after_ms
+
+
+def record_in_process(path, answers, sources):
+    usage = UsageAnalytics(path, flush_interval=0.05)
+    for i in range(answers):
+        usage.record(answer_sources(i, sources))
+    usage.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sources", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--answers", type=int, default=200, help="Responses built per measurement.")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--records", type=int, default=5000, help="Answers recorded by each thread or process.")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench_usage_")
+    try:
+        print(f"usage block of one response, {CHUNKS_PER_ANSWER} chunks per answer")
+        for sources in args.sources:
+            before_ms, after_ms = bench_responses(sources, args.answers, directory)
+            print(f"{sources:6d} PDFs  before {before_ms:9.3f} ms  after {after_ms:7.3f} ms  ({before_ms / after_ms:7.1f}x)")
+
+        usage = UsageAnalytics(os.path.join(directory, "threads.sqlite3"), flush_interval=0.05)
+        workers = [threading.Thread(target=lambda: [usage.record(answer_sources(i, 100)) for i in range(args.records)])
+                   for _ in range(args.threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        seconds = time.perf_counter() - start
+        usage.close()
+        expected = args.threads * args.records * CHUNKS_PER_ANSWER
+        print(f"{args.threads} threads: {expected} uses recorded in {seconds:.2f} s "
+              f"({args.threads * args.records / seconds:,.0f} answers/s), total {usage.snapshot()[1]} (expected {expected})")
+
+        path = os.path.join(directory, "processes.sqlite3")
+        processes = [multiprocessing.Process(target=record_in_process, args=(path, args.records, 100))
+                     for _ in range(args.processes)]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        seconds = time.perf_counter() - start
+        expected = args.processes * args.records * CHUNKS_PER_ANSWER
+        total = UsageAnalytics(path).snapshot()[1]
+        print(f"{args.processes} processes sharing the file: total {total} (expected {expected}) in {seconds:.2f} s")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
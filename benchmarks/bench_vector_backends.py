@@ -0,0 +1,213 @@
+"""
+Recall@k, query latency and memory of the vector store backends on a
+synthetic corpus of clustered, normalized embeddings (like a sentence
+embedding model's): Chroma (HNSW) and the numpy backend with float32,
+float16 and int8 storage.
+
+Every store is built in one process and queried in a fresh one, so the RSS
+of the query process is what serving the store costs (memory-mapped pages
+that were read included). Recall is measured against exact float32 search.
+The numpy backend is also timed answering queries in batches.
+
+    python benchmarks/bench_vector_backends.py --chunks 100000 --queries 200
+    python benchmarks/bench_vector_backends.py --chunks 1000000 --backends numpy-float16 numpy-int8
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# No telemetry calls from Chroma
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+import numpy as np
+
+BACKENDS = ("chroma", "numpy-float32", "numpy-float16", "numpy-int8")
+
+
+def normalized(vectors):
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def write_corpus(path, chunks, dim, seed=0, cluster_size=100, block=50000):
+    """Write `chunks` embeddings scattered around chunks / cluster_size centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.normal(size=(max(1, chunks // cluster_size), dim)).astype(np.float32)
+    corpus = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(chunks, dim))
+    for start in range(0, chunks, block):
+        stop = min(chunks, start + block)
+        noise = rng.normal(scale=0.6, size=(stop - start, dim)).astype(np.float32)
+        corpus[start:stop] = normalized(centroids[rng.integers(len(centroids), size=stop - start)] + noise)
+    corpus.flush()
+    return corpus
+
+
+def exact_top_k(corpus, queries, k, block=50000):
+    """Indices of the k nearest corpus rows of each query, by exact squared L2 distance."""
+    best = np.zeros((len(queries), 0), dtype=np.float32)
+    best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+    for start in range(0, len(corpus), block):
+        matrix = np.asarray(corpus[start:start + block])
+        distances = (matrix * matrix).sum(axis=1) - 2 * queries @ matrix.T
+        best = np.concatenate([best, distances], axis=1)
+        best_rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, start + len(matrix)), distances.shape)], axis=1)
+        keep = np.argsort(best, axis=1)[:, :k]
+        best, best_rows = np.take_along_axis(best, keep, axis=1), np.take_along_axis(best_rows, keep, axis=1)
+    return best_rows
+
+
+def open_backend(name, directory):
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    from app.vector_store import BACKENDS as APP_BACKENDS
+
+    embedding = DeterministicFakeEmbedding(size=8)  # Unused: every query comes as a vector
+    if name == "chroma":
+        return APP_BACKENDS["chroma"](directory, embedding)
+    return APP_BACKENDS["numpy"](directory, embedding, dtype=name.split("-")[1])
+
+
+def search(backend, name, query, k):
+    """Indices (the `page` metadata) of the k best chunks for one query vector."""
+    if name == "chroma":
+        results = backend.chroma.similarity_search_by_vector_with_relevance_scores(query.tolist(), k=k)
+    else:
+        results = backend.search_by_vectors([query], k)[0]
+    return [document.metadata["page"] for document, _ in results]
+
+
+def rss_mb():
+    from app.ingestion import current_rss_mb
+    return round(current_rss_mb(), 1)
+
+
+def peak_rss_mb():
+    # ru_maxrss survives exec on Linux, it would report the parent's peak
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def build(args):
+    corpus = np.load(args.corpus, mmap_mode="r")
+    start = time.perf_counter()
+    backend = open_backend(args.backend, args.directory)
+    for first in range(0, len(corpus), args.batch_size):
+        vectors = np.asarray(corpus[first:first + args.batch_size])
+        rows = range(first, first + len(vectors))
+        backend.upsert([f"chunk-{i}" for i in rows], [f"chunk {i} text" for i in rows],
+                       [{"source": "bench.pdf", "page": i, "chunk": 0} for i in rows], vectors.tolist())
+    seconds = time.perf_counter() - start
+    disk = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(args.directory) for name in names)
+    return {"build_seconds": round(seconds, 1), "disk_mb": round(disk / (1024 * 1024), 1)}
+
+
+def query(args):
+    queries = np.load(args.queries)
+    truth = np.load(args.truth)
+    result = {"rss_before_open_mb": rss_mb()}
+    start = time.perf_counter()
+    backend = open_backend(args.backend, args.directory)
+    result["open_seconds"] = round(time.perf_counter() - start, 3)
+
+    latencies, recalls = [], []
+    for index, (vector, expected) in enumerate(zip(queries, truth)):
+        start = time.perf_counter()
+        found = search(backend, args.backend, vector, args.k)
+        seconds = time.perf_counter() - start
+        if index == 0:
+            result["first_query_ms"] = round(seconds * 1000, 1)  # Loads the index (Chroma) or pages (numpy)
+        else:
+            latencies.append(seconds)
+        recalls.append(len(set(found) & set(expected.tolist())) / args.k)
+
+    ordered = sorted(latencies) or [0.0]
+    result.update({
+        f"recall@{args.k}": round(statistics.mean(recalls), 4),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+    })
+    if args.backend != "chroma":
+        start = time.perf_counter()
+        for first in range(0, len(queries), args.query_batch):
+            backend.search_by_vectors(queries[first:first + args.query_batch], args.k)
+        result["batched_qps"] = round(len(queries) / (time.perf_counter() - start), 1)
+    result.update({"rss_mb": rss_mb(), "peak_rss_mb": peak_rss_mb()})
+    return result
+
+
+def run_child(args, step, backend, directory, paths):
+    command = [sys.executable, os.path.abspath(__file__), "--child", step, "--backend", backend, "--directory", directory,
+               "--corpus", paths["corpus"], "--queries-file", paths["queries"], "--truth", paths["truth"],
+               "--k", str(args.k), "--batch-size", str(args.batch_size), "--query-batch", str(args.query_batch)]
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--batch-size", type=int, default=5000, help="Chunks per insert while building.")
+    parser.add_argument("--query-batch", type=int, default=32, help="Queries per batch for the batched numpy search.")
+    parser.add_argument("--child", choices=["build", "query"], help=argparse.SUPPRESS)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--directory", help=argparse.SUPPRESS)
+    parser.add_argument("--corpus", help=argparse.SUPPRESS)
+    parser.add_argument("--queries-file", dest="queries_path", help=argparse.SUPPRESS)
+    parser.add_argument("--truth", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.queries = args.queries_path
+        print(json.dumps(build(args) if args.child == "build" else query(args)))
+        return
+
+    directory = tempfile.mkdtemp(prefix="bench_vector_backends_")
+    try:
+        paths = {name: os.path.join(directory, f"{name}.npy") for name in ("corpus", "queries", "truth")}
+        start = time.perf_counter()
+        corpus = write_corpus(paths["corpus"], args.chunks, args.dim)
+        rng = np.random.default_rng(1)
+        queries = normalized(np.asarray(corpus[rng.integers(args.chunks, size=args.queries)])
+                             + rng.normal(scale=0.05, size=(args.queries, args.dim)).astype(np.float32))
+        np.save(paths["queries"], queries)
+        np.save(paths["truth"], exact_top_k(corpus, queries, args.k))
+        print(f"{args.chunks} chunks of {args.dim} dimensions, {args.queries} queries, "
+              f"ground truth in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+        results = {}
+        for backend in args.backends:
+            store = os.path.join(directory, backend)
+            results[backend] = run_child(args, "build", backend, store, paths)
+            results[backend].update(run_child(args, "query", backend, store, paths))
+            shutil.rmtree(store, ignore_errors=True)
+            result = results[backend]
+            print(f"{backend:<14} recall@{args.k} {result[f'recall@{args.k}']:.3f}  p50 {result['p50_ms']:7.2f} ms  "
+                  f"p95 {result['p95_ms']:7.2f} ms  batched {result.get('batched_qps', '-'):>7} q/s  "
+                  f"RSS {result['rss_mb']:7.1f} MB (peak {result['peak_rss_mb']:7.1f})  disk {result['disk_mb']:7.1f} MB  "
+                  f"build {result['build_seconds']:6.1f} s", file=sys.stderr)
+        print(json.dumps({"chunks": args.chunks, "dim": args.dim, "queries": args.queries, "k": args.k, "backends": results}, indent=2))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
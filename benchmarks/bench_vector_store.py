@@ -0,0 +1,73 @@
+"""
+Per-request vector store latency: re-opening Chroma on every request (the old
+route behaviour) versus going through the shared VectorStoreService.
+
+    python benchmarks/bench_vector_store.py --chunks 20000 --requests 50
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# No telemetry calls from Chroma: the benchmark must run without network
+os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+
+from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from app.vector_store import VectorStoreService
+
+
+def populate(persist_directory, embedding, chunks, batch_size=5000):
+    store = Chroma(persist_directory=persist_directory, embedding_function=embedding)
+    for start in range(0, chunks, batch_size):
+        texts = [f"chunk {i} " + "lorem ipsum " * 150 for i in range(start, min(start + batch_size, chunks))]
+        store.add_texts(texts, metadatas=[{"source": f"doc_{i % 50}.pdf"} for i in range(start, start + len(texts))])
+
+
+def measure(label, fn, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    print(f"{label:<45} mean={statistics.mean(timings):9.2f} ms  p50={statistics.median(timings):9.2f} ms  max={max(timings):9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=384)
+    args = parser.parse_args()
+
+    embedding = DeterministicFakeEmbedding(size=args.dim)
+    persist_directory = tempfile.mkdtemp(prefix="bench_vector_store_")
+    try:
+        print(f"Populating {args.chunks} chunks in {persist_directory} ...")
+        populate(persist_directory, embedding, args.chunks)
+
+        def before():
+            # What /ask_pdf and /pdfManagement used to do on every request
+            store = Chroma(persist_directory=persist_directory, embedding_function=embedding)
+            store.get()
+
+        service = VectorStoreService(persist_directory, embedding)
+        service.count()  # Opened once, at application start
+
+        def after():
+            service.count()
+
+        measure("before: Chroma() + get() per request", before, args.requests)
+        measure("after: shared service, count()", after, args.requests)
+    finally:
+        shutil.rmtree(persist_directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Offline evaluation of the /ask_pdf context: stuffing all retrieved chunks
+versus packing them into a token budget (app.context_packing).
+
+A synthetic corpus is ingested with a bag-of-words embedding, and each
+question of the eval set asks about one line of it. For every mode the script
+reports how often that line made it into the context (evidence recall), the
+size of the context, and the time spent retrieving and packing. With
+--rerank, packing is also evaluated after an embedding reranker has picked
+the best of a wider set of candidates. With --llm
+the questions are also answered by that Ollama model, adding the answer
+latency and the share of the line's words found in the answer.
+
+    python benchmarks/eval_context_packing.py --questions 50 --budgets 600 1200 2400
+    python benchmarks/eval_context_packing.py --llm llama3.1 --questions 20
+
+Many chunks tie on bag-of-words similarity and ties are broken in hash order,
+so set PYTHONHASHSEED to compare runs with each other.
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+from app.catalog import Catalog
+from app.chains import ChainRegistry
+from app.chat_history import estimate_tokens
+from app.config import Config
+from app.lexical_index import LexicalIndex
+from app.ingestion import Job, ingest_pdf, preprocess_text
+from app.llm import create_llm
+from app.pdf_parsing import PageParser
+from app.reranking import EmbeddingReranker
+from app.vector_store import VectorStoreService
+
+from synthetic import HashingEmbedding, document_lines, write_pdf
+
+
+QUESTION = "Which components are listed with part number {}?"
+
+
+def build_eval_set(documents, pages, questions, seed=0):
+    """Pick random lines of the corpus and ask for the components listed with their part number."""
+    rnd = random.Random(seed)
+    lines = [document_lines(pages, seed=i) for i in range(documents)]
+    eval_set = []
+    for _ in range(questions):
+        document = rnd.randrange(documents)
+        line = preprocess_text(rnd.choice(rnd.choice(lines[document])))
+        words, part_number = line.rsplit(" ", 1)
+        eval_set.append({
+            "question": QUESTION.format(part_number),
+            "source": f"synthetic_{document:04d}.pdf",
+            "evidence": line,
+            "expected": sorted(set(words.split())),
+        })
+    return eval_set
+
+
+def ingest_corpus(directory, vector_store, documents, pages):
+    catalog = Catalog(os.path.join(directory, "catalog.sqlite3"))
+    page_parser = PageParser(workers=0)
+    for i in range(documents):
+        name = f"synthetic_{i:04d}.pdf"
+        path = write_pdf(os.path.join(directory, name), pages, seed=i)
+        job = Job(os.path.join(directory, f"{name}.json"), id=name, filename=name, path=path, timings={})
+        ingest_pdf(job, vector_store, catalog, page_parser)
+    return vector_store.count()
+
+
+def evaluate(registry, eval_set, answer):
+    chain = registry.get("General AI Assistant")
+    rows = []
+    for item in eval_set:
+        timings = {}
+        start = time.perf_counter()
+        if answer:
+            result = chain.invoke({"input": item["question"], "chat_history": [], "timings": timings})
+            documents = result["context"]
+        else:
+            documents = registry.retrieve(item["question"], timings=timings)
+            result = None
+        elapsed = time.perf_counter() - start
+
+        context = "\n\n".join(document.page_content for document in documents)
+        row = {
+            "hit": any(item["evidence"] in document.page_content for document in documents
+                       if document.metadata.get("source") == item["source"]),
+            "documents": len(documents),
+            "tokens": estimate_tokens(context) if documents else 0,
+            "retrieval_ms": (timings.get("retrieval", 0) + timings.get("lexical", 0)) * 1000,
+            "packing_ms": timings.get("packing", 0) * 1000,
+            "rerank_ms": timings.get("rerank", 0) * 1000,
+        }
+        if result is not None:
+            text = result["answer"].lower()
+            row["answer_s"] = elapsed
+            row["answer_recall"] = sum(word in text for word in item["expected"]) / len(item["expected"])
+        rows.append(row)
+    return rows
+
+
+def report(label, rows):
+    line = (
+        f"{label:<18} recall={sum(row['hit'] for row in rows) / len(rows):6.1%}"
+        f"  docs={statistics.mean(row['documents'] for row in rows):5.1f}"
+        f"  context={statistics.mean(row['tokens'] for row in rows):7.0f} tok"
+        f"  retrieval={statistics.mean(row['retrieval_ms'] for row in rows):6.1f} ms"
+        f"  packing={statistics.mean(row['packing_ms'] for row in rows):5.2f} ms"
+        f"  rerank={statistics.mean(row['rerank_ms'] for row in rows):6.1f} ms"
+    )
+    if "answer_s" in rows[0]:
+        line += (
+            f"  answer p50={statistics.median(row['answer_s'] for row in rows):6.2f} s"
+            f"  answer recall={statistics.mean(row['answer_recall'] for row in rows):6.1%}"
+        )
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--k", type=int, default=Config.RETRIEVAL_K)
+    parser.add_argument("--score-threshold", type=float, default=-1.0,
+                        help="Bag-of-words scores are much lower than those of the app's sentence embedding.")
+    parser.add_argument("--budgets", type=int, nargs="+", default=[600, Config.CONTEXT_MAX_TOKENS, 2400])
+    parser.add_argument("--retrieval", choices=["vector", "lexical", "hybrid"], default="vector")
+    parser.add_argument("--rerank", type=int, nargs=2, metavar=("CANDIDATES", "TOP_K"),
+                        help="Also evaluate packing after reranking CANDIDATES chunks down to TOP_K.")
+    parser.add_argument("--llm", help="Ollama model answering the questions; retrieval only when omitted.")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="eval_context_")
+    try:
+        # The words of the question template say nothing about the corpus; left
+        # in, their hash collisions would favour the same chunks for every question
+        embedding = HashingEmbedding(stop_words=QUESTION.lower().strip("?").split())
+        # A wide HNSW search, so that approximate search does not add noise to the comparison
+        vector_store = VectorStoreService(os.path.join(directory, "db"), embedding, LexicalIndex(os.path.join(directory, "lexical.sqlite3")),
+                                          collection_metadata={"hnsw:search_ef": 512})
+        chunks = ingest_corpus(directory, vector_store, args.documents, args.pages)
+        eval_set = build_eval_set(args.documents, args.pages, args.questions)
+        llm = create_llm({"LLM_MODEL": args.llm or "fake", "FAKE_LLM_TOKEN_DELAY": 0})
+        print(f"{args.documents} documents, {chunks} chunks, {len(eval_set)} questions, k={args.k}, {args.retrieval} retrieval")
+
+        modes = [(f"packed {budget} tok" if budget else f"stuffed (k={args.k})", budget, None) for budget in [0] + args.budgets]
+        if args.rerank:
+            reranker = EmbeddingReranker(embedding, candidates=args.rerank[0], top_k=args.rerank[1])
+            modes += [(f"reranked {args.rerank[0]}->{args.rerank[1]}", budget, reranker) for budget in args.budgets]
+        for label, budget, reranker in modes:
+            registry = ChainRegistry(llm, vector_store, k=args.k, score_threshold=args.score_threshold,
+                                     context_max_tokens=budget, retrieval_mode=args.retrieval, reranker=reranker)
+            rows = evaluate(registry, eval_set, answer=bool(args.llm))
+            report(f"{label}, {budget} tok" if reranker else label, rows)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
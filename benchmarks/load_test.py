@@ -0,0 +1,157 @@
+"""
+Load test of the ASGI entry point (app.asgi) with stand-in models: /ask_pdf
+runs the full retrieval chain over a small corpus, with the fake LLM
+streaming its canned answer at --token-delay seconds per character and fake
+embeddings, so every request spends most of its time "generating" like a
+real Ollama call would. Answers are streamed, as the web UI asks for them.
+
+For each concurrency level the script sends --requests questions, keeping
+that many in flight, and reports throughput and latency. By default it
+compares the thread-pool adapter of app.asgi with asgiref's WsgiToAsgi,
+which runs every request in the same thread. The LLM gateway's limit is
+lifted unless --llm-concurrency is given, so that the LLM_CONCURRENCY
+setting doesn't cap the throughput.
+
+    python benchmarks/load_test.py --concurrency 1 4 16 64
+    python benchmarks/load_test.py --adapter threads --threads 128 --concurrency 128
+    python benchmarks/load_test.py --url http://127.0.0.1:5000   # an already running server
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import warnings
+
+import httpx
+import uvicorn
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from synthetic import document_lines
+
+
+def build_app(adapter, token_delay, threads, llm_concurrency):
+    # Imported here: the application keeps its data under the working directory
+    from langchain_core.documents import Document
+
+    from app import create_app
+    from app.asgi import WsgiToAsgi
+
+    config = {
+        "LLM_MODEL": "fake",
+        "FAKE_LLM_TOKEN_DELAY": token_delay,
+        "EMBEDDING_MODEL": "fake",
+        "ANSWER_CACHE_SIZE": 0,
+        "ASGI_THREADS": threads,
+        # No gateway limit by default, so the numbers measure the adapter
+        "LLM_CONCURRENCY": llm_concurrency,
+    }
+    app = create_app(config)
+    with app.app_context():
+        vector_store = app.extensions["vector_store"]
+        if not vector_store.count():
+            vector_store.add_documents([
+                Document(page_content=" ".join(lines), metadata={"source": "synthetic.pdf", "page": page, "chunk": 0})
+                for page, lines in enumerate(document_lines(pages=20, lines_per_page=10))
+            ])
+
+    if adapter == "asgiref":
+        from asgiref.wsgi import WsgiToAsgi as AsgirefWsgiToAsgi
+        return AsgirefWsgiToAsgi(app)
+    return WsgiToAsgi(app, threads=threads)
+
+
+def serve(asgi_app):
+    """Run uvicorn in a background thread; returns the server and its URL."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(asgi_app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+async def ask(client, question):
+    start = time.perf_counter()
+    first_token = None
+    body = {"query": question, "promptType": "General AI Assistant", "stream": True, "session_id": question}
+    async with client.stream("POST", "/ask_pdf", json=body) as response:
+        async for _ in response.aiter_lines():
+            if first_token is None:
+                first_token = time.perf_counter() - start
+        response.raise_for_status()
+    return time.perf_counter() - start, first_token
+
+
+async def run_level(url, concurrency, requests):
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, timeout=600, limits=limits) as client:
+        async def one(i):
+            async with semaphore:
+                # Distinct questions and sessions, so nothing is served from a cache
+                return await ask(client, f"Which components are listed on page {i} (c{concurrency})?")
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    line = (
+        f"  concurrency={concurrency:<4} {requests / elapsed:7.2f} req/s"
+        f"  p50={statistics.median(latencies):6.2f} s  p95={latencies[max(int(len(latencies) * 0.95) - 1, 0)]:6.2f} s"
+        f"  first token p50={statistics.median(first for _, first in results):6.2f} s"
+    )
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level.")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="Seconds per streamed character of the fake LLM.")
+    parser.add_argument("--threads", type=int, default=64, help="ASGI_THREADS of the thread-pool adapter.")
+    parser.add_argument("--llm-concurrency", type=int, default=0,
+                        help="LLM_CONCURRENCY; 0 (the default) lifts the limit of the LLM gateway.")
+    parser.add_argument("--adapter", choices=["threads", "asgiref", "both"], default="both")
+    parser.add_argument("--url", help="Load an already running server instead of starting one.")
+    args = parser.parse_args()
+
+    if args.url:
+        print(f"{args.url}:")
+        for concurrency in args.concurrency:
+            asyncio.run(run_level(args.url, concurrency, args.requests))
+        return
+
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    # Fake embeddings are not normalized, so LangChain complains about every relevance score
+    warnings.filterwarnings("ignore", category=UserWarning)
+    directory = tempfile.mkdtemp(prefix="load_test_")
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        adapters = ["threads", "asgiref"] if args.adapter == "both" else [args.adapter]
+        for adapter in adapters:
+            server, url = serve(build_app(adapter, args.token_delay, args.threads, args.llm_concurrency))
+            print(f"{adapter} adapter ({args.threads} threads):" if adapter == "threads" else f"{adapter} adapter:")
+            try:
+                for concurrency in args.concurrency:
+                    asyncio.run(run_level(url, concurrency, args.requests))
+            finally:
+                server.should_exit = True
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Synthetic PDF corpora for the benchmarks.
+
+The PDFs are written directly (one Helvetica text stream per page), so no PDF
+library is needed to generate them. Every line ends with a unique part number
+such as "PN-0003-00012-034" (document seed, page, line) so lexical lookups
+have exact tokens to find.
+
+HashingEmbedding is a bag-of-words embedding that needs no model download,
+so retrieval quality on these corpora can be evaluated offline.
+"""
+import os
+import random
+import re
+import zlib
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+WORDS = (
+    "pump valve flange gasket bolt torque pressure sensor relay housing bearing seal "
+    "shaft coupling motor voltage current frequency calibration maintenance inspection "
+    "procedure warning caution operator manual assembly bracket cable connector fuse"
+).split()
+
+
+def page_lines(page_number, lines_per_page, rnd, seed=0):
+    return [
+        " ".join(rnd.choice(WORDS) for _ in range(12)) + f" PN-{seed:04d}-{page_number:05d}-{line:03d}"
+        for line in range(lines_per_page)
+    ]
+
+
+def document_lines(pages, lines_per_page=40, seed=0, edited_pages=()):
+    """
+    The lines of each page of the PDF written by write_pdf with the same
+    arguments. The first line of each of `edited_pages` is revised, leaving
+    every other page as it was.
+    """
+    rnd = random.Random(seed)
+    lines = [page_lines(page_number, lines_per_page, rnd, seed) for page_number in range(pages)]
+    for page_number in edited_pages:
+        lines[page_number][0] += " (revised)"
+    return lines
+
+
+def write_pdf(path, pages, lines_per_page=40, seed=0, edited_pages=()):
+    """Write a text PDF with `pages` pages of pseudo-random technical prose."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in document_lines(pages, lines_per_page, seed, edited_pages):
+        text = " ".join(f"({line}) '" for line in lines)
+        stream = f"BT /F1 9 Tf 30 810 Td 11 TL {text} ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects))
+        )
+        page_ids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % i for i in page_ids), pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+    with open(path, "wb") as f:
+        f.write(out)
+    return path
+
+
+def write_corpus(directory, documents, pages, lines_per_page=40, seed=0):
+    """Write `documents` PDFs of `pages` pages each and return their paths."""
+    os.makedirs(directory, exist_ok=True)
+    return [
+        write_pdf(os.path.join(directory, f"synthetic_{i:04d}.pdf"), pages, lines_per_page, seed=seed + i)
+        for i in range(documents)
+    ]
+
+
+class HashingEmbedding(Embeddings):
+    """
+    Signed feature hashing of the set of lower-cased word tokens, L2-normalized.
+    Presence rather than counts, so that a rare token (a part number) weighs
+    as much as the common words repeated around it, and wide enough that hash
+    collisions rarely outweigh a matching token.
+    """
+
+    def __init__(self, size=16384, stop_words=()):
+        self.size = size
+        self.stop_words = set(stop_words)
+
+    def _embed(self, text):
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in set(re.findall(r"[\w-]+", text.lower())) - self.stop_words:
+            bucket = zlib.crc32(token.encode("utf-8"))
+            vector[bucket % self.size] += 1.0 if bucket & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)